@@ -0,0 +1,260 @@
+""" album_art.py
+
+Design:
+def find_folder_image
+    list folder
+    return the image whose name matches the earliest art pattern
+
+def read_embedded_image
+    import eyed3 the first time
+    return the front cover of the music file's tag, or its first picture
+
+def make_thumbnail
+    import Pillow the first time, return None if it is not installed
+    decode image at a reduced scale
+    shrink it to fit the thumbnail size
+    return it as PPM bytes
+
+class ThumbnailCache:
+    def __init__
+        initialize byte budget, entries, counters and disk folder
+
+    def get
+        if thumbnail is in memory, count a hit and mark it recently used
+        otherwise if it is in the disk folder, read it and keep it in memory
+        otherwise count a miss
+
+    def put
+        keep thumbnail in memory and write it to the disk folder
+        evict least recently used thumbnails until within the byte budget
+
+    def stats
+        return hits, misses, disk hits, evictions and memory used
+
+class AlbumArt:
+    def __init__
+        initialize thumbnail cache, size and chosen image of each folder
+
+    def source
+        use the folder image if there is one, remembered until the folder changes
+        otherwise use the image embedded in the music file
+
+    def thumbnail
+        find art source of music file
+        return cached thumbnail, or decode and cache it
+
+Finds the album art of a music file and turns it into a small thumbnail for
+the metadata area. Album folders ship images such as Folder.jpg and
+AlbumArt_*_Large.jpg, which are preferred since one image serves the whole
+album; music files without one fall back to the picture in their ID3 tag.
+Decoding is done on the background task threads with Pillow, which is
+optional: without it no art is shown. JPEG images are decoded at a reduced
+scale with Image.draft, so a large cover costs a fraction of a full decode.
+Thumbnails are kept as PPM bytes, which Tk's PhotoImage shows without decoding
+again, in a least recently used cache with a byte budget, and optionally in a
+folder on disk so they survive restarts. The cache key is the image file and
+its mtime and size, or a hash of the embedded picture, so flipping through the
+tracks of an album never decodes its art twice.
+"""
+
+from collections import OrderedDict
+from fnmatch import fnmatch
+from hashlib import sha1
+from io import BytesIO
+from os import path, listdir, makedirs, replace, stat
+from threading import Lock
+
+THUMBNAIL_SIZE = 120
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_THUMBNAIL_DIR = path.join(path.dirname(path.abspath(__file__)), "thumbnails")
+
+# Folder images in order of preference, matched without regard to case
+ART_PATTERNS = ("folder.jpg", "folder.png", "cover.jpg", "cover.png", "front.jpg", "front.png",
+                "albumart_*_large.jpg", "albumartsmall.jpg", "albumart_*_small.jpg", "*.jpg", "*.png")
+
+# The ID3 picture type of the front cover
+FRONT_COVER = 3
+
+def find_folder_image(folder_path):
+    """ Returns the path of the album art image in a folder, or None if it has none. """
+    try:
+        names = sorted(listdir(folder_path))
+    except OSError:
+        return None
+    for pattern in ART_PATTERNS:
+        for name in names:
+            if fnmatch(name.lower(), pattern):
+                return path.join(folder_path, name)
+    return None
+
+def read_embedded_image(music_path):
+    """ Returns the picture embedded in a music file's tag, or None if it has none. """
+    # eyed3 is slow to import, so it is only imported the first time a picture is read
+    import eyed3
+    audio_file = eyed3.load(music_path)
+    if audio_file is None or not audio_file.tag or not audio_file.tag.images:
+        return None
+
+    # Prefer the front cover over other pictures such as the back cover or the artist
+    images = list(audio_file.tag.images)
+    front = [image for image in images if image.picture_type == FRONT_COVER]
+    return (front or images)[0].image_data
+
+def make_thumbnail(image_data, size=THUMBNAIL_SIZE):
+    """ Returns an image shrunk to fit a square of size pixels as PPM bytes, or None if it cannot be decoded. """
+    # Pillow is optional, without it there is no album art
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        image = Image.open(BytesIO(image_data))
+        # JPEG images are decoded at the smallest scale that is still at least the thumbnail size
+        image.draft("RGB", (size, size))
+        image = image.convert("RGB")
+        image.thumbnail((size, size))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    width, height = image.size
+    return b"P6 %d %d 255\n" % (width, height) + image.tobytes()
+
+class ThumbnailCache:
+    """ A least recently used cache of thumbnails with a byte budget, optionally backed by a folder on disk. """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def disk_path(self, key):
+        """ Returns the file a thumbnail is kept in on disk. """
+        return path.join(self.disk_dir, sha1(repr(key).encode()).hexdigest() + ".ppm")
+
+    def get(self, key):
+        """ Returns a cached thumbnail, or None if it is not cached. """
+        with self.lock:
+            thumbnail = self.entries.get(key)
+            if thumbnail is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return thumbnail
+
+        # A thumbnail made in an earlier session is read from disk instead of decoding the image again
+        if self.disk_dir is not None:
+            try:
+                with open(self.disk_path(key), "rb") as thumbnail_file:
+                    thumbnail = thumbnail_file.read()
+            except OSError:
+                pass
+            else:
+                with self.lock:
+                    self.disk_hits += 1
+                self.put(key, thumbnail, write=False)
+                return thumbnail
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, thumbnail, write=True):
+        """ Caches a thumbnail, evicting the least recently used thumbnails to make room. """
+        # Write the thumbnail to a temporary file first, so a reader never sees half of it
+        if write and self.disk_dir is not None:
+            try:
+                makedirs(self.disk_dir, exist_ok=True)
+                disk_path = self.disk_path(key)
+                with open(disk_path + ".tmp", "wb") as thumbnail_file:
+                    thumbnail_file.write(thumbnail)
+                replace(disk_path + ".tmp", disk_path)
+            except OSError:
+                pass
+
+        # A thumbnail larger than the whole budget is never kept in memory
+        if len(thumbnail) > self.max_bytes:
+            return
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.used_bytes -= len(previous)
+            self.entries[key] = thumbnail
+            self.used_bytes += len(thumbnail)
+
+            # Evict the least recently used thumbnails until the cache is within its budget
+            while self.used_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.used_bytes -= len(evicted)
+                self.evictions += 1
+
+    def stats(self):
+        """ Returns the hit, miss and eviction counts and the memory used. """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "used_bytes": self.used_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+class AlbumArt:
+    """ Finds the album art of music files and keeps small thumbnails of it. """
+    def __init__(self, cache=None, size=THUMBNAIL_SIZE, decode=make_thumbnail):
+        self.cache = cache if cache is not None else ThumbnailCache()
+        self.size = size
+        self.decode = decode
+        self.folder_images = {}
+        self.lock = Lock()
+
+    def source(self, music_path):
+        """ Returns the cache key of a music file's album art and a function that reads it, or None if it has none. """
+        # The image chosen for a folder is remembered until the folder changes
+        folder_path = path.dirname(music_path)
+        folder_mtime = stat(folder_path).st_mtime
+        with self.lock:
+            remembered = self.folder_images.get(folder_path)
+        if remembered is not None and remembered[0] == folder_mtime:
+            image_path = remembered[1]
+        else:
+            image_path = find_folder_image(folder_path)
+            with self.lock:
+                self.folder_images[folder_path] = (folder_mtime, image_path)
+
+        # The folder image serves every music file in the folder
+        if image_path is not None:
+            image_stat = stat(image_path)
+            key = (image_path, image_stat.st_mtime, image_stat.st_size, self.size)
+
+            def read_image():
+                with open(image_path, "rb") as image_file:
+                    return image_file.read()
+            return key, read_image
+
+        # Otherwise tracks with the same embedded picture share its thumbnail
+        image_data = read_embedded_image(music_path)
+        if image_data is None:
+            return None
+        return (sha1(image_data).hexdigest(), self.size), lambda: image_data
+
+    def thumbnail(self, music_path):
+        """ Returns the album art of a music file as PPM bytes, or None if it has none. """
+        found = self.source(music_path)
+        if found is None:
+            return None
+        key, read_image = found
+
+        # Only decode the image if its thumbnail is not cached
+        thumbnail = self.cache.get(key)
+        if thumbnail is None:
+            thumbnail = self.decode(read_image(), self.size)
+            if thumbnail is not None:
+                self.cache.put(key, thumbnail)
+        return thumbnail
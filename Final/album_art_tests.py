@@ -0,0 +1,77 @@
+from os import path, mkdir
+from shutil import copyfile
+import pytest
+from album_art import AlbumArt, ThumbnailCache, find_folder_image, make_thumbnail
+
+ALBUM = path.join(path.dirname(__file__), "Music", "filk_firestorm")
+SAMPLE_MUSIC = path.join(ALBUM, "03 Walk Through The Night-Side.mp3")
+
+class CountingDecoder:
+    """ Stands in for the thumbnail maker and counts how often an image is decoded. """
+    def __init__(self):
+        self.decoded = 0
+
+    def __call__(self, image_data, size):
+        self.decoded += 1
+        return b"P6 1 1 255\n" + image_data[:3]
+
+def test_folder_image_preference(tmp_path):
+    """ Test that Folder.jpg is preferred over the other album art images. """
+    for name in ("AlbumArtSmall.jpg", "AlbumArt_{1}_Large.jpg", "Folder.jpg", "notes.txt"):
+        with open(str(tmp_path / name), "w"):
+            pass
+    assert find_folder_image(str(tmp_path)) == str(tmp_path / "Folder.jpg")
+
+    (tmp_path / "Folder.jpg").unlink()
+    assert find_folder_image(str(tmp_path)) == str(tmp_path / "AlbumArt_{1}_Large.jpg")
+
+def test_tracks_of_an_album_share_the_thumbnail(tmp_path):
+    """ Test that the folder image of an album is decoded once for all its tracks. """
+    album_path = str(tmp_path / "album")
+    mkdir(album_path)
+    copyfile(path.join(ALBUM, "Folder.jpg"), path.join(album_path, "Folder.jpg"))
+    decoder = CountingDecoder()
+    album_art = AlbumArt(decode=decoder)
+
+    thumbnails = {album_art.thumbnail(path.join(album_path, name)) for name in ("01.mp3", "02.mp3", "03.mp3")}
+    assert len(thumbnails) == 1
+    assert decoder.decoded == 1
+    assert album_art.cache.stats()["hits"] == 2
+
+def test_embedded_picture_is_used_without_folder_image(tmp_path):
+    """ Test that music files without a folder image share the thumbnail of their embedded picture. """
+    for name in ("01.mp3", "02.mp3"):
+        copyfile(SAMPLE_MUSIC, str(tmp_path / name))
+    decoder = CountingDecoder()
+    album_art = AlbumArt(decode=decoder)
+
+    assert album_art.thumbnail(str(tmp_path / "01.mp3")) == b"P6 1 1 255\n\xff\xd8\xff"
+    album_art.thumbnail(str(tmp_path / "02.mp3"))
+    assert decoder.decoded == 1
+
+def test_cache_budget_and_disk(tmp_path):
+    """ Test that the memory budget evicts the oldest thumbnails and the disk folder keeps them. """
+    cache = ThumbnailCache(max_bytes=10, disk_dir=str(tmp_path / "thumbnails"))
+    cache.put("a", b"123456")
+    cache.put("b", b"123456")
+    assert cache.stats()["entries"] == 1
+    assert cache.stats()["evictions"] == 1
+
+    restarted = ThumbnailCache(max_bytes=10, disk_dir=str(tmp_path / "thumbnails"))
+    assert restarted.get("a") == b"123456"
+    assert restarted.get("a") == b"123456"
+    assert restarted.get("c") is None
+    assert (restarted.stats()["disk_hits"], restarted.stats()["hits"], restarted.stats()["misses"]) == (1, 1, 1)
+
+def test_make_thumbnail():
+    """ Test that images are shrunk to fit the thumbnail size as PPM bytes. """
+    pytest.importorskip("PIL")
+    with open(path.join(ALBUM, "Folder.jpg"), "rb") as image_file:
+        thumbnail = make_thumbnail(image_file.read(), 64)
+
+    header = thumbnail.split(b"\n", 1)[0].split()
+    assert header[0] == b"P6"
+    assert max(int(header[1]), int(header[2])) == 64
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,336 @@
+""" audio_backend.py
+
+Design:
+class PygameBackend:
+    def init
+        import pygame the first time music is played
+        initialize mixer
+        add pygame's error to the errors a music file can fail to play with
+
+    def load / queue
+        load music file, from memory if it is given
+        queue music file behind the playing one
+
+    def play / pause / unpause / stop / seek
+        control the music stream
+
+    def elapsed
+        return seconds since the music stream started playing
+
+    def ended
+        count a queued music file that started, since the position of the stream starts again
+        count the last music file if the stream stopped without being paused or stopped
+        return number of music files that ended since the last call
+
+    def crossfader
+        return a crossfader on a reserved mixer channel
+
+class NullBackend:
+    def __init__
+        initialize simulated clock, track lengths and stream state
+
+    def load / queue / play / pause / unpause / stop / seek
+        update the simulated stream
+
+    def update
+        move on to the queued music file when the playing one has run its length
+
+    def elapsed / busy / ended
+        return the simulated stream state
+
+    def crossfader
+        return a crossfader that never fades
+
+class NullCrossfader:
+    stand in for the crossfader on backends that cannot mix two streams
+
+The player engine talks to audio through a small backend interface modelled on
+pygame.mixer.music: load, queue, play, pause, unpause, stop, seek, set_volume,
+elapsed, busy and ended, plus the clock the playback position is kept with and
+the errors a music file that cannot be played raises. PygameBackend plays
+through the sound card, importing pygame only when music is first played.
+pygame only reports the end of music as an event, which needs the display
+module and its event queue, so PygameBackend tells the end of music from the
+stream itself: the position of mixer.music starts again from 0 when a queued
+music file takes over, and the stream stops after the last one.
+NullBackend plays nothing and simulates the timing of the stream from a clock,
+moving on to the queued music file when the playing one has run its length.
+With a virtual clock, hours of playback can be simulated in milliseconds, so
+the engine can be driven at scale in tests and benchmarks, and run on machines
+without a sound card.
+"""
+
+from io import BytesIO
+from os import path
+from time import perf_counter
+
+DEFAULT_LENGTH = 180
+# How far the position of the stream must fall back to count as the queued music file starting
+HANDOFF_DROP_MS = 500
+
+class PygameBackend:
+    """ Plays music through pygame.mixer.music. """
+    def __init__(self):
+        self.pygame = None
+        self.mixer = None
+        self.volume = 1
+        self.streaming = False
+        self.queued = False
+        self.paused = False
+        self.last_position = 0
+        self.clock = perf_counter
+        self.errors = (OSError,)
+
+    def init(self):
+        """ Initializes the Pygame mixer the first time music is played. """
+        if self.mixer is None:
+            # Pygame is slow to import, so it is only imported the first time music is played
+            import pygame
+            from pygame import mixer
+            self.pygame = pygame
+            self.mixer = mixer
+            self.errors = (OSError, pygame.error)
+
+        if not self.mixer.get_init():
+            self.mixer.init()
+            self.mixer.music.set_volume(self.volume)
+
+    def initialized(self):
+        """ Returns whether the mixer is initialized. """
+        return self.mixer is not None and bool(self.mixer.get_init())
+
+    def load(self, music_path, music_data=None):
+        """ Loads a music file, from memory if its contents are given. """
+        # Loading stops the playing music, which is not an end of music
+        self.streaming = False
+        self.queued = False
+        if music_data is not None:
+            self.mixer.music.load(BytesIO(music_data), path.splitext(music_path)[1][1:])
+        else:
+            self.mixer.music.load(music_path)
+
+    def queue(self, music_path, music_data):
+        """ Queues a music file to start when the playing one ends. """
+        self.mixer.music.queue(BytesIO(music_data), path.splitext(music_path)[1][1:])
+        self.queued = True
+
+    def play(self, start=0):
+        """ Plays the loaded music file from start seconds. """
+        self.mixer.music.play(start=start)
+        self.streaming = True
+        self.paused = False
+        self.last_position = 0
+
+    def pause(self):
+        """ Pauses the music stream. """
+        self.mixer.music.pause()
+        self.paused = True
+
+    def unpause(self):
+        """ Resumes the music stream. """
+        self.mixer.music.unpause()
+        self.paused = False
+
+    def seek(self, position):
+        """ Moves the music stream to a position in seconds, the queued music file is kept. """
+        self.mixer.music.set_pos(position)
+
+    def stop(self):
+        """ Stops the music stream. """
+        # Stopping is not an end of music, it must not advance to the next music
+        self.streaming = False
+        self.queued = False
+        if self.initialized():
+            self.mixer.music.stop()
+
+    def set_volume(self, volume):
+        """ Sets the volume of the music stream. """
+        self.volume = volume
+        if self.initialized():
+            self.mixer.music.set_volume(volume)
+
+    def elapsed(self):
+        """ Returns the seconds since the music stream started playing. """
+        if not self.initialized():
+            return 0
+        return self.mixer.music.get_pos() / 1000
+
+    def busy(self):
+        """ Returns whether music is playing. """
+        return self.initialized() and self.mixer.music.get_busy()
+
+    def ended(self):
+        """ Returns the number of music files that ended since the last call. """
+        if not self.streaming or not self.initialized():
+            return 0
+        ended = 0
+
+        # The position is counted from the start of the music file playing, a queued one starts again from 0
+        position = self.mixer.music.get_pos()
+        if self.queued and 0 <= position < self.last_position - HANDOFF_DROP_MS:
+            self.queued = False
+            ended += 1
+        self.last_position = position
+
+        # The stream stops after the last music file, a paused stream is not busy either
+        if not self.paused and not self.mixer.music.get_busy():
+            ended += 1 + self.queued
+            self.streaming = False
+            self.queued = False
+        return ended
+
+    def crossfader(self, master, tasks, audio_cache):
+        """ Returns a crossfader that fades on a reserved mixer channel. """
+        from crossfade import Crossfader
+        return Crossfader(master, tasks, audio_cache)
+
+class NullBackend:
+    """ Simulates the timing of a music stream without playing anything. """
+    def __init__(self, clock=perf_counter, lengths=None, default_length=DEFAULT_LENGTH):
+        self.clock = clock
+        self.errors = (OSError,)
+        self.lengths = lengths if lengths is not None else {}
+        self.default_length = default_length
+        self.volume = 1
+        self.loaded = None
+        self.queued = None
+        self.playing = False
+        self.paused_at = None
+        self.play_started = 0
+        self.track_started = 0
+        self.ended_count = 0
+
+    def init(self):
+        """ Nothing needs to be initialized. """
+
+    def initialized(self):
+        """ Returns True, the null backend is always ready. """
+        return True
+
+    def length_of(self, music_path):
+        """ Returns the simulated length of a music file in seconds. """
+        return self.lengths.get(music_path, self.default_length)
+
+    def load(self, music_path, music_data=None):
+        """ Loads a music file, stopping the playing one. """
+        self.stop()
+        self.loaded = music_path
+
+    def queue(self, music_path, music_data):
+        """ Queues a music file to start when the playing one ends. """
+        self.queued = music_path
+
+    def play(self, start=0):
+        """ Plays the loaded music file from start seconds. """
+        now = self.clock()
+        self.playing = True
+        self.paused_at = None
+        self.play_started = now
+        self.track_started = now - start
+
+    def pause(self):
+        """ Pauses the simulated stream. """
+        if self.playing and self.paused_at is None:
+            self.update()
+            self.paused_at = self.clock()
+
+    def unpause(self):
+        """ Resumes the simulated stream, the time spent paused does not count. """
+        if self.paused_at is not None:
+            paused_for = self.clock() - self.paused_at
+            self.play_started += paused_for
+            self.track_started += paused_for
+            self.paused_at = None
+
+    def seek(self, position):
+        """ Moves the simulated stream to a position in seconds. """
+        self.track_started = self.now() - position
+
+    def stop(self):
+        """ Stops the simulated stream and forgets the queued music file. """
+        self.playing = False
+        self.paused_at = None
+        self.queued = None
+
+    def set_volume(self, volume):
+        """ Remembers the volume. """
+        self.volume = volume
+
+    def update(self):
+        """ Moves on to the queued music file once the playing one has run its length. """
+        if not self.playing or self.paused_at is not None:
+            return
+        now = self.clock()
+        while self.playing and now - self.track_started >= self.length_of(self.loaded):
+            self.ended_count += 1
+            self.track_started += self.length_of(self.loaded)
+            if self.queued is not None:
+                self.loaded, self.queued = self.queued, None
+            else:
+                self.playing = False
+
+    def position(self):
+        """ Returns the simulated position in the playing music file in seconds. """
+        self.update()
+        return self.now() - self.track_started
+
+    def elapsed(self):
+        """ Returns the seconds since the simulated stream started playing. """
+        self.update()
+        if not self.playing:
+            return 0
+        return self.now() - self.play_started
+
+    def now(self):
+        """ Returns the clock time, which stands still while the stream is paused. """
+        return self.clock() if self.paused_at is None else self.paused_at
+
+    def busy(self):
+        """ Returns whether the simulated stream is playing. """
+        self.update()
+        return self.playing and self.paused_at is None
+
+    def ended(self):
+        """ Returns the number of music files that ended since the last call. """
+        self.update()
+        ended, self.ended_count = self.ended_count, 0
+        return ended
+
+    def crossfader(self, master, tasks, audio_cache):
+        """ Returns a crossfader that never fades, the null backend has a single stream. """
+        return NullCrossfader(self)
+
+class NullCrossfader:
+    """ Stands in for the crossfader on backends that cannot mix two streams. """
+    def __init__(self, backend):
+        self.backend = backend
+        self.fading = False
+
+    @property
+    def overlap(self):
+        """ Returns 0, the music is always queued without a fade. """
+        return 0
+
+    @overlap.setter
+    def overlap(self, seconds):
+        """ Ignores the crossfade slider. """
+
+    def prepare(self, music_path):
+        """ Nothing is decoded ahead of time. """
+
+    def should_start(self, position, duration):
+        """ Returns False, there is never a fade to start. """
+        return False
+
+    def pause(self):
+        """ There is no fade to pause. """
+
+    def unpause(self):
+        """ There is no fade to resume. """
+
+    def set_volume(self, volume):
+        """ Applies the volume slider to the music stream. """
+        self.backend.set_volume(volume)
+
+    def cancel(self):
+        """ There is no fade to cancel. """
@@ -0,0 +1,63 @@
+from time import perf_counter, sleep
+import pytest
+from audio_backend import NullBackend, PygameBackend
+from headless_loop import HeadlessLoop
+from library_benchmark import SILENT_FRAME
+
+def test_queued_music_starts_when_playing_music_ends():
+    """ Test that the null backend moves on to the queued music file and reports each end. """
+    loop = HeadlessLoop(virtual=True)
+    backend = NullBackend(clock=loop.time, lengths={"first.mp3": 10, "second.mp3": 20})
+    backend.load("first.mp3")
+    backend.play()
+    backend.queue("second.mp3", b"")
+    loop.advance(15)
+
+    assert backend.ended() == 1
+    assert backend.loaded == "second.mp3"
+    assert backend.position() == pytest.approx(5)
+
+    loop.advance(20)
+    assert backend.ended() == 1
+    assert not backend.busy()
+
+def test_play_from_start_and_stop():
+    """ Test that playing from a position shortens the music and stopping reports no end. """
+    loop = HeadlessLoop(virtual=True)
+    backend = NullBackend(clock=loop.time, default_length=10)
+    backend.load("first.mp3")
+    backend.play(start=8)
+    loop.advance(1)
+    backend.stop()
+    loop.advance(10)
+
+    assert backend.ended() == 0
+    backend.play(start=8)
+    loop.advance(2)
+    assert backend.ended() == 1
+
+def test_pygame_reports_each_end_without_the_display(monkeypatch):
+    """ Test that the pygame backend reports a queued music file starting and the last one ending, without the display module. """
+    pygame = pytest.importorskip("pygame")
+    monkeypatch.setenv("SDL_AUDIODRIVER", "dummy")
+    backend = PygameBackend()
+    backend.init()
+    music_data = SILENT_FRAME * 40
+    backend.load("first.mp3", music_data)
+    backend.play()
+    backend.queue("second.mp3", music_data)
+
+    ends = []
+    started = perf_counter()
+    while backend.busy() or not ends or sum(ends) < 2:
+        ends.append(backend.ended())
+        assert perf_counter() - started < 5
+        sleep(0.05)
+
+    # The queued music file starting and the last one ending are reported on their own
+    assert [end for end in ends if end] == [1, 1]
+    assert not pygame.display.get_init()
+    backend.mixer.quit()
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
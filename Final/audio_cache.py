@@ -0,0 +1,119 @@
+""" audio_cache.py
+
+Design:
+class AudioCache:
+    def __init__
+        initialize byte budget, entries and counters
+
+    def get
+        if music file is cached, count a hit and mark it recently used
+        otherwise count a miss
+
+    def load
+        return cached music file, or read it and cache it
+
+    def read
+        read music file from disk and cache it, without counting a hit or miss
+
+    def put
+        cache music file
+        evict least recently used music files until within the byte budget
+
+    def invalidate
+        forget a music file that changed on disk
+
+    def stats
+        return hits, misses, evictions, bytes read from disk and memory used
+
+A bounded, least recently used cache of music files read into memory. Skipping
+back or replaying a track within a session loads it from memory with
+mixer.music.load(BytesIO(...)) instead of going back to disk. mixer.music
+decodes as it plays, so the files are cached as they are on disk, which holds
+several times more tracks in the same budget than decoded samples would. The
+cache is filled from the background task threads, so it is guarded by a lock.
+A caller that already looked a file up with get fills the cache with read, so
+one miss is counted once.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+class AudioCache:
+    """ A least recently used cache of music files with a byte budget. """
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes_read = 0
+        self.lock = Lock()
+
+    def get(self, music_path):
+        """ Returns the cached contents of a music file, or None if it is not cached. """
+        with self.lock:
+            music_data = self.entries.get(music_path)
+            if music_data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(music_path)
+            return music_data
+
+    def load(self, music_path):
+        """ Returns the contents of a music file, reading and caching it if it is not cached. """
+        music_data = self.get(music_path)
+        if music_data is None:
+            music_data = self.read(music_path)
+        return music_data
+
+    def read(self, music_path):
+        """ Reads a music file from disk and caches it, for a caller that already counted the miss with get. """
+        with open(music_path, "rb") as music_file:
+            music_data = music_file.read()
+        with self.lock:
+            self.bytes_read += len(music_data)
+        self.put(music_path, music_data)
+        return music_data
+
+    def put(self, music_path, music_data):
+        """ Caches the contents of a music file, evicting the least recently used files to make room. """
+        # A file larger than the whole budget is never cached
+        if len(music_data) > self.max_bytes:
+            return
+
+        with self.lock:
+            previous = self.entries.pop(music_path, None)
+            if previous is not None:
+                self.used_bytes -= len(previous)
+            self.entries[music_path] = music_data
+            self.used_bytes += len(music_data)
+
+            # Evict the least recently used files until the cache is within its budget
+            while self.used_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.used_bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, music_path):
+        """ Forgets a music file, for example because it changed on disk. """
+        with self.lock:
+            music_data = self.entries.pop(music_path, None)
+            if music_data is not None:
+                self.used_bytes -= len(music_data)
+
+    def stats(self):
+        """ Returns the hit, miss and eviction counts and the memory used. """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes_read": self.bytes_read,
+                "entries": len(self.entries),
+                "used_bytes": self.used_bytes,
+                "max_bytes": self.max_bytes,
+            }
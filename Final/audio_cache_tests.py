@@ -0,0 +1,52 @@
+from os import path
+import pytest
+from audio_cache import AudioCache
+
+MUSIC_PATH = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+
+def test_second_load_comes_from_memory(monkeypatch):
+    """ Test that a music file is only read from disk once. """
+    cache = AudioCache()
+    music_data = cache.load(MUSIC_PATH)
+
+    def fail_open(*args):
+        raise AssertionError("music file was read again")
+    monkeypatch.setattr("builtins.open", fail_open)
+
+    assert cache.load(MUSIC_PATH) is music_data
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_least_recently_used_is_evicted():
+    """ Test that the byte budget evicts the least recently used music file. """
+    cache = AudioCache(max_bytes=10)
+    cache.put("a.mp3", b"aaaa")
+    cache.put("b.mp3", b"bbbb")
+    cache.get("a.mp3")
+    cache.put("c.mp3", b"cccc")
+
+    assert cache.get("b.mp3") is None
+    assert cache.get("a.mp3") == b"aaaa"
+    assert cache.stats()["used_bytes"] == 8
+    assert cache.stats()["evictions"] == 1
+
+def test_oversized_file_is_not_cached():
+    """ Test that a file larger than the budget does not flush the cache. """
+    cache = AudioCache(max_bytes=10)
+    cache.put("a.mp3", b"aaaa")
+    cache.put("big.mp3", b"x" * 11)
+
+    assert cache.get("a.mp3") == b"aaaa"
+    assert cache.get("big.mp3") is None
+
+def test_invalidate_frees_memory():
+    """ Test that an invalidated music file is forgotten. """
+    cache = AudioCache()
+    cache.put("a.mp3", b"aaaa")
+    cache.invalidate("a.mp3")
+
+    assert cache.get("a.mp3") is None
+    assert cache.stats()["used_bytes"] == 0
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,113 @@
+""" background_tasks.py
+
+Design:
+class BackgroundTasks:
+    def __init__
+        create thread pool
+        create result queue
+
+    def submit
+        cancel the previous task with the same key
+        run function on thread pool
+        put result on result queue when done
+        start polling the result queue
+
+    def cancel
+        cancel the task with the given key
+
+    def dispatch
+        take finished tasks off the result queue
+        drop results that are no longer current
+        hand current results to their callbacks
+        poll again while tasks are outstanding
+
+    def wait / wait_for
+        block until every outstanding task has been dispatched, or until a condition holds
+
+    def shutdown
+        cancel outstanding tasks
+        stop thread pool
+
+Disk work (tag reads, directory listings, playlist loads) runs on a thread pool
+so the Tk event loop never blocks on slow storage. Tk widgets may only be used
+from the main thread, so the results are put on a queue that the main thread
+drains through master.after while tasks are outstanding.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+
+class BackgroundTasks:
+    """ Runs functions on a thread pool and hands their results back to the Tk event loop. """
+    def __init__(self, master, max_workers=4, poll_interval=15):
+        self.master = master
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="music-player")
+        self.results = Queue()
+        self.current = {}
+        self.polling = False
+
+    def submit(self, key, function, *args, on_done=None, on_error=None):
+        """ Runs a function in the background, replacing any outstanding task with the same key. """
+        # Cancel the previous task with the same key, its result is no longer wanted
+        self.cancel(key)
+
+        # Run the function on the thread pool and queue the result when it is done
+        future = self.executor.submit(function, *args)
+        self.current[key] = future
+        future.add_done_callback(lambda done: self.results.put((key, done, on_done, on_error)))
+
+        # Start polling the result queue
+        if not self.polling:
+            self.polling = True
+            self.master.after(self.poll_interval, self.dispatch)
+        return future
+
+    def cancel(self, key):
+        """ Cancels the outstanding task with the given key. """
+        future = self.current.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def dispatch(self):
+        """ Hands the finished tasks to their callbacks on the Tk event loop. """
+        try:
+            while True:
+                self.handle(*self.results.get_nowait())
+        except Empty:
+            pass
+        finally:
+            # Poll again while tasks are outstanding
+            if self.current:
+                self.master.after(self.poll_interval, self.dispatch)
+            else:
+                self.polling = False
+
+    def handle(self, key, future, on_done, on_error):
+        """ Calls the callback of a finished task, unless it is no longer current. """
+        if self.current.get(key) is not future:
+            return
+        del self.current[key]
+
+        error = future.exception()
+        if error is not None:
+            if on_error is None:
+                raise error
+            on_error(error)
+        elif on_done is not None:
+            on_done(future.result())
+
+    def wait(self, timeout=None):
+        """ Blocks until every outstanding task has been handed to its callback. """
+        self.wait_for(lambda: not self.current, timeout)
+
+    def wait_for(self, condition, timeout=None):
+        """ Hands finished tasks to their callbacks until condition returns true. """
+        while not condition():
+            self.handle(*self.results.get(timeout=timeout))
+
+    def shutdown(self):
+        """ Cancels the outstanding tasks and stops the thread pool. """
+        for key in list(self.current):
+            self.cancel(key)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,56 @@
+from threading import Event
+import pytest
+from background_tasks import BackgroundTasks
+
+class Master:
+    """ Stands in for the Tk root, recording the scheduled callbacks. """
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+
+def test_result_is_handed_to_callback():
+    """ Test that a finished task calls its callback. """
+    tasks = BackgroundTasks(Master())
+    results = []
+    tasks.submit("job", sum, [1, 2, 3], on_done=results.append)
+    tasks.wait()
+
+    assert results == [6]
+
+def test_replaced_task_is_dropped():
+    """ Test that a task replaced by a newer one with the same key never calls back. """
+    tasks = BackgroundTasks(Master(), max_workers=2)
+    release = Event()
+    results = []
+    tasks.submit("job", lambda: release.wait() and "old", on_done=results.append)
+    tasks.submit("job", lambda: "new", on_done=results.append)
+    release.set()
+    tasks.wait()
+
+    assert results == ["new"]
+
+def test_error_is_handed_to_error_callback():
+    """ Test that an exception in a task reaches its error callback on the main thread. """
+    tasks = BackgroundTasks(Master())
+    errors = []
+    tasks.submit("job", open, "/nonexistent/playlist.txt", on_error=errors.append)
+    tasks.wait()
+
+    assert isinstance(errors[0], FileNotFoundError)
+
+def test_dispatch_polls_only_while_tasks_are_outstanding():
+    """ Test that the result queue is only polled while tasks are outstanding. """
+    master = Master()
+    tasks = BackgroundTasks(master)
+    results = []
+    tasks.submit("job", sum, [1], on_done=results.append)
+    while master.scheduled:
+        master.scheduled.pop()()
+
+    assert results == [1]
+    assert master.scheduled == []
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
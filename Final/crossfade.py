@@ -0,0 +1,190 @@
+""" crossfade.py
+
+Design:
+def decode_head
+    take music file from audio cache, skipping its ID3 tag
+    decode a prefix of its audio, doubling the prefix until it holds the first seconds
+    keep only the first seconds
+
+class Crossfader:
+    def __init__
+        reserve a mixer channel
+        initialize overlap and fade state
+
+    def prepare
+        decode head of upcoming music in the background
+
+    def should_start
+        return whether the playing music is close enough to its end
+
+    def start
+        play head of upcoming music on the channel
+        ramp volumes
+
+    def ramp
+        fade playing music out and upcoming music in
+        when the overlap is over, hand off to the music stream
+
+    def pause / unpause
+        pause or resume the fade
+
+    def set_volume
+        apply the volume slider to both streams
+
+    def cancel
+        stop the channel and forget the head
+
+Crossfading needs two streams, but mixer.music can only play one file at a
+time. The upcoming music's head is decoded ahead of time on the background
+tasks and played on a reserved mixer.Channel while mixer.music fades out. Only
+the overlap plus a short hand off is kept decoded, so the buffer stays bounded.
+Once the overlap is over the upcoming music is loaded into mixer.music at the
+same position and the channel fades out underneath it. The head is decoded
+from the audio cache, so the hand off does not read the file from disk again,
+and only a prefix of the audio a little longer than the head is decoded, since
+MP3 frames decode on their own. pygame is imported by the functions that use
+it, so building a player does not load it before music is played.
+"""
+
+from io import BytesIO
+from time import perf_counter
+
+from mp3_frames import payload_bounds
+
+# Extra seconds of the head kept so the channel can cover the hand off to mixer.music
+HANDOFF_SECONDS = 0.5
+# The first prefix decoded holds this many bytes per second of head, enough for 320 kbps
+PREFIX_BYTES_PER_SECOND = 40_000
+RAMP_INTERVAL = 50
+HANDOFF_FADE_MS = 150
+
+def decode_head(audio_cache, music_path, seconds):
+    """ Decodes the first seconds of a music file into a sound, without decoding the rest of it. """
+    from pygame import mixer
+    music_data = audio_cache.load(music_path)
+    frequency, size, channels = mixer.get_init()
+    head_bytes = int(seconds * frequency) * abs(size) // 8 * channels
+
+    # The ID3 tag can hold album art larger than the head, so the prefix starts at the audio
+    start, end = payload_bounds(music_data, len(music_data))
+    prefix = int(seconds * PREFIX_BYTES_PER_SECOND)
+    while True:
+        sound = mixer.Sound(file=BytesIO(music_data[start:min(start + prefix, end)]))
+        # A lower bitrate than expected leaves the prefix short of the head, so it is doubled
+        if sound.get_length() >= seconds or start + prefix >= end:
+            return mixer.Sound(buffer=sound.get_raw()[:head_bytes])
+        prefix *= 2
+
+class Crossfader:
+    """ Fades from the playing music into the upcoming music on a separate mixer channel. """
+    def __init__(self, master, tasks, audio_cache):
+        self.master = master
+        self.tasks = tasks
+        self.audio_cache = audio_cache
+        self.overlap = 0
+        self.volume = 1
+        self.channel = None
+        self.head = None
+        self.fading = False
+        self.paused = False
+        self.elapsed = 0
+        self.fade_overlap = 0
+        self.last_ramp = None
+        self.ramp_job = None
+        self.on_handoff = None
+
+    def prepare(self, music_path):
+        """ Decodes the head of the upcoming music in the background. """
+        self.head = None
+        if not self.overlap:
+            return
+
+        def store_head(head):
+            self.head = (music_path, head)
+
+        self.tasks.submit("crossfade", decode_head, self.audio_cache, music_path, self.overlap + HANDOFF_SECONDS,
+                          on_done=store_head)
+
+    def should_start(self, position, duration):
+        """ Returns whether the playing music is close enough to its end to start fading. """
+        return (self.head is not None and not self.fading and duration is not None
+                and duration - position <= self.overlap)
+
+    def start(self, on_handoff):
+        """ Starts the fade, on_handoff is called with the upcoming music's path and position. """
+        from pygame import mixer
+        # The channel is reserved so sound effects never take it
+        if self.channel is None:
+            mixer.set_reserved(1)
+            self.channel = mixer.Channel(0)
+
+        self.fading = True
+        self.paused = False
+        self.elapsed = 0
+        self.fade_overlap = self.overlap
+        self.on_handoff = on_handoff
+        self.channel.set_volume(0)
+        self.channel.play(self.head[1])
+        self.last_ramp = perf_counter()
+        self.ramp_job = self.master.after(RAMP_INTERVAL, self.ramp)
+
+    def ramp(self):
+        """ Moves the volumes one step along the fade. """
+        from pygame import mixer
+        now = perf_counter()
+        self.elapsed += now - self.last_ramp
+        self.last_ramp = now
+
+        # Fade the playing music out and the upcoming music in
+        progress = min(self.elapsed / self.fade_overlap, 1)
+        mixer.music.set_volume(self.volume * (1 - progress))
+        self.channel.set_volume(self.volume * progress)
+
+        if progress < 1:
+            self.ramp_job = self.master.after(RAMP_INTERVAL, self.ramp)
+            return
+
+        # The overlap is over, hand the upcoming music off to mixer.music at the same position
+        music_path, _ = self.head
+        self.fading = False
+        self.head = None
+        mixer.music.set_volume(self.volume)
+        self.on_handoff(music_path, self.elapsed)
+        self.channel.fadeout(HANDOFF_FADE_MS)
+
+    def pause(self):
+        """ Pauses the fade along with the music. """
+        if self.fading:
+            self.paused = True
+            self.channel.pause()
+            self.master.after_cancel(self.ramp_job)
+
+    def unpause(self):
+        """ Resumes a paused fade. """
+        if self.fading and self.paused:
+            self.paused = False
+            self.channel.unpause()
+            self.last_ramp = perf_counter()
+            self.ramp_job = self.master.after(RAMP_INTERVAL, self.ramp)
+
+    def set_volume(self, volume):
+        """ Applies the volume slider to both streams. """
+        from pygame import mixer
+        self.volume = volume
+        if self.fading:
+            progress = min(self.elapsed / self.fade_overlap, 1)
+            mixer.music.set_volume(volume * (1 - progress))
+            self.channel.set_volume(volume * progress)
+        elif mixer.get_init():
+            mixer.music.set_volume(volume)
+
+    def cancel(self):
+        """ Stops any fade and forgets the decoded head. """
+        self.tasks.cancel("crossfade")
+        self.head = None
+        if self.fading:
+            self.fading = False
+            self.master.after_cancel(self.ramp_job)
+            from pygame import mixer
+            self.channel.stop()
+            mixer.music.set_volume(self.volume)
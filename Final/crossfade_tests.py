@@ -0,0 +1,75 @@
+from os import environ, path
+from time import sleep
+import pytest
+from pygame import mixer
+from audio_cache import AudioCache
+from background_tasks import BackgroundTasks
+from crossfade import Crossfader, HANDOFF_SECONDS, decode_head
+
+MUSIC_PATH = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+
+class Master:
+    """ Stands in for the Tk root, recording the scheduled callbacks. """
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+        return callback
+
+    def after_cancel(self, job):
+        self.scheduled.remove(job)
+
+@pytest.fixture(autouse=True)
+def sound():
+    """ Initializes the mixer, without a sound card if there is none. """
+    environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    mixer.init()
+    yield
+    mixer.quit()
+
+def test_decode_head_is_bounded(monkeypatch):
+    """ Test that only the first seconds of the music are kept, and only a prefix a little longer is decoded. """
+    decoded = []
+    sound = mixer.Sound
+    monkeypatch.setattr(mixer, "Sound", lambda **source: decoded.append(len(source["file"].getbuffer())) or sound(**source)
+                        if "file" in source else sound(**source))
+    head = decode_head(AudioCache(), MUSIC_PATH, 2)
+
+    assert head.get_length() == pytest.approx(2, abs=0.01)
+    assert decoded and max(decoded) < path.getsize(MUSIC_PATH) // 10
+
+def test_crossfade_hands_off_to_music_stream():
+    """ Test that the fade ramps the volumes and hands off at the end of the overlap. """
+    master = Master()
+    crossfader = Crossfader(master, BackgroundTasks(master), AudioCache())
+    crossfader.overlap = 0.2
+    crossfader.prepare(MUSIC_PATH)
+    crossfader.tasks.wait()
+
+    assert not crossfader.should_start(100, 113)
+    assert crossfader.should_start(112.9, 113)
+
+    handoffs = []
+    crossfader.start(lambda *handoff: handoffs.append(handoff))
+    sleep(0.1)
+    crossfader.ramp_job()
+    assert 0 < crossfader.channel.get_volume() < 1
+
+    sleep(0.15)
+    crossfader.ramp_job()
+    assert handoffs[0][0] == MUSIC_PATH
+    assert handoffs[0][1] == pytest.approx(0.25, abs=0.1)
+    assert crossfader.head is None
+
+def test_overlap_of_zero_turns_crossfade_off():
+    """ Test that nothing is decoded when crossfade is off. """
+    master = Master()
+    crossfader = Crossfader(master, BackgroundTasks(master), AudioCache())
+    crossfader.prepare(MUSIC_PATH)
+
+    assert crossfader.tasks.current == {}
+    assert not crossfader.should_start(112.9, 113)
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
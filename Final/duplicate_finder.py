@@ -0,0 +1,212 @@
+""" duplicate_finder.py
+
+Design:
+def read_bounds
+    map file into memory
+    return where its payload starts and ends, the whole file if it is not an MP3
+
+def hash_payload
+    map file into memory
+    hash the first and last chunk of its payload, or all of it in chunks
+
+def find_duplicates
+    find where the payload of every file starts and ends on a process pool
+    group files by payload size, drop sizes only one file has
+    group the rest by a hash of the first and last chunk of their payload
+    group the larger ones again by a hash of their whole payload
+    return groups of two or more files with the same payload
+
+def format_report
+    return the groups of duplicates and the space they waste as text
+
+def duplicate_entries
+    return indexes of playlist entries that are a copy of an earlier entry under another path
+
+def collapse_playlist
+    remove the entries that are copies of an earlier entry from a playlist file
+
+Finds music files that hold the same audio under different names. Two copies
+of a track often differ only in their tags, so files are compared by their
+audio payload with the ID3 and APE tags left out. Most files are ruled out
+cheaply: only files whose payloads have the same size can be the same, and of
+those only files whose first and last chunks hash the same have their whole
+payload hashed. Files are read through mmap, so the hash reads the page cache
+directly, and the reads and hashes are spread over a ProcessPoolExecutor so
+the scan runs at the speed of the disk rather than of one core. Copies that
+were added to a playlist under different paths can then be collapsed into the
+first of them. Playlists are rewritten in one step, so collapse them while the
+player is closed.
+    python duplicate_finder.py [music folder] [--workers N] [--all] [--collapse]
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import blake2b
+from mmap import mmap, ACCESS_READ
+from multiprocessing import get_context
+from os import path, cpu_count, stat, walk
+from time import perf_counter
+
+from mp3_frames import payload_bounds
+from playlist_store import PlaylistStore
+
+# madvise is only there on Unix
+try:
+    from mmap import MADV_SEQUENTIAL
+except ImportError:
+    MADV_SEQUENTIAL = None
+
+HEAD_BYTES = 64 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+DuplicateGroup = namedtuple("DuplicateGroup", "size paths")
+DuplicateReport = namedtuple("DuplicateReport", "groups files hashed_bytes seconds")
+
+def read_bounds(file_path):
+    """ Returns a file's path and where its payload starts and ends, or None for both if it cannot be read. """
+    try:
+        size = stat(file_path).st_size
+        # Files other than MP3s, such as album art, are compared whole, and an empty file cannot be mapped
+        if not size or not file_path.lower().endswith(".mp3"):
+            return file_path, 0, size
+        with open(file_path, "rb") as music_file, mmap(music_file.fileno(), 0, access=ACCESS_READ) as music_map:
+            return (file_path, *payload_bounds(music_map, size))
+    except OSError:
+        return file_path, None, None
+
+def hash_payload(job):
+    """ Returns a file's path and the hash of the first and last head bytes of its payload, or of all of it if head is None. """
+    file_path, start, end, head = job
+    digest = blake2b(digest_size=16)
+    if end > start:
+        try:
+            with open(file_path, "rb") as music_file, mmap(music_file.fileno(), 0, access=ACCESS_READ) as music_map:
+                # A whole payload is read front to back, so the kernel can read ahead
+                if head is None and MADV_SEQUENTIAL is not None:
+                    music_map.madvise(MADV_SEQUENTIAL)
+                view = memoryview(music_map)
+                try:
+                    if head is None or end - start <= 2 * head:
+                        for offset in range(start, end, CHUNK_BYTES):
+                            digest.update(view[offset:min(offset + CHUNK_BYTES, end)])
+                    else:
+                        digest.update(view[start:start + head])
+                        digest.update(view[end - head:end])
+                finally:
+                    view.release()
+        except OSError:
+            return file_path, None
+    return file_path, digest.hexdigest()
+
+def find_duplicates(file_paths, max_workers=None):
+    """ Groups files with the same audio payload on a process pool, returns a DuplicateReport. """
+    started = perf_counter()
+    file_paths = list(file_paths)
+    groups = []
+    hashed_bytes = 0
+    if file_paths:
+        workers = min(max_workers or cpu_count() or 1, len(file_paths))
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+            # Only files whose payloads have the same size can be the same
+            by_size = {}
+            for file_path, start, end in executor.map(read_bounds, file_paths, chunksize=chunk_size(len(file_paths), workers)):
+                if start is not None:
+                    by_size.setdefault(end - start, []).append((file_path, start, end))
+            candidates = [spans for spans in by_size.values() if len(spans) > 1]
+
+            # Hash the first and last chunk, which is the whole payload of a small file
+            candidates, hashed = group_by_hash(executor, workers, candidates, HEAD_BYTES)
+            hashed_bytes += hashed
+            groups = [spans for spans in candidates if spans[0][2] - spans[0][1] <= 2 * HEAD_BYTES]
+
+            # Larger files that still look the same have their whole payload hashed
+            candidates, hashed = group_by_hash(executor, workers, [
+                spans for spans in candidates if spans[0][2] - spans[0][1] > 2 * HEAD_BYTES], None)
+            hashed_bytes += hashed
+            groups += candidates
+
+    # The groups that waste the most space come first
+    groups = [DuplicateGroup(spans[0][2] - spans[0][1], sorted(file_path for file_path, _, _ in spans)) for spans in groups]
+    groups.sort(key=lambda group: (-group.size * (len(group.paths) - 1), group.paths))
+    return DuplicateReport(groups, len(file_paths), hashed_bytes, perf_counter() - started)
+
+def group_by_hash(executor, workers, candidates, head):
+    """ Splits groups of (path, start, end) spans by the hash of their payloads, returns the groups left and the bytes hashed. """
+    jobs = [(file_path, start, end, head) for spans in candidates for file_path, start, end in spans]
+    if not jobs:
+        return [], 0
+    spans = {job[0]: job[1:3] for job in jobs}
+    hashed = sum(end - start if head is None else min(end - start, 2 * head) for _, start, end, _ in jobs)
+
+    by_hash = {}
+    for file_path, digest in executor.map(hash_payload, jobs, chunksize=chunk_size(len(jobs), workers)):
+        if digest is not None:
+            start, end = spans[file_path]
+            by_hash.setdefault((end - start, digest), []).append((file_path, start, end))
+    return [group for group in by_hash.values() if len(group) > 1], hashed
+
+def chunk_size(count, workers):
+    """ Returns how many jobs to hand a worker at once, so there are about sixteen batches per worker. """
+    return max(1, count // (workers * 16))
+
+def format_report(report):
+    """ Returns the groups of duplicates and the space they waste as text. """
+    copies = sum(len(group.paths) - 1 for group in report.groups)
+    wasted = sum(group.size * (len(group.paths) - 1) for group in report.groups)
+    speed = report.hashed_bytes / report.seconds / 1e6 if report.seconds > 0 else 0
+    lines = [f"Checked {report.files} files in {report.seconds:.1f} s, hashed {report.hashed_bytes / 1e6:.1f} MB ({speed:.0f} MB/s)",
+             f"Found {len(report.groups)} groups of duplicates, {copies} extra copies wasting {wasted / 1e6:.1f} MB"]
+    for group in report.groups:
+        lines.append(f"{group.size} bytes in {len(group.paths)} files:")
+        lines += [f"    {file_path}" for file_path in group.paths]
+    return "\n".join(lines)
+
+def duplicate_entries(entries, groups):
+    """ Yields the indexes of playlist entries that are a copy of an earlier entry under another path. """
+    # Every copy is known by the first path of its group, a path repeated on purpose is kept
+    original = {file_path: group.paths[0] for group in groups for file_path in group.paths}
+    first_path = {}
+    for index, music_path in enumerate(entries):
+        music_path = path.normpath(music_path)
+        key = original.get(music_path, music_path)
+        if first_path.setdefault(key, music_path) != music_path:
+            yield index
+
+def collapse_playlist(playlist_path, groups):
+    """ Removes the entries of a playlist file that are a copy of an earlier entry, returns how many were removed. """
+    store = PlaylistStore(playlist_path).load()
+    try:
+        removed = list(duplicate_entries(store.entries, groups))
+        if removed:
+            # The playlist is rewritten once with every copy removed, instead of journaling each removal
+            for index in reversed(removed):
+                store.entries.pop(index)
+            store.compact()
+        return len(removed)
+    finally:
+        store.close()
+
+def library_files(music_dir, every_file=False):
+    """ Yields the music files under a folder, or every file if every_file is set. """
+    for folder_path, _, file_names in walk(music_dir):
+        for file_name in file_names:
+            if every_file or file_name.lower().endswith(".mp3"):
+                yield path.join(folder_path, file_name)
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from playlist_formats import is_playlist_file
+    parser = ArgumentParser(description="Find music files that hold the same audio under different names.")
+    parser.add_argument("music_dir", nargs="?", default="Music")
+    parser.add_argument("--workers", type=int, default=None, help="processes reading and hashing files, one per core by default")
+    parser.add_argument("--all", action="store_true", help="compare every file, such as album art, not only music files")
+    parser.add_argument("--collapse", action="store_true", help="remove copies of an earlier entry from the playlists")
+    arguments = parser.parse_args()
+
+    music_dir = path.normpath(path.abspath(arguments.music_dir))
+    report = find_duplicates(library_files(music_dir, arguments.all), arguments.workers)
+    print(format_report(report))
+    if arguments.collapse:
+        for playlist_name in sorted(name for name in next(walk(music_dir))[2] if is_playlist_file(name)):
+            removed = collapse_playlist(path.join(music_dir, playlist_name), report.groups)
+            print(f"Removed {removed} copies from {playlist_name}")
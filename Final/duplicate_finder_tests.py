@@ -0,0 +1,59 @@
+from os import path, mkdir
+import pytest
+from duplicate_finder import collapse_playlist, duplicate_entries, find_duplicates, library_files
+from library_benchmark import SILENT_FRAME, id3_tag
+
+MUSIC_DIR = path.join(path.dirname(path.abspath(__file__)), "Music")
+
+def write_music(folder_path, name, audio, tag=b"", trailer=b""):
+    """ Writes a music file with tags around its audio and returns its path. """
+    music_path = path.join(folder_path, name)
+    with open(music_path, "wb") as music_file:
+        music_file.write(tag + audio + trailer)
+    return music_path
+
+def test_copies_with_different_tags_are_grouped(tmp_path):
+    """ Test that copies differing only in tags and names are found, and audio of the same size that differs is not. """
+    folder_path = str(tmp_path)
+    audio = SILENT_FRAME * 400
+    different = audio[:-1] + b"\x01"
+    copies = [write_music(folder_path, "01 Song.mp3", audio, id3_tag("Song", "Artist", "Album")),
+              write_music(folder_path, "Song (copy).mp3", audio, trailer=b"TAG" + bytes(125)),
+              write_music(folder_path, "Song.mp3", audio)]
+    write_music(folder_path, "Other.mp3", different)
+    write_music(folder_path, "Short.mp3", SILENT_FRAME)
+
+    report = find_duplicates(library_files(folder_path), max_workers=2)
+
+    assert report.files == 5
+    assert [group.paths for group in report.groups] == [sorted(copies)]
+    assert report.groups[0].size == len(audio)
+
+def test_shipped_album_art_is_found_twice():
+    """ Test that the album art both albums ship under two names is found when every file is compared. """
+    report = find_duplicates(library_files(MUSIC_DIR, every_file=True), max_workers=2)
+    large = [sorted("Large" if "Large" in name else name for name in map(path.basename, group.paths))
+             for group in report.groups if any(name.endswith("Folder.jpg") for name in group.paths)]
+
+    assert large == [["Folder.jpg", "Large"], ["Folder.jpg", "Large"]]
+    assert not any(file_path.endswith(".mp3") for group in report.groups for file_path in group.paths)
+
+def test_collapse_keeps_the_first_copy(tmp_path):
+    """ Test that entries copying an earlier entry under another path are removed, and a path repeated on purpose is kept. """
+    folder_path = str(tmp_path / "album")
+    mkdir(folder_path)
+    first = write_music(folder_path, "01 Song.mp3", SILENT_FRAME * 10, id3_tag("Song", "Artist", "Album"))
+    copy = write_music(folder_path, "Song.mp3", SILENT_FRAME * 10)
+    other = write_music(folder_path, "02 Other.mp3", SILENT_FRAME * 11)
+    playlist_path = str(tmp_path / "Mix.txt")
+    with open(playlist_path, "w") as playlist_file:
+        playlist_file.write("\n".join([copy, other, first, copy]) + "\n")
+
+    groups = find_duplicates(library_files(folder_path), max_workers=1).groups
+    assert list(duplicate_entries([copy, other, first, copy], groups)) == [2]
+    assert collapse_playlist(playlist_path, groups) == 1
+    with open(playlist_path) as playlist_file:
+        assert playlist_file.read().splitlines() == [copy, other, copy]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,105 @@
+""" headless_loop.py
+
+Design:
+class HeadlessLoop:
+    def __init__
+        initialize scheduled callbacks and clock
+
+    def time
+        return virtual time, or the real clock
+
+    def after
+        schedule callback after a delay in milliseconds
+        return job id
+
+    def after_cancel
+        cancel scheduled callback
+
+    def run_pending
+        run callbacks that are due
+
+    def advance
+        move virtual time forward, running callbacks in the order they fall due
+
+    def run
+        run callbacks as they fall due until stopped
+
+The player engine schedules its polling and fades through after and
+after_cancel, which the Tk root provides when there is a window. This loop
+provides the same two methods without Tk, so the engine can run as a headless
+daemon. In virtual mode time only moves when advance is called, which lets
+tests and benchmarks play through hours of music in milliseconds.
+"""
+
+from heapq import heappop, heappush
+from itertools import count
+from time import perf_counter, sleep
+
+# Longest the loop sleeps when nothing is scheduled, so stop is noticed
+MAX_SLEEP = 0.1
+
+class HeadlessLoop:
+    """ Runs scheduled callbacks without a user interface, in real or virtual time. """
+    def __init__(self, virtual=False):
+        self.virtual = virtual
+        self.now = 0.0
+        self.jobs = []
+        self.cancelled = set()
+        self.sequence = count()
+        self.running = False
+
+    def time(self):
+        """ Returns the loop time in seconds. """
+        return self.now if self.virtual else perf_counter()
+
+    def after(self, delay, callback, *args):
+        """ Schedules a callback after a delay in milliseconds and returns its job id. """
+        job = next(self.sequence)
+        heappush(self.jobs, (self.time() + delay / 1000, job, callback, args))
+        return job
+
+    def after_cancel(self, job):
+        """ Cancels a scheduled callback. """
+        self.cancelled.add(job)
+
+    def run_pending(self):
+        """ Runs the callbacks that are due and returns how many ran. """
+        ran = 0
+        now = self.time()
+        while self.jobs and self.jobs[0][0] <= now:
+            ran += self.run_next()
+        return ran
+
+    def run_next(self):
+        """ Runs the next scheduled callback, returning 0 if it was cancelled. """
+        _, job, callback, args = heappop(self.jobs)
+        if job in self.cancelled:
+            self.cancelled.remove(job)
+            return 0
+        callback(*args)
+        return 1
+
+    def advance(self, seconds):
+        """ Moves virtual time forward, running the callbacks in the order they fall due. """
+        end = self.now + seconds
+        while self.jobs and self.jobs[0][0] <= end:
+            self.now = max(self.now, self.jobs[0][0])
+            self.run_next()
+        self.now = end
+
+    def run(self, duration=None):
+        """ Runs the callbacks as they fall due until stopped, or for a duration in seconds. """
+        self.running = True
+        end = None if duration is None else perf_counter() + duration
+        while self.running and (end is None or perf_counter() < end):
+            self.run_pending()
+            # Sleep until the next callback is due
+            delay = MAX_SLEEP
+            if self.jobs:
+                delay = min(delay, max(self.jobs[0][0] - perf_counter(), 0))
+            sleep(delay)
+        self.running = False
+
+    def stop(self):
+        """ Stops the loop. """
+        self.running = False
@@ -0,0 +1,39 @@
+import pytest
+from headless_loop import HeadlessLoop
+
+def test_callbacks_run_in_order_of_virtual_time():
+    """ Test that advancing virtual time runs the callbacks that fall due, in order. """
+    loop = HeadlessLoop(virtual=True)
+    ran = []
+    loop.after(200, ran.append, "second")
+    loop.after(100, ran.append, "first")
+    loop.after(100, lambda: loop.after(50, ran.append, "rescheduled"))
+    loop.after(500, ran.append, "later")
+    loop.advance(0.3)
+
+    assert ran == ["first", "rescheduled", "second"]
+    assert loop.time() == pytest.approx(0.3)
+
+def test_cancelled_callback_does_not_run():
+    """ Test that after_cancel keeps a callback from running. """
+    loop = HeadlessLoop(virtual=True)
+    ran = []
+    job = loop.after(100, ran.append, "cancelled")
+    loop.after_cancel(job)
+    loop.advance(1)
+
+    assert ran == []
+
+def test_run_stops():
+    """ Test that the real time loop runs callbacks until stopped. """
+    loop = HeadlessLoop()
+    ran = []
+    loop.after(10, ran.append, "ran")
+    loop.after(20, loop.stop)
+    loop.run(duration=5)
+
+    assert ran == ["ran"]
+    assert not loop.running
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,181 @@
+""" library_benchmark.py
+
+Design:
+def id3_tag
+    encode title, artist and album as an ID3v2.3 tag
+
+def generate_library
+    create folders of tiny tagged music files
+    create a playlist of music files from across the library
+
+def timed
+    run an operation and wait for its background tasks
+    return milliseconds
+
+def benchmark_scale
+    generate library of a number of music files
+    start player engine on the null audio backend
+    time listing folders, opening a folder, scanning the whole library, opening a playlist, removing from it, saving it and reading metadata
+    the first run is cold, the median of the others is warm
+
+def run_benchmark
+    benchmark each scale
+    write results to a JSON file
+    print a table of the results
+
+Measures how the music player's library and playlist operations scale with
+the size of the library. Each scale gets a synthetic library of folders of
+tiny music files, a single silent MP3 frame behind an ID3 tag, so 100,000
+music files take little disk space and the times are dominated by the player
+rather than by the disk. The operations are driven through the player engine on
+the null audio backend, so no display or sound card is needed. The results are
+written to a JSON file along with the Python version and platform, so runs of
+different releases can be compared to spot regressions:
+    python library_benchmark.py [--scales 1000,10000,100000] [--output library_benchmark.json]
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime
+from json import dump
+from os import path, makedirs
+from platform import platform, python_version
+from shutil import rmtree
+from statistics import median
+from struct import pack
+from tempfile import mkdtemp
+from time import perf_counter
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+TRACKS_PER_FOLDER = 100
+REPEAT = 5
+REMOVES = 100
+PLAYLIST_NAME = "Benchmark.txt"
+DEFAULT_OUTPUT = "library_benchmark.json"
+
+# One MPEG-1 Layer III frame of silence, 128 kbps at 44.1 kHz
+SILENT_FRAME = bytes.fromhex("fffb9064") + bytes(413)
+
+def id3_tag(title, artist, album):
+    """ Returns an ID3v2.3 tag with a title, artist and album. """
+    frames = b""
+    for frame_id, text in (("TIT2", title), ("TPE1", artist), ("TALB", album)):
+        # Text frames start with their encoding, 0 is Latin-1
+        data = b"\x00" + text.encode("latin-1")
+        frames += frame_id.encode() + pack(">I", len(data)) + b"\x00\x00" + data
+
+    # The tag size is stored as a 28 bit synchsafe integer
+    size = len(frames)
+    synchsafe = bytes(((size >> shift) & 0x7F) for shift in (21, 14, 7, 0))
+    return b"ID3\x03\x00\x00" + synchsafe + frames
+
+def generate_library(music_dir, tracks, tracks_per_folder=TRACKS_PER_FOLDER, playlist_length=None):
+    """ Creates folders of tiny tagged music files and a playlist, returns the folder names. """
+    folders = []
+    for track in range(tracks):
+        folder, number = divmod(track, tracks_per_folder)
+        folder_name = f"Artist {folder:05d} - Album"
+        if number == 0:
+            makedirs(path.join(music_dir, folder_name))
+            folders.append(folder_name)
+        with open(path.join(music_dir, folder_name, f"{number:03d} Track {track}.mp3"), "wb") as music_file:
+            music_file.write(id3_tag(f"Track {track}", f"Artist {folder:05d}", "Album") + SILENT_FRAME)
+
+    # The playlist takes music files from across the library
+    playlist_length = tracks if playlist_length is None else playlist_length
+    with open(path.join(music_dir, PLAYLIST_NAME), "w") as playlist_file:
+        for entry in range(playlist_length):
+            track = entry * 7919 % tracks
+            folder, number = divmod(track, tracks_per_folder)
+            playlist_file.write(path.join(music_dir, folders[folder], f"{number:03d} Track {track}.mp3") + "\n")
+    return folders
+
+def timed(engine, operation):
+    """ Runs an operation, waits for its background tasks and returns the milliseconds it took. """
+    started = perf_counter()
+    operation()
+    engine.tasks.wait()
+    return (perf_counter() - started) * 1000
+
+def benchmark_scale(tracks, repeat=REPEAT, tracks_per_folder=TRACKS_PER_FOLDER, playlist_length=None):
+    """ Times the library and playlist operations on a synthetic library and returns the results. """
+    from audio_backend import NullBackend
+    from headless_loop import HeadlessLoop
+    from player_engine import PlayerEngine
+
+    work_dir = mkdtemp(prefix="library_benchmark_")
+    try:
+        # Generate the library
+        music_dir = path.join(work_dir, "music")
+        makedirs(music_dir)
+        started = perf_counter()
+        folders = generate_library(music_dir, tracks, tracks_per_folder, playlist_length)
+        generate_ms = (perf_counter() - started) * 1000
+
+        # Start the engine, the first run of each operation is cold
+        loop = HeadlessLoop(virtual=True)
+        samples = {}
+
+        def measure(name, operation):
+            samples.setdefault(name, []).append(timed(engine, operation))
+
+        started = perf_counter()
+        engine = PlayerEngine(loop, NullBackend(clock=loop.time), music_dir, path.join(work_dir, "index.db"))
+        engine.tasks.wait()
+        samples["build_indexes"] = [(perf_counter() - started) * 1000]
+
+        folder_path = path.join(music_dir, folders[len(folders) // 2])
+        first_track = path.join(folder_path, "000 Track {}.mp3".format(len(folders) // 2 * tracks_per_folder))
+        for _ in range(repeat):
+            measure("load_folders", lambda: engine.load_folders(on_done=lambda folders: None))
+            measure("load_music", lambda: engine.load_music(folder_path, on_done=lambda music_files: None))
+            measure("scan_library", lambda: engine.scan_music(music_dir, on_batch=lambda music_paths: None))
+            measure("open_playlist", lambda: engine.open_playlist(PLAYLIST_NAME, on_done=lambda store: None))
+            measure("display_metadata", lambda: engine.read_metadata(first_track))
+
+        # Each removal appends one line to the playlist journal
+        for _ in range(min(REMOVES, len(engine.playlist_store.entries))):
+            measure("remove_from_playlist", lambda: engine.remove_from_playlist(0))
+        for _ in range(repeat):
+            measure("save_playlist", engine.save_playlist)
+        engine.close()
+    finally:
+        rmtree(work_dir, ignore_errors=True)
+
+    results = [{"tracks": tracks, "operation": "generate_library", "cold_ms": generate_ms, "warm_ms": None, "runs": 1}]
+    for name, times in samples.items():
+        results.append({
+            "tracks": tracks,
+            "operation": name,
+            "cold_ms": times[0],
+            "warm_ms": median(times[1:]) if len(times) > 1 else None,
+            "runs": len(times),
+        })
+    return results
+
+def run_benchmark(scales=DEFAULT_SCALES, output=DEFAULT_OUTPUT, repeat=REPEAT):
+    """ Benchmarks each scale, writes the results to a JSON file and prints them. """
+    results = []
+    for tracks in scales:
+        results += benchmark_scale(tracks, repeat)
+
+    with open(output, "w") as output_file:
+        dump({
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": python_version(),
+            "platform": platform(),
+            "results": results,
+        }, output_file, indent=2)
+
+    print(f"{'tracks':>8} {'operation':>22} {'cold ms':>10} {'warm ms':>10}")
+    for result in results:
+        warm = "" if result["warm_ms"] is None else f"{result['warm_ms']:10.2f}"
+        print(f"{result['tracks']:>8} {result['operation']:>22} {result['cold_ms']:10.2f} {warm:>10}")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Times library and playlist operations on synthetic libraries.")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                        help="comma separated numbers of music files")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file to write the results to")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs of each operation")
+    arguments = parser.parse_args()
+    run_benchmark([int(scale) for scale in arguments.scales.split(",")], arguments.output, arguments.repeat)
@@ -0,0 +1,35 @@
+from json import load
+from os import path, listdir
+import pytest
+from library_benchmark import PLAYLIST_NAME, generate_library, run_benchmark
+from library_index import read_tags
+
+def test_generated_music_files_are_tagged(tmp_path):
+    """ Test that the synthetic library has the requested folders, tags and playlist. """
+    folders = generate_library(str(tmp_path), 25, tracks_per_folder=10, playlist_length=40)
+
+    assert len(folders) == 3
+    assert len(listdir(path.join(str(tmp_path), folders[2]))) == 5
+    tags = read_tags(path.join(str(tmp_path), folders[1], "004 Track 14.mp3"))
+    assert (tags["title"], tags["artist"], tags["album"]) == ("Track 14", "Artist 00001", "Album")
+
+    with open(path.join(str(tmp_path), PLAYLIST_NAME)) as playlist_file:
+        entries = playlist_file.read().splitlines()
+    assert len(entries) == 40
+    assert all(path.exists(entry) for entry in entries)
+
+def test_results_are_written_as_json(tmp_path):
+    """ Test that every operation is timed at every scale and written to the output file. """
+    output = str(tmp_path / "results.json")
+    run_benchmark([20, 50], output, repeat=2)
+
+    with open(output) as output_file:
+        results = load(output_file)["results"]
+    operations = {(result["tracks"], result["operation"]) for result in results}
+    for tracks in (20, 50):
+        for operation in ("load_folders", "load_music", "scan_library", "open_playlist", "save_playlist",
+                          "remove_from_playlist", "display_metadata"):
+            assert (tracks, operation) in operations
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,319 @@
+""" library_index.py
+
+Design:
+def read_tags
+    import eyed3 the first time
+    load audio file
+    return title, artist, album and duration
+
+class LibraryIndex:
+    def __init__
+        open index database
+        create tables
+
+    def folders
+        rescan music folder if it changed
+        return subdirectories
+
+    def tracks
+        rescan folder if it changed
+        return music files in folder
+
+    def listing
+        rescan folder if it changed
+        return its subdirectories and music files
+
+    def all_tracks
+        rescan every folder under music folder that changed
+        return path and tags of every music file
+
+    def files
+        rescan every folder under music folder that changed
+        return path, mtime and size of every music file
+
+    def track_store
+        rescan every folder under music folder that changed
+        stream every music file with its tags, size and mtime into a track store, ordered by folder and name
+
+    def scan_all
+        rescan every folder under music folder that changed, top down
+
+    def metadata
+        stat music file
+        if file changed since last read, read tags and store them if it is in the music folder
+        return tags
+
+    def check_files
+        stat the stored music files of a folder
+        store the ones rewritten or retagged in place, forgetting their tags
+
+    def io_stats
+        return number of folders listed and tag parses
+
+    def scan_folder
+        if folder mtime is unchanged, check its music files and stop
+        list folder
+        store new or changed music files, forget removed ones
+        store new subdirectories, forget removed ones and everything under them
+        store folder mtime
+
+This module keeps an on-disk index of the music folder so that refreshing the
+folder list, opening a folder and displaying metadata do not have to walk the
+disk or parse tags again. Folders are keyed by path + mtime and music files by
+path + mtime + size, so only what changed is rescanned. A folder whose mtime
+is unchanged is not listed again, but its music files are still stat'ed, since
+rewriting a file in place does not change its folder's mtime. Only music files
+in the music folder are stored. The index is used from the background task
+threads, so database access is serialized with a lock while directory
+listings, stats and tag reads run outside of it. The whole library is handed
+to the rest of the player as a TrackStore, streamed from the tracks table
+straight into its columns.
+"""
+
+import sqlite3
+from os import path, scandir, stat
+from threading import Lock
+from time import time
+
+from track_store import TrackStore
+
+DEFAULT_INDEX_PATH = path.join(path.dirname(path.abspath(__file__)), "library_index.db")
+
+# Directory mtimes this close to the scan time are not trusted, since a file
+# added in the same tick would not change the recorded mtime.
+MTIME_GRACE_SECONDS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS folders (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    name TEXT,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS folders_parent ON folders (parent);
+CREATE TABLE IF NOT EXISTS tracks (
+    path TEXT PRIMARY KEY,
+    folder TEXT,
+    name TEXT,
+    mtime REAL,
+    size INTEGER,
+    tagged INTEGER DEFAULT 0,
+    title TEXT,
+    artist TEXT,
+    album TEXT,
+    duration REAL
+);
+CREATE INDEX IF NOT EXISTS tracks_folder ON tracks (folder);
+"""
+
+def read_tags(file_path):
+    """ Reads the title, artist, album and duration of a music file. """
+    # eyed3 is slow to import, so it is only imported the first time tags are read
+    import eyed3
+    audio_file = eyed3.load(file_path)
+
+    # If the audio file has no metadata, there is nothing to store
+    if audio_file is None or not audio_file.tag:
+        return None
+
+    duration = audio_file.info.time_secs if audio_file.info else None
+    return {
+        "title": audio_file.tag.title,
+        "artist": audio_file.tag.artist,
+        "album": audio_file.tag.album,
+        "duration": duration,
+    }
+
+class LibraryIndex:
+    """ An on-disk index of the folders, music files and tags in the music folder. """
+    def __init__(self, music_dir, index_path=DEFAULT_INDEX_PATH):
+        self.music_dir = path.normpath(path.abspath(music_dir))
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = Lock()
+        self.folders_listed = 0
+        self.tag_parses = 0
+
+        # Music files outside the music folder were once stored by metadata, they are forgotten
+        with self.connection:
+            self.connection.execute("DELETE FROM tracks WHERE path < ? OR path >= ?",
+                                    (self.music_dir + path.sep, self.music_dir + chr(ord(path.sep) + 1)))
+
+    def close(self):
+        """ Closes the index database. """
+        with self.lock:
+            self.connection.close()
+
+    def folders(self):
+        """ Returns the subdirectories of the music folder. """
+        self.scan_folder(self.music_dir)
+        with self.lock:
+            rows = self.connection.execute("SELECT name FROM folders WHERE parent = ? ORDER BY name", (self.music_dir,))
+            return [name for name, in rows]
+
+    def tracks(self, folder_path):
+        """ Returns the music files in a folder. """
+        folder_path = path.normpath(path.abspath(folder_path))
+        self.scan_folder(folder_path)
+        with self.lock:
+            rows = self.connection.execute("SELECT name FROM tracks WHERE folder = ? ORDER BY name", (folder_path,))
+            return [name for name, in rows]
+
+    def listing(self, folder_path):
+        """ Returns the subdirectories and music files of a folder, for the library scanner. """
+        folder_path = path.normpath(path.abspath(folder_path))
+        self.scan_folder(folder_path)
+        with self.lock:
+            subdirectories = [name for name, in self.connection.execute(
+                "SELECT name FROM folders WHERE parent = ? ORDER BY name", (folder_path,))]
+            music_files = [name for name, in self.connection.execute(
+                "SELECT name FROM tracks WHERE folder = ? ORDER BY name", (folder_path,))]
+        return subdirectories, music_files
+
+    def all_tracks(self):
+        """ Returns the path and stored tags of every music file under the music folder. """
+        self.scan_all()
+        with self.lock:
+            rows = self.connection.execute("SELECT path, title, artist, album FROM tracks ORDER BY path").fetchall()
+        return [(file_path, {"title": title, "artist": artist, "album": album})
+                for file_path, title, artist, album in rows]
+
+    def files(self):
+        """ Returns the path, mtime and size of every music file under the music folder. """
+        self.scan_all()
+        with self.lock:
+            return self.connection.execute("SELECT path, mtime, size FROM tracks").fetchall()
+
+    def track_store(self):
+        """ Returns every music file under the music folder with its stored tags, size and mtime in a TrackStore. """
+        self.scan_all()
+        # The rows are streamed from the cursor, a million tracks never exist as Python tuples at once
+        with self.lock:
+            return TrackStore.from_rows(self.connection.execute(
+                "SELECT folder, name, title, artist, album, duration, size, mtime FROM tracks ORDER BY folder, name"))
+
+    def scan_all(self):
+        """ Rescans every folder under the music folder that changed. """
+        # Rescan the folders top down, each scan stores the subdirectories of the folder
+        pending = [self.music_dir]
+        while pending:
+            folder_path = pending.pop()
+            self.scan_folder(folder_path)
+            with self.lock:
+                pending += [child for child, in self.connection.execute(
+                    "SELECT path FROM folders WHERE parent = ?", (folder_path,))]
+
+    def metadata(self, file_path):
+        """ Returns the tags of a music file, reading them only if the file changed. """
+        file_path = path.normpath(path.abspath(file_path))
+        file_stat = stat(file_path)
+
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT mtime, size, tagged, title, artist, album, duration FROM tracks WHERE path = ?", (file_path,)).fetchone()
+
+        # If the file is unchanged and its tags were read before, use the stored tags
+        if row and row[0] == file_stat.st_mtime and row[1] == file_stat.st_size and row[2]:
+            if row[3:] == (None, None, None, None):
+                return None
+            return dict(zip(("title", "artist", "album", "duration"), row[3:]))
+
+        # Otherwise read the tags and store them, unless the music file is outside the music folder, such as a
+        # playlist entry elsewhere, since nothing would ever forget it
+        tags = read_tags(file_path)
+        values = tags or {"title": None, "artist": None, "album": None, "duration": None}
+        with self.lock, self.connection:
+            self.tag_parses += 1
+            if not file_path.startswith(self.music_dir + path.sep):
+                return tags
+            self.connection.execute(
+                "INSERT OR REPLACE INTO tracks (path, folder, name, mtime, size, tagged, title, artist, album, duration) "
+                "VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?)",
+                (file_path, path.dirname(file_path), path.basename(file_path), file_stat.st_mtime, file_stat.st_size,
+                 values["title"], values["artist"], values["album"], values["duration"]))
+        return tags
+
+    def check_files(self, folder_path):
+        """ Stats the stored music files of a folder and stores the ones that changed in place, so their tags are read again. """
+        with self.lock:
+            known_files = self.connection.execute(
+                "SELECT name, mtime, size FROM tracks WHERE folder = ?", (folder_path,)).fetchall()
+        changed = []
+        for name, mtime, size in known_files:
+            try:
+                file_stat = stat(path.join(folder_path, name))
+            except OSError:
+                continue
+            if (file_stat.st_mtime, file_stat.st_size) != (mtime, size):
+                changed.append((path.join(folder_path, name), folder_path, name, file_stat.st_mtime, file_stat.st_size))
+        if changed:
+            with self.lock, self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO tracks (path, folder, name, mtime, size) VALUES (?, ?, ?, ?, ?)", changed)
+
+    def io_stats(self):
+        """ Returns how many folders were listed and how many music files had their tags parsed. """
+        with self.lock:
+            return {"folders_listed": self.folders_listed, "tag_parses": self.tag_parses}
+
+    def scan_folder(self, folder_path):
+        """ Rescans a folder if it changed since it was last scanned. """
+        folder_mtime = stat(folder_path).st_mtime
+
+        # If the folder is unchanged, its stored listing is still correct, but a music file rewritten or retagged
+        # in place does not change its folder's mtime, so the music files in it are checked
+        with self.lock:
+            row = self.connection.execute("SELECT mtime FROM folders WHERE path = ?", (folder_path,)).fetchone()
+        if row and row[0] == folder_mtime:
+            self.check_files(folder_path)
+            return
+
+        # List the folder
+        subdirectories = set()
+        music_files = {}
+        with scandir(folder_path) as entries:
+            for entry in entries:
+                # Links to folders are not followed, a link to a folder above it would be scanned forever
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.add(entry.name)
+                elif entry.name.lower().endswith(".mp3"):
+                    entry_stat = entry.stat()
+                    music_files[entry.name] = (entry_stat.st_mtime, entry_stat.st_size)
+
+        with self.lock, self.connection:
+            self.folders_listed += 1
+
+            # Store new or changed music files and forget removed ones
+            known_files = {name: (mtime, size) for name, mtime, size in self.connection.execute(
+                "SELECT name, mtime, size FROM tracks WHERE folder = ?", (folder_path,))}
+            for name in known_files.keys() - music_files.keys():
+                self.connection.execute("DELETE FROM tracks WHERE path = ?", (path.join(folder_path, name),))
+            for name, (mtime, size) in music_files.items():
+                if known_files.get(name) != (mtime, size):
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO tracks (path, folder, name, mtime, size) VALUES (?, ?, ?, ?, ?)",
+                        (path.join(folder_path, name), folder_path, name, mtime, size))
+
+            # Store new subdirectories and forget removed ones
+            known_folders = {name for name, in self.connection.execute(
+                "SELECT name FROM folders WHERE parent = ?", (folder_path,))}
+            for name in known_folders - subdirectories:
+                # Everything under a removed folder goes with it, a range on the path finds it without LIKE wildcards
+                removed_path = path.join(folder_path, name)
+                subtree = (removed_path, removed_path + path.sep, removed_path + chr(ord(path.sep) + 1))
+                self.connection.execute("DELETE FROM folders WHERE path = ? OR (path >= ? AND path < ?)", subtree)
+                self.connection.execute("DELETE FROM tracks WHERE path >= ? AND path < ?", subtree[1:])
+            for name in subdirectories - known_folders:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO folders (path, parent, name, mtime) VALUES (?, ?, ?, NULL)",
+                    (path.join(folder_path, name), folder_path, name))
+
+            # Store the folder mtime, unless it is too recent to be trusted
+            if time() - folder_mtime < MTIME_GRACE_SECONDS:
+                folder_mtime = None
+            parent = path.dirname(folder_path) if folder_path != self.music_dir else None
+            self.connection.execute(
+                "INSERT INTO folders (path, parent, name, mtime) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime",
+                (folder_path, parent, path.basename(folder_path), folder_mtime))
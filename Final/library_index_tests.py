@@ -0,0 +1,154 @@
+from os import path, mkdir, utime, remove, symlink
+from shutil import copyfile, rmtree
+import pytest
+import library_index
+from library_index import LibraryIndex
+
+SAMPLE_MUSIC = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+OLD_MTIME = 1_000_000_000
+
+def make_library(music_dir):
+    """ Creates a music folder with one album of two music files. """
+    album_path = path.join(music_dir, "album")
+    mkdir(album_path)
+    for name in ("01 First.mp3", "02 Second.mp3"):
+        copyfile(SAMPLE_MUSIC, path.join(album_path, name))
+    with open(path.join(album_path, "Folder.jpg"), "w"):
+        pass
+    age_folders(music_dir)
+    return album_path
+
+def age_folders(music_dir):
+    """ Backdates the folder mtimes so the index trusts them. """
+    utime(music_dir, (OLD_MTIME, OLD_MTIME))
+    utime(path.join(music_dir, "album"), (OLD_MTIME, OLD_MTIME))
+
+def test_folders_and_tracks(tmp_path):
+    """ Test that the index lists folders and music files. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+
+    assert library.folders() == ["album"]
+    assert library.tracks(album_path) == ["01 First.mp3", "02 Second.mp3"]
+
+def test_unchanged_folder_is_not_rescanned(tmp_path, monkeypatch):
+    """ Test that an unchanged folder is served from the index. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    library.tracks(album_path)
+
+    def fail_scandir(folder_path):
+        raise AssertionError("folder was rescanned")
+    monkeypatch.setattr(library_index, "scandir", fail_scandir)
+
+    assert library.tracks(album_path) == ["01 First.mp3", "02 Second.mp3"]
+
+def test_changed_folder_is_rescanned(tmp_path):
+    """ Test that added and removed music files are picked up. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    library.tracks(album_path)
+
+    remove(path.join(album_path, "01 First.mp3"))
+    copyfile(SAMPLE_MUSIC, path.join(album_path, "03 Third.mp3"))
+    utime(album_path, (OLD_MTIME + 1, OLD_MTIME + 1))
+
+    assert library.tracks(album_path) == ["02 Second.mp3", "03 Third.mp3"]
+
+def test_removed_folder_takes_its_subfolders_along(tmp_path):
+    """ Test that removing a folder forgets the folders and music files nested under it, and upper case extensions count. """
+    album_path = make_library(str(tmp_path))
+    disc_path = path.join(album_path, "disc1")
+    mkdir(disc_path)
+    copyfile(SAMPLE_MUSIC, path.join(disc_path, "01 Loud.MP3"))
+    copyfile(SAMPLE_MUSIC, path.join(str(tmp_path), "Single.mp3"))
+    age_folders(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    assert len(library.all_tracks()) == 4
+
+    rmtree(album_path)
+    utime(str(tmp_path), (OLD_MTIME + 1, OLD_MTIME + 1))
+
+    assert [file_path for file_path, _ in library.all_tracks()] == [path.join(str(tmp_path), "Single.mp3")]
+    assert library.connection.execute("SELECT COUNT(*) FROM folders WHERE path LIKE ?", (album_path + "%",)).fetchone() == (0,)
+
+def test_music_file_changed_in_place_is_read_again(tmp_path):
+    """ Test that a music file rewritten without changing its folder's mtime gets its new size and tags. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    music_path = path.join(album_path, "02 Second.mp3")
+    assert library.metadata(music_path)["title"] == "Walk Through the Night-Side"
+    assert library.track_store()[1].title == "Walk Through the Night-Side"
+
+    with open(music_path, "wb") as music_file:
+        music_file.write(b"not music any more")
+    age_folders(str(tmp_path))
+
+    assert library.track_store()[1].size == len(b"not music any more")
+    assert library.all_tracks()[1][1]["title"] is None
+
+def test_music_files_outside_the_music_folder_are_not_stored(tmp_path):
+    """ Test that reading the tags of a music file elsewhere, such as a playlist entry, does not add it to the library. """
+    mkdir(str(tmp_path / "music"))
+    make_library(str(tmp_path / "music"))
+    copyfile(SAMPLE_MUSIC, str(tmp_path / "music2.mp3"))
+    library = LibraryIndex(str(tmp_path / "music"), str(tmp_path / "index.db"))
+
+    assert library.metadata(str(tmp_path / "music2.mp3"))["title"] == "Walk Through the Night-Side"
+    assert [path.basename(file_path) for file_path, _, _ in library.files()] == ["01 First.mp3", "02 Second.mp3"]
+
+def test_metadata_is_read_once(tmp_path, monkeypatch):
+    """ Test that tags are only parsed again when the music file changes. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    music_path = path.join(album_path, "01 First.mp3")
+
+    reads = []
+    read_tags = library_index.read_tags
+    monkeypatch.setattr(library_index, "read_tags", lambda file_path: reads.append(file_path) or read_tags(file_path))
+
+    metadata = library.metadata(music_path)
+    assert library.metadata(music_path) == metadata
+    assert metadata["title"] == "Walk Through the Night-Side"
+    assert len(reads) == 1
+
+    utime(music_path, (OLD_MTIME, OLD_MTIME))
+    library.metadata(music_path)
+    assert len(reads) == 2
+
+def test_all_tracks(tmp_path):
+    """ Test that every music file under the music folder is listed with its stored tags. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    library.metadata(path.join(album_path, "01 First.mp3"))
+
+    tracks = library.all_tracks()
+    assert [file_path for file_path, _ in tracks] == [path.join(album_path, "01 First.mp3"), path.join(album_path, "02 Second.mp3")]
+    assert tracks[0][1]["title"] == "Walk Through the Night-Side"
+    assert tracks[1][1]["title"] is None
+
+def test_link_to_a_folder_above_is_not_followed(tmp_path):
+    """ Test that a link back to the music folder is not scanned as a folder of its own. """
+    album_path = make_library(str(tmp_path))
+    symlink(str(tmp_path), path.join(album_path, "Loop"))
+    age_folders(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+
+    assert [file_path for file_path, _ in library.all_tracks()] == [path.join(album_path, "01 First.mp3"),
+                                                                   path.join(album_path, "02 Second.mp3")]
+    assert library.listing(album_path)[0] == []
+
+def test_track_store(tmp_path):
+    """ Test that the track store holds every music file with its stored tags, size and mtime. """
+    album_path = make_library(str(tmp_path))
+    library = LibraryIndex(str(tmp_path), str(tmp_path / "index.db"))
+    library.metadata(path.join(album_path, "01 First.mp3"))
+
+    store = library.track_store()
+    assert [track.path for track in store] == [path.join(album_path, "01 First.mp3"), path.join(album_path, "02 Second.mp3")]
+    assert store[0].title == "Walk Through the Night-Side"
+    assert store[0].size == path.getsize(path.join(album_path, "01 First.mp3"))
+    assert store[1].title is None and store[1].duration is None
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,128 @@
+""" library_scanner.py
+
+Design:
+def list_folder
+    list a folder with scandir
+    return its subdirectories and music files, without following links to folders
+
+class ScanStats:
+    music files and folders found, seconds taken, files per second and whether the scan was cancelled
+
+class LibraryScanner:
+    def __init__
+        initialize folder lister, batch queue and cancel flag
+
+    def scan
+        list the top folder on a thread pool
+        as each listing finishes, queue its music files as a batch and list its subdirectories
+        stop early if cancelled
+        return stats
+
+    def take_batches
+        return the music files queued since the last call
+
+    def cancel
+        stop listing folders
+
+    def progress
+        return stats so far
+
+Finds every music file under a folder, however deeply it is nested, for
+example artist/album/disc. Listing a folder is mostly waiting on the disk, so
+folders are listed on a thread pool: as soon as a folder is listed, each of its
+subdirectories is handed to a free thread, and the music files it holds are
+queued as a batch. The user interface takes the queued batches on its event
+loop while the scan goes on, so the first results are shown within
+milliseconds even when the whole scan takes minutes. A scan can be cancelled
+when the user opens another folder, and it reports its throughput in music
+files per second. Links to folders are not followed, since a link to a folder
+above it would be listed forever.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from os import path, scandir
+from queue import Queue, Empty
+from threading import Event
+from time import perf_counter
+
+MAX_WORKERS = 8
+
+ScanStats = namedtuple("ScanStats", "files folders seconds files_per_second cancelled")
+
+def list_folder(folder_path):
+    """ Returns the subdirectories and music files of a folder, sorted by name. """
+    subdirectories = []
+    music_files = []
+    with scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.name)
+            elif entry.name.lower().endswith(".mp3"):
+                music_files.append(entry.name)
+    return sorted(subdirectories), sorted(music_files)
+
+class LibraryScanner:
+    """ Lists every music file under a folder on a thread pool, queueing them in batches as they are found. """
+    def __init__(self, list_folder=list_folder, max_workers=MAX_WORKERS):
+        self.list_folder = list_folder
+        self.max_workers = max_workers
+        self.batches = Queue()
+        self.cancelled = Event()
+        self.files = 0
+        self.folders = 0
+        self.started = None
+        self.finished = None
+
+    def scan(self, folder_path):
+        """ Lists the music files under a folder, queueing each folder's music files as a batch, and returns the stats. """
+        self.started = perf_counter()
+        executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="library-scan")
+        try:
+            # The top folder must be listable, a subdirectory that vanishes during the scan is skipped
+            pending = {executor.submit(self.list_folder, folder_path): folder_path}
+            while pending and not self.cancelled.is_set():
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    listed_path = pending.pop(future)
+                    try:
+                        subdirectories, music_files = future.result()
+                    except OSError:
+                        if listed_path == folder_path:
+                            raise
+                        continue
+
+                    # Queue the music files, then hand each subdirectory to a free thread
+                    self.folders += 1
+                    if music_files:
+                        self.files += len(music_files)
+                        self.batches.put([path.join(listed_path, name) for name in music_files])
+                    for name in subdirectories:
+                        subdirectory_path = path.join(listed_path, name)
+                        pending[executor.submit(self.list_folder, subdirectory_path)] = subdirectory_path
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.finished = perf_counter()
+        return self.progress()
+
+    def take_batches(self):
+        """ Returns the paths of the music files queued since the last call. """
+        paths = []
+        try:
+            while True:
+                paths += self.batches.get_nowait()
+        except Empty:
+            pass
+        return paths
+
+    def cancel(self):
+        """ Stops the scan, folders already being listed are finished but not followed. """
+        self.cancelled.set()
+
+    def progress(self):
+        """ Returns the stats of the scan so far. """
+        if self.started is None:
+            return ScanStats(0, 0, 0, 0, self.cancelled.is_set())
+        seconds = (self.finished or perf_counter()) - self.started
+        files_per_second = self.files / seconds if seconds > 0 else 0
+        return ScanStats(self.files, self.folders, seconds, files_per_second, self.cancelled.is_set())
@@ -0,0 +1,88 @@
+from os import path, makedirs, symlink
+from threading import Event, Thread
+import pytest
+from library_scanner import LibraryScanner, list_folder
+
+def make_nested_library(music_dir):
+    """ Creates artist/album/disc folders of empty music files, returns their paths. """
+    music_paths = []
+    for artist in ("Artist A", "Artist B"):
+        for disc in ("Disc 1", "Disc 2"):
+            folder_path = path.join(music_dir, artist, "Album", disc)
+            makedirs(folder_path)
+            for name in ("01 First.mp3", "02 Second.mp3", "cover.jpg"):
+                with open(path.join(folder_path, name), "w"):
+                    pass
+                if name.endswith(".mp3"):
+                    music_paths.append(path.join(folder_path, name))
+    return music_paths
+
+def test_finds_nested_music_files(tmp_path):
+    """ Test that music files at every depth are found and the throughput is reported. """
+    music_paths = make_nested_library(str(tmp_path))
+    scanner = LibraryScanner()
+    stats = scanner.scan(str(tmp_path))
+
+    assert sorted(scanner.take_batches()) == sorted(music_paths)
+    assert scanner.take_batches() == []
+    assert (stats.files, stats.folders, stats.cancelled) == (8, 9, False)
+    assert stats.files_per_second > 0
+
+def test_link_to_a_folder_above_is_not_followed(tmp_path):
+    """ Test that a link back to the music folder does not make the scan go round in circles. """
+    music_paths = make_nested_library(str(tmp_path))
+    symlink(str(tmp_path), str(tmp_path / "Artist A" / "Album" / "Loop"))
+    scanner = LibraryScanner()
+    stats = scanner.scan(str(tmp_path))
+
+    assert sorted(scanner.take_batches()) == sorted(music_paths)
+    assert (stats.files, stats.folders) == (8, 9)
+
+def test_batches_arrive_while_scanning(tmp_path):
+    """ Test that music files are queued before the scan finishes. """
+    make_nested_library(str(tmp_path))
+    release = Event()
+    batches = []
+
+    def slow_list_folder(folder_path):
+        # Hold the scan back at the second disc until the first disc's batch has been taken
+        if folder_path.endswith(path.join("Artist B", "Album", "Disc 2")):
+            release.wait(5)
+        return list_folder(folder_path)
+
+    def take_first_batches():
+        while not batches:
+            batches.extend(scanner.take_batches())
+        release.set()
+
+    scanner = LibraryScanner(slow_list_folder)
+    taker = Thread(target=take_first_batches)
+    taker.start()
+    scanner.scan(str(tmp_path))
+    taker.join()
+
+    assert 0 < len(batches) < 8
+
+def test_cancel_stops_the_scan(tmp_path):
+    """ Test that a cancelled scan stops following subdirectories. """
+    make_nested_library(str(tmp_path))
+    scanner = LibraryScanner()
+
+    def cancelling_list_folder(folder_path):
+        scanner.cancel()
+        return list_folder(folder_path)
+
+    scanner.list_folder = cancelling_list_folder
+    stats = scanner.scan(str(tmp_path))
+
+    assert stats.cancelled
+    assert stats.folders <= 1
+    assert scanner.take_batches() == []
+
+def test_missing_folder_raises(tmp_path):
+    """ Test that scanning a folder that does not exist raises. """
+    with pytest.raises(FileNotFoundError):
+        LibraryScanner().scan(str(tmp_path / "missing"))
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
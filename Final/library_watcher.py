@@ -0,0 +1,348 @@
+""" library_watcher.py
+
+Design:
+class Change:
+    kind of change, path, whether it is a folder and the old path of a rename
+
+def coalesce
+    merge changes to the same path within one poll
+
+class InotifyWatcher:
+    def __init__
+        open inotify through libc
+        watch music folder and every folder under it
+
+    def add_watch
+        watch a folder and remember its path
+
+    def poll
+        read waiting events without blocking
+        pair moved from and moved to events into renames
+        watch new folders and report the files already in them
+        if the event queue overflowed, ask for a rescan
+
+    def close
+        close inotify
+
+class PollingWatcher:
+    def __init__
+        take a snapshot of the names, mtimes and sizes in every folder
+
+    def poll
+        stat every known folder
+        rescan only the folders whose mtime changed
+        report added, removed and changed entries
+        pair removed and added music files with the same size and mtime into renames
+        check the next slice of files in the other folders
+
+    def check_files
+        stat up to a number of files, taking the folders in turn
+        report the files whose size or mtime changed in place
+
+def create_watcher
+    use inotify on Linux, polling anywhere else or if inotify is unavailable
+
+Watches the music folder so the library views and indexes are updated with
+what changed instead of being rebuilt. On Linux, inotify is used through
+ctypes, so the kernel queues the changes and a poll is a single non-blocking
+read. Elsewhere, or when inotify runs out of watches, the polling watcher keeps
+a snapshot of every folder and only rescans the folders whose mtime changed,
+since adding, removing or renaming an entry changes the mtime of its folder.
+Rewriting a file in place does not, so each poll also stats the next slice of
+files in the snapshot, and a file changed in place is reported once the
+rotation reaches it, within a few polls on a large library.
+Both report the same changes, so the cost of a refresh is proportional to what
+changed rather than to the size of the library.
+"""
+
+import ctypes
+import ctypes.util
+from collections import namedtuple
+from os import path, read, close, scandir, stat, walk, O_NONBLOCK, O_CLOEXEC
+from struct import unpack_from
+from sys import platform
+from time import time
+
+from library_index import MTIME_GRACE_SECONDS
+
+Change = namedtuple("Change", "kind path is_dir old_path", defaults=(False, None))
+
+# inotify event masks, from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = "iIII"
+EVENT_HEADER_SIZE = 16
+READ_SIZE = 64 * 1024
+# Files the polling watcher stats on each poll to find files changed in place
+FILES_PER_POLL = 2048
+
+def coalesce(changes):
+    """ Merges the changes to the same path, keeping the order they first happened in. """
+    merged = {}
+    for change in changes:
+        previous = merged.get(change.path)
+        if previous is None:
+            merged[change.path] = change
+        elif previous.kind == "added" and change.kind == "removed":
+            # Created and deleted between two polls, nothing changed
+            del merged[change.path]
+        elif previous.kind == "added":
+            continue
+        elif previous.kind == "removed" and change.kind == "added":
+            merged[change.path] = change._replace(kind="changed")
+        else:
+            merged[change.path] = change
+    return list(merged.values())
+
+class InotifyWatcher:
+    """ Watches the music folder with Linux inotify. """
+    def __init__(self, root):
+        self.root = path.normpath(path.abspath(root))
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(O_NONBLOCK | O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths = {}
+        try:
+            for folder_path, _, _ in walk(self.root):
+                self.add_watch(folder_path)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, folder_path):
+        """ Watches a folder, raising OSError if there are no watches left. """
+        descriptor = self.libc.inotify_add_watch(self.fd, folder_path.encode(), WATCH_MASK)
+        if descriptor < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder_path}")
+        self.paths[descriptor] = folder_path
+
+    def poll(self):
+        """ Returns the changes since the last poll. """
+        events = []
+        while True:
+            try:
+                data = read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                descriptor, mask, cookie, length = unpack_from(EVENT_HEADER, data, offset)
+                name = data[offset + EVENT_HEADER_SIZE:offset + EVENT_HEADER_SIZE + length].rstrip(b"\0").decode(errors="surrogateescape")
+                offset += EVENT_HEADER_SIZE + length
+                events.append((descriptor, mask, cookie, name))
+
+        changes = []
+        moved_from = {}
+        for descriptor, mask, cookie, name in events:
+            # The kernel dropped events, only a rescan can tell what changed
+            if mask & IN_Q_OVERFLOW:
+                changes.append(Change("rescan", self.root, True))
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(descriptor, None)
+                continue
+            folder_path = self.paths.get(descriptor)
+            if folder_path is None or not name:
+                continue
+            entry_path = path.join(folder_path, name)
+            is_dir = bool(mask & IN_ISDIR)
+
+            if mask & IN_CREATE:
+                changes.append(Change("added", entry_path, is_dir))
+                if is_dir:
+                    changes += self.watch_new_folder(entry_path)
+            elif mask & IN_CLOSE_WRITE:
+                changes.append(Change("changed", entry_path))
+            elif mask & IN_DELETE:
+                changes.append(Change("removed", entry_path, is_dir))
+            elif mask & IN_MOVED_FROM:
+                moved_from[cookie] = len(changes)
+                changes.append(Change("removed", entry_path, is_dir))
+            elif mask & IN_MOVED_TO:
+                # A move within the music folder comes as a pair of events with the same cookie
+                index = moved_from.pop(cookie, None)
+                if index is not None:
+                    old_path = changes[index].path
+                    changes[index] = Change("renamed", entry_path, is_dir, old_path)
+                    if is_dir:
+                        self.rename_watches(old_path, entry_path)
+                else:
+                    changes.append(Change("added", entry_path, is_dir))
+                    if is_dir:
+                        changes += self.watch_new_folder(entry_path)
+
+        # A folder moved out of the music folder is no longer watched
+        for index in moved_from.values():
+            if changes[index].is_dir:
+                self.remove_watches(changes[index].path)
+        return coalesce(changes)
+
+    def watch_new_folder(self, folder_path):
+        """ Watches a new folder and returns the entries that were in it before it was watched. """
+        changes = []
+        for inner_path, folder_names, file_names in walk(folder_path):
+            try:
+                self.add_watch(inner_path)
+            except OSError:
+                changes.append(Change("rescan", self.root, True))
+            if inner_path != folder_path:
+                changes.append(Change("added", inner_path, True))
+            changes += [Change("added", path.join(inner_path, name)) for name in file_names]
+        return changes
+
+    def rename_watches(self, old_path, new_path):
+        """ Points the watches of a renamed folder and the folders under it at their new paths. """
+        for descriptor, folder_path in self.paths.items():
+            if folder_path == old_path or folder_path.startswith(old_path + path.sep):
+                self.paths[descriptor] = new_path + folder_path[len(old_path):]
+
+    def remove_watches(self, folder_path):
+        """ Stops watching a folder and the folders under it. """
+        for descriptor, watched_path in list(self.paths.items()):
+            if watched_path == folder_path or watched_path.startswith(folder_path + path.sep):
+                self.libc.inotify_rm_watch(self.fd, descriptor)
+                del self.paths[descriptor]
+
+    def close(self):
+        """ Closes inotify, which removes every watch. """
+        if self.fd >= 0:
+            close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """ Watches the music folder by comparing snapshots of the folders whose mtime changed. """
+    def __init__(self, root):
+        self.root = path.normpath(path.abspath(root))
+        self.folders = {}
+        self.unchecked = []
+        self.snapshot(self.root)
+
+    def snapshot(self, folder_path):
+        """ Records the entries of a folder and the folders under it, returns the entries as added changes. """
+        changes = []
+        try:
+            entries = self.snapshot_folder(folder_path)
+        except FileNotFoundError:
+            return changes
+
+        for name, (is_dir, _, _) in entries.items():
+            entry_path = path.join(folder_path, name)
+            changes.append(Change("added", entry_path, is_dir))
+            if is_dir:
+                changes += self.snapshot(entry_path)
+        return changes
+
+    def forget(self, folder_path):
+        """ Forgets the snapshots of a removed folder and the folders under it. """
+        for known_path in list(self.folders):
+            if known_path == folder_path or known_path.startswith(folder_path + path.sep):
+                del self.folders[known_path]
+
+    def poll(self):
+        """ Returns the changes since the last poll. """
+        changes = []
+        for folder_path, (folder_mtime, entries) in list(self.folders.items()):
+            if folder_path not in self.folders:
+                continue
+            try:
+                current_mtime = stat(folder_path).st_mtime
+            except FileNotFoundError:
+                continue
+            if current_mtime == folder_mtime:
+                continue
+
+            # Rescan the changed folder and compare it with its snapshot
+            previous = entries
+            try:
+                current = self.snapshot_folder(folder_path)
+            except FileNotFoundError:
+                continue
+            added = [name for name in current.keys() - previous.keys()]
+            removed = [name for name in previous.keys() - current.keys()]
+
+            # A removed and an added music file with the same size and mtime were renamed
+            renamed_from = {previous[name][1:]: name for name in removed if not previous[name][0]}
+            for name in sorted(added):
+                is_dir = current[name][0]
+                entry_path = path.join(folder_path, name)
+                old_name = None if is_dir else renamed_from.pop(current[name][1:], None)
+                if old_name is not None:
+                    removed.remove(old_name)
+                    changes.append(Change("renamed", entry_path, False, path.join(folder_path, old_name)))
+                else:
+                    changes.append(Change("added", entry_path, is_dir))
+                    if is_dir:
+                        changes += self.snapshot(entry_path)
+            for name in sorted(removed):
+                changes.append(Change("removed", path.join(folder_path, name), previous[name][0]))
+                if previous[name][0]:
+                    self.forget(path.join(folder_path, name))
+            for name in sorted(current.keys() & previous.keys()):
+                if not current[name][0] and current[name] != previous[name]:
+                    changes.append(Change("changed", path.join(folder_path, name)))
+        return coalesce(changes + self.check_files(FILES_PER_POLL))
+
+    def check_files(self, count):
+        """ Stats up to count files, taking the folders in turn, and returns the files changed in place. """
+        changes = []
+        for _ in range(len(self.folders)):
+            if count <= 0:
+                break
+            if not self.unchecked:
+                self.unchecked = list(self.folders)
+            folder_path = self.unchecked.pop()
+            if folder_path not in self.folders:
+                continue
+            entries = self.folders[folder_path][1]
+            for name, (is_dir, mtime, size) in entries.items():
+                if is_dir:
+                    continue
+                count -= 1
+                try:
+                    file_stat = stat(path.join(folder_path, name))
+                except FileNotFoundError:
+                    continue
+                if (file_stat.st_mtime, file_stat.st_size) != (mtime, size):
+                    entries[name] = (False, file_stat.st_mtime, file_stat.st_size)
+                    changes.append(Change("changed", path.join(folder_path, name)))
+        return changes
+
+    def snapshot_folder(self, folder_path):
+        """ Records and returns the entries of one folder without the folders under it. """
+        folder_mtime = stat(folder_path).st_mtime
+        entries = {}
+        with scandir(folder_path) as scanned:
+            for entry in scanned:
+                entry_stat = entry.stat()
+                # Links to folders are not followed, a link to a folder above it would be snapshot forever
+                entries[entry.name] = (entry.is_dir(follow_symlinks=False), entry_stat.st_mtime, entry_stat.st_size)
+
+        # A folder mtime this recent is not trusted, the folder is rescanned on the next poll
+        if time() - folder_mtime < MTIME_GRACE_SECONDS:
+            folder_mtime = None
+        self.folders[folder_path] = (folder_mtime, entries)
+        return entries
+
+    def close(self):
+        """ Forgets the snapshots. """
+        self.folders.clear()
+
+def create_watcher(root):
+    """ Returns an inotify watcher on Linux, or a polling watcher if inotify is not available. """
+    if platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root)
@@ -0,0 +1,73 @@
+from os import path, mkdir, remove, rename, utime
+import pytest
+from library_watcher import Change, InotifyWatcher, PollingWatcher, coalesce
+
+OLD_MTIME = 1_000_000_000
+
+def make_music_folder(tmp_path):
+    """ Creates a music folder with one album of one music file, backdated so the polling watcher trusts it. """
+    music_dir = str(tmp_path)
+    mkdir(path.join(music_dir, "album"))
+    with open(path.join(music_dir, "album", "01 First.mp3"), "w") as music_file:
+        music_file.write("first")
+    for folder_path in (music_dir, path.join(music_dir, "album")):
+        utime(folder_path, (OLD_MTIME, OLD_MTIME))
+    return music_dir
+
+@pytest.fixture(params=[InotifyWatcher, PollingWatcher])
+def watcher_class(request):
+    """ Runs each test with both watchers. """
+    return request.param
+
+def test_added_and_removed(tmp_path, watcher_class):
+    """ Test that new folders, their music files and removed music files are reported. """
+    music_dir = make_music_folder(tmp_path)
+    watcher = watcher_class(music_dir)
+    mkdir(path.join(music_dir, "new album"))
+    with open(path.join(music_dir, "new album", "01 New.mp3"), "w"):
+        pass
+    remove(path.join(music_dir, "album", "01 First.mp3"))
+
+    changes = set(watcher.poll())
+    assert changes == {
+        Change("added", path.join(music_dir, "new album"), True),
+        Change("added", path.join(music_dir, "new album", "01 New.mp3")),
+        Change("removed", path.join(music_dir, "album", "01 First.mp3")),
+    }
+    assert watcher.poll() == []
+    watcher.close()
+
+def test_renamed(tmp_path, watcher_class):
+    """ Test that a music file renamed within its folder is reported as a rename. """
+    music_dir = make_music_folder(tmp_path)
+    watcher = watcher_class(music_dir)
+    rename(path.join(music_dir, "album", "01 First.mp3"), path.join(music_dir, "album", "01 Renamed.mp3"))
+
+    assert watcher.poll() == [Change("renamed", path.join(music_dir, "album", "01 Renamed.mp3"), False,
+                                     path.join(music_dir, "album", "01 First.mp3"))]
+    watcher.close()
+
+def test_changed_in_place(tmp_path, watcher_class):
+    """ Test that a music file rewritten in place, which leaves its folder's mtime alone, is reported as changed. """
+    music_dir = make_music_folder(tmp_path)
+    watcher = watcher_class(music_dir)
+    with open(path.join(music_dir, "album", "01 First.mp3"), "w") as music_file:
+        music_file.write("first, retagged")
+    utime(path.join(music_dir, "album"), (OLD_MTIME, OLD_MTIME))
+
+    assert watcher.poll() == [Change("changed", path.join(music_dir, "album", "01 First.mp3"))]
+    assert watcher.poll() == []
+    watcher.close()
+
+def test_coalesce():
+    """ Test that changes to the same path within a poll are merged. """
+    changes = coalesce([
+        Change("added", "/music/a.mp3"), Change("changed", "/music/a.mp3"),
+        Change("added", "/music/b.mp3"), Change("removed", "/music/b.mp3"),
+        Change("removed", "/music/c.mp3"), Change("added", "/music/c.mp3"),
+    ])
+
+    assert changes == [Change("added", "/music/a.mp3"), Change("changed", "/music/c.mp3")]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
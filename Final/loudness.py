@@ -0,0 +1,297 @@
+""" loudness.py
+
+Design:
+def fast_length
+    return the next length the FFT handles quickly
+
+def k_weighting
+    return the frequency response of the BS.1770 K-weighting filter at each FFT bin
+
+def integrated_loudness
+    K-weight each channel in the frequency domain
+    sum the mean square of the channels over 400 ms blocks, 100 ms apart
+    drop blocks below the absolute gate, then blocks below the relative gate
+    return loudness of the remaining blocks in LUFS
+
+def sample_peak
+    return the largest sample
+
+def init_worker
+    start the mixer without a sound card
+
+def decode_file
+    decode music file into float samples, None if it cannot be decoded
+
+def analyze_file
+    decode music file
+    return its loudness, peak, mtime and size
+
+def gain_of
+    return the volume that brings a track to the reference loudness without clipping
+
+class LoudnessStore:
+    def __init__
+        open index database
+        create table
+
+    def load
+        read the gain of every analyzed music file
+
+    def stale
+        return the music files that were not analyzed or changed since
+
+    def put
+        store loudness and peak of a music file and keep its gain
+
+    def gain
+        return gain of a music file, 1 if it was not analyzed
+
+    def forget
+        drop a music file that changed on disk
+
+def analyze_library
+    analyze stale music files on a process pool using every core
+    store each result as it comes back
+    return number analyzed, seconds and files per second
+
+Measures how loud each music file is, so tracks from different albums play at
+the same loudness. The loudness is the integrated loudness of ITU-R BS.1770,
+the measure ReplayGain 2.0 uses: each channel is K-weighted, its mean square is
+taken over overlapping 400 ms blocks, and quiet blocks are gated out so
+silence between songs does not count. All of it is vectorized NumPy, the
+K-weighting filter is applied as its frequency response on the FFT of a whole
+channel and the blocks are mean squares taken from a cumulative sum, so no
+Python loop runs per sample. Decoding and measuring a track is CPU bound, so
+tracks are spread over a ProcessPoolExecutor with one process per core and the
+analysis scales with the number of cores. The results are stored in the library
+index database by path, mtime and size, so a track is only analyzed again if it
+changed. The gain is applied as a volume: mixer volumes only go down to
+silence and up to full scale, so loud tracks are turned down to the reference
+and quiet tracks play at full volume.
+    python loudness.py [music folder] [--workers N]
+"""
+
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from math import log10, pi, tan
+from multiprocessing import get_context
+from os import path, environ, cpu_count, stat
+from threading import Lock
+from time import perf_counter
+
+# ReplayGain 2.0 plays every track at -18 LUFS
+REFERENCE_LOUDNESS = -18
+ANALYSIS_RATE = 44100
+BLOCK_SECONDS = 0.4
+STEP_SECONDS = 0.1
+ABSOLUTE_GATE = -70
+RELATIVE_GATE = -10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS loudness (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    size INTEGER,
+    loudness REAL,
+    peak REAL
+);
+"""
+
+def fast_length(length):
+    """ Returns the smallest length of at least length whose only prime factors are 2, 3 and 5, which the FFT handles fastest. """
+    best = 1 << (length - 1).bit_length()
+    power_of_5 = 1
+    while power_of_5 < best:
+        power_of_3 = power_of_5
+        while power_of_3 < best:
+            # Double up to the length, every candidate below the best power of two is considered
+            candidate = power_of_3
+            while candidate < length:
+                candidate *= 2
+            best = min(best, candidate)
+            power_of_3 *= 3
+        power_of_5 *= 5
+    return best
+
+def k_weighting(bins, rate):
+    """ Returns the response of the K-weighting filter at the bins of an FFT of length bins, as in libebur128. """
+    import numpy as np
+
+    # A high shelf models the head, a high pass removes the lowest frequencies
+    k = tan(pi * 1681.974450955533 / rate)
+    gain = 10 ** (3.999843853973347 / 20)
+    boost = gain ** 0.4996667741545416
+    q = 0.7071752369554196
+    a0 = 1 + k / q + k * k
+    shelf_b = ((gain + boost * k / q + k * k) / a0, 2 * (k * k - gain) / a0, (gain - boost * k / q + k * k) / a0)
+    shelf_a = (1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    k = tan(pi * 38.13547087602444 / rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    pass_b = (1, -2, 1)
+    pass_a = (1, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0)
+
+    # Evaluate both biquads on the unit circle
+    z = np.exp(-2j * np.pi * np.arange(bins // 2 + 1) / bins)
+    response = np.ones_like(z)
+    for b, a in ((shelf_b, shelf_a), (pass_b, pass_a)):
+        response *= (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+    return response.astype(np.complex64)
+
+def integrated_loudness(samples, rate=ANALYSIS_RATE):
+    """ Returns the integrated loudness in LUFS of float samples shaped (frames, channels), or None if it is silent. """
+    import numpy as np
+
+    frames = len(samples)
+    block = int(BLOCK_SECONDS * rate)
+    step = int(STEP_SECONDS * rate)
+    if frames < block:
+        return None
+
+    # K-weight each channel on its FFT, padded so the filter's tail does not wrap around to the start
+    bins = fast_length(frames + rate // 10)
+    response = k_weighting(bins, rate)
+    power = np.zeros((frames - block) // step + 1)
+    starts = np.arange(len(power)) * step
+    for channel in samples.T:
+        weighted = np.fft.irfft(np.fft.rfft(channel, bins) * response, bins)[:frames]
+        # The mean square of every block comes from two lookups in the cumulative sum of squares
+        energy = np.concatenate(([0], np.cumsum(weighted.astype(np.float64) ** 2)))
+        power += (energy[starts + block] - energy[starts]) / block
+
+    # Gate out blocks below -70 LUFS, then blocks 10 LU below the loudness of the rest
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(power)
+    power = power[block_loudness > ABSOLUTE_GATE]
+    if not len(power):
+        return None
+    relative_gate = -0.691 + 10 * log10(power.mean()) + RELATIVE_GATE
+    with np.errstate(divide="ignore"):
+        power = power[-0.691 + 10 * np.log10(power) > relative_gate]
+    return -0.691 + 10 * log10(power.mean())
+
+def sample_peak(samples):
+    """ Returns the largest absolute sample, 1 is full scale. """
+    import numpy as np
+    return float(np.abs(samples).max()) if len(samples) else 0
+
+def init_worker():
+    """ Starts the mixer in an analysis process, it only decodes so no sound card is needed. """
+    environ["SDL_AUDIODRIVER"] = "dummy"
+    environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    from pygame import mixer
+    mixer.init(frequency=ANALYSIS_RATE, size=-16, channels=2)
+
+def decode_file(music_path):
+    """ Decodes a music file into float samples shaped (frames, 2) at the analysis rate, or None if it cannot be decoded. """
+    import numpy as np
+    from pygame import error, mixer
+    if not mixer.get_init():
+        init_worker()
+
+    try:
+        sound = mixer.Sound(file=music_path)
+    except error:
+        return None
+    return np.frombuffer(sound.get_raw(), dtype=np.int16).reshape(-1, 2).astype(np.float32) / 32768
+
+def analyze_file(music_path):
+    """ Decodes a music file and returns its path, loudness, peak, mtime and size, loudness is None if it cannot be decoded. """
+    file_stat = stat(music_path)
+    samples = decode_file(music_path)
+    if samples is None:
+        return music_path, None, None, file_stat.st_mtime, file_stat.st_size
+    return music_path, integrated_loudness(samples), sample_peak(samples), file_stat.st_mtime, file_stat.st_size
+
+def gain_of(loudness, peak):
+    """ Returns the volume from 0 to 1 that brings a track to the reference loudness without clipping. """
+    if loudness is None:
+        return 1
+    gain = 10 ** ((REFERENCE_LOUDNESS - loudness) / 20)
+    if peak:
+        gain = min(gain, 1 / peak)
+    return min(gain, 1)
+
+class LoudnessStore:
+    """ The loudness and peak of every analyzed music file, kept in the library index database. """
+    def __init__(self, index_path):
+        self.connection = sqlite3.connect(index_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = Lock()
+        self.gains = {}
+
+    def close(self):
+        """ Closes the index database. """
+        with self.lock:
+            self.connection.close()
+
+    def load(self):
+        """ Reads the gain of every analyzed music file into memory, so playing a track does not query the database. """
+        with self.lock:
+            rows = self.connection.execute("SELECT path, loudness, peak FROM loudness").fetchall()
+        gains = {music_path: gain_of(loudness, peak) for music_path, loudness, peak in rows}
+        with self.lock:
+            self.gains = {**gains, **self.gains}
+        return len(gains)
+
+    def stale(self, music_paths):
+        """ Returns the music files that were never analyzed or changed since they were. """
+        with self.lock:
+            known = {music_path: (mtime, size) for music_path, mtime, size in self.connection.execute(
+                "SELECT path, mtime, size FROM loudness")}
+        stale = []
+        for music_path in music_paths:
+            try:
+                file_stat = stat(music_path)
+            except OSError:
+                continue
+            if known.get(music_path) != (file_stat.st_mtime, file_stat.st_size):
+                stale.append(music_path)
+        return stale
+
+    def put(self, music_path, loudness, peak, mtime, size):
+        """ Stores the loudness and peak of a music file. """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO loudness (path, mtime, size, loudness, peak) VALUES (?, ?, ?, ?, ?)",
+                (music_path, mtime, size, loudness, peak))
+            self.gains[music_path] = gain_of(loudness, peak)
+
+    def gain(self, music_path):
+        """ Returns the volume that normalizes a music file, 1 if it was not analyzed. """
+        return self.gains.get(music_path, 1)
+
+    def forget(self, music_path):
+        """ Drops the gain of a music file that changed on disk, it is analyzed again next time. """
+        with self.lock:
+            self.gains.pop(music_path, None)
+
+def analyze_library(store, music_paths, max_workers=None):
+    """ Analyzes the stale music files on a process pool and stores the results, returns the count, seconds and files per second. """
+    started = perf_counter()
+    stale = store.stale(music_paths)
+    if stale:
+        # Spawned processes do not inherit the threads and mixer of the player
+        workers = min(max_workers or cpu_count() or 1, len(stale))
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=init_worker) as executor:
+            for result in executor.map(analyze_file, stale, chunksize=max(1, len(stale) // (workers * 16))):
+                store.put(*result)
+    seconds = perf_counter() - started
+    return len(stale), seconds, len(stale) / seconds if seconds > 0 else 0
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from tempfile import mkdtemp
+    from library_scanner import LibraryScanner
+    parser = ArgumentParser(description="Measure the loudness of every music file in a folder.")
+    parser.add_argument("music_dir", nargs="?", default="Music")
+    parser.add_argument("--workers", type=int, default=None, help="analysis processes, one per core by default")
+    arguments = parser.parse_args()
+
+    # Measure every music file from scratch, so runs with different worker counts can be compared
+    scanner = LibraryScanner()
+    scanner.scan(arguments.music_dir)
+    store = LoudnessStore(path.join(mkdtemp(prefix="loudness_"), "loudness.db"))
+    count, seconds, files_per_second = analyze_library(store, scanner.take_batches(), arguments.workers)
+    print(f"Analyzed {count} music files in {seconds:.1f} s ({files_per_second:.1f} files/s)")
@@ -0,0 +1,53 @@
+from os import path
+from shutil import copyfile
+import pytest
+from loudness import LoudnessStore, analyze_library, gain_of, integrated_loudness
+
+np = pytest.importorskip("numpy")
+
+SAMPLE_MUSIC = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+RATE = 44100
+
+def sine(seconds, amplitude=1, frequency=997):
+    """ Returns a stereo sine with the tone in the left channel only. """
+    time = np.arange(int(seconds * RATE)) / RATE
+    samples = np.zeros((len(time), 2), np.float32)
+    samples[:, 0] = amplitude * np.sin(2 * np.pi * frequency * time)
+    return samples
+
+def test_full_scale_sine_is_minus_three():
+    """ Test that a full scale 997 Hz sine in one channel measures -3.01 LUFS, as BS.1770 specifies. """
+    assert integrated_loudness(sine(5)) == pytest.approx(-3.01, abs=0.05)
+    assert integrated_loudness(sine(5, amplitude=0.1)) == pytest.approx(-23.01, abs=0.05)
+
+def test_silence_is_gated():
+    """ Test that silence barely changes the loudness of a track, only the blocks at its edge count, and silence alone has none. """
+    padded = np.concatenate((sine(5, amplitude=0.5), np.zeros((RATE * 5, 2), np.float32)))
+    assert integrated_loudness(padded) == pytest.approx(integrated_loudness(sine(5, amplitude=0.5)), abs=0.2)
+    assert integrated_loudness(np.zeros((RATE * 2, 2), np.float32)) is None
+
+def test_gain_stays_within_full_scale():
+    """ Test that loud tracks are turned down to the reference and quiet or unknown tracks play at full volume. """
+    assert gain_of(-8, 1) == pytest.approx(10 ** (-10 / 20))
+    assert gain_of(-30, 0.5) == 1
+    assert gain_of(None, None) == 1
+
+def test_store_keeps_results(tmp_path):
+    """ Test that stored results survive a restart and unchanged music files are not analyzed again. """
+    music_path = str(tmp_path / "01.mp3")
+    copyfile(SAMPLE_MUSIC, music_path)
+    store = LoudnessStore(str(tmp_path / "index.db"))
+    assert store.stale([music_path]) == [music_path]
+
+    count, _, _ = analyze_library(store, [music_path], max_workers=1)
+    assert count == 1
+    assert 0 < store.gain(music_path) < 1
+    assert store.stale([music_path]) == []
+
+    restarted = LoudnessStore(str(tmp_path / "index.db"))
+    assert restarted.gain(music_path) == 1
+    restarted.load()
+    assert restarted.gain(music_path) == store.gain(music_path)
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,216 @@
+""" metrics.py
+
+Design:
+class LatencyMetrics:
+    def __init__
+        initialize samples, histogram and counters for each operation
+
+    def record
+        if enabled, add a latency sample for an operation and count it in its histogram bucket
+
+    def timed
+        if enabled, time a block of code and record it
+        otherwise return a block that does nothing
+
+    def count
+        if enabled, add to a counter such as bytes read
+
+    def summary
+        return count, mean, median, 95th percentile and max of each operation
+
+    def histograms
+        return how many samples of each operation fell in each bucket
+
+    def snapshot
+        return summary, histograms and counters
+
+class StallMonitor:
+    def __init__
+        initialize event loop, metrics, clock and threshold
+
+    def start / stop
+        schedule or cancel the check
+
+    def check
+        measure how late the check ran compared to when it was scheduled
+        if later than the threshold, record it as a stall
+        schedule the next check
+
+class Profiler:
+    def toggle
+        if not running, start cProfile
+        otherwise stop it and dump the stats to a file
+
+def export_stats
+    write stats as JSON through a temporary file
+
+Keeps latency samples of the player's operations, such as how long it takes to
+start playing a track or to skip to the next one. Only the most recent samples
+of each operation are kept, so the memory used stays bounded, and every sample
+is also counted in a histogram with fixed buckets, so the shape of the
+latencies over the whole session survives after old samples are dropped.
+Counters add up work such as folders listed and bytes read. When disabled,
+timed returns a shared block that does nothing and record and count return
+at once, so instrumented code costs one attribute check.
+
+Slow work on the event loop shows up as stalls: a check is scheduled every
+100 ms, and when it runs much later than it was scheduled, the event loop was
+busy for that long and the user interface did not respond. The profiler runs
+cProfile on demand and dumps its stats for pstats or snakeviz, so a slow path
+can be profiled in the running player without restarting it.
+"""
+
+import json
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from contextlib import nullcontext
+from os import path, replace
+from statistics import mean, median
+from threading import Lock
+from time import perf_counter
+
+MAX_SAMPLES = 1000
+
+# Upper bounds of the histogram buckets in milliseconds, the last bucket holds everything slower
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+STALL_INTERVAL = 100
+STALL_THRESHOLD = 0.05
+
+DEFAULT_STATS_PATH = path.join(path.dirname(path.abspath(__file__)), "player_stats.json")
+DEFAULT_PROFILE_PATH = path.join(path.dirname(path.abspath(__file__)), "player_profile.pstats")
+
+# Timing while disabled does nothing, the same block is handed out every time
+DISABLED_TIMER = nullcontext()
+
+class Timer:
+    """ Times a block of code and records it, even when the block raises. """
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, perf_counter() - self.started)
+        return False
+
+class LatencyMetrics:
+    """ Records how long the player's operations take and counts the work they do. """
+    def __init__(self, max_samples=MAX_SAMPLES, enabled=True):
+        self.enabled = enabled
+        self.samples = defaultdict(lambda: deque(maxlen=max_samples))
+        self.buckets = defaultdict(lambda: [0] * (len(HISTOGRAM_BOUNDS_MS) + 1))
+        self.counters = Counter()
+        self.lock = Lock()
+
+    def record(self, name, seconds):
+        """ Adds a latency sample for an operation. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.samples[name].append(seconds)
+            self.buckets[name][bisect_left(HISTOGRAM_BOUNDS_MS, seconds * 1000)] += 1
+
+    def timed(self, name):
+        """ Returns a block that times itself and records it as a sample for an operation. """
+        return Timer(self, name) if self.enabled else DISABLED_TIMER
+
+    def count(self, name, amount=1):
+        """ Adds to a counter, such as the number of folders listed or bytes read. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] += amount
+
+    def summary(self):
+        """ Returns the count, mean, median, 95th percentile and max of each operation in milliseconds. """
+        with self.lock:
+            samples = {name: sorted(samples) for name, samples in self.samples.items()}
+        result = {}
+        for name, ordered in samples.items():
+            result[name] = {
+                "count": len(ordered),
+                "mean_ms": mean(ordered) * 1000,
+                "median_ms": median(ordered) * 1000,
+                "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return result
+
+    def histograms(self):
+        """ Returns the number of samples of each operation in each bucket, keyed by the bucket's upper bound in milliseconds. """
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+        with self.lock:
+            return {name: dict(zip(labels, counts)) for name, counts in self.buckets.items()}
+
+    def snapshot(self):
+        """ Returns the latency summary, histograms and counters. """
+        with self.lock:
+            counters = dict(self.counters)
+        return {"latency": self.summary(), "histograms": self.histograms(), "counters": counters}
+
+class StallMonitor:
+    """ Detects when the event loop was too busy to run scheduled callbacks on time. """
+    def __init__(self, master, metrics, clock=perf_counter, interval=STALL_INTERVAL, threshold=STALL_THRESHOLD):
+        self.master = master
+        self.metrics = metrics
+        self.clock = clock
+        self.interval = interval
+        self.threshold = threshold
+        self.job = None
+        self.due = None
+
+    def start(self):
+        """ Starts checking the event loop, unless the metrics are disabled. """
+        if self.job is None and self.metrics.enabled:
+            self.due = self.clock() + self.interval / 1000
+            self.job = self.master.after(self.interval, self.check)
+
+    def stop(self):
+        """ Stops checking the event loop. """
+        if self.job is not None:
+            self.master.after_cancel(self.job)
+            self.job = None
+
+    def check(self):
+        """ Records how late the check ran if it was a stall, then schedules the next one. """
+        self.job = None
+        late = self.clock() - self.due
+        if late > self.threshold:
+            self.metrics.record("event_loop_stall", late)
+            self.metrics.count("event_loop_stalls")
+        self.start()
+
+class Profiler:
+    """ Runs cProfile on demand and dumps its stats to a file. """
+    def __init__(self):
+        self.profile = None
+
+    @property
+    def running(self):
+        """ Returns whether the profiler is running. """
+        return self.profile is not None
+
+    def toggle(self, dump_path):
+        """ Starts the profiler, or stops it and dumps its stats to a file, returns whether it is running. """
+        # cProfile is only imported when profiling is asked for
+        if self.profile is None:
+            from cProfile import Profile
+            self.profile = Profile()
+            self.profile.enable()
+            return True
+        self.profile.disable()
+        self.profile.dump_stats(dump_path)
+        self.profile = None
+        return False
+
+def export_stats(stats, stats_path):
+    """ Writes stats as JSON to a file, through a temporary file so a reader never sees half of it. """
+    with open(stats_path + ".tmp", "w") as stats_file:
+        json.dump(stats, stats_file, indent=2, sort_keys=True)
+    replace(stats_path + ".tmp", stats_path)
@@ -0,0 +1,93 @@
+import json
+import pstats
+import pytest
+from headless_loop import HeadlessLoop
+from metrics import DISABLED_TIMER, LatencyMetrics, Profiler, StallMonitor, export_stats
+
+def test_summary_of_recorded_samples():
+    """ Test the statistics reported for an operation. """
+    metrics = LatencyMetrics()
+    for milliseconds in (1, 2, 3, 4, 100):
+        metrics.record("play", milliseconds / 1000)
+    summary = metrics.summary()["play"]
+
+    assert summary["count"] == 5
+    assert summary["median_ms"] == pytest.approx(3)
+    assert summary["max_ms"] == pytest.approx(100)
+
+def test_timed_block_is_recorded():
+    """ Test that a timed block adds a sample, even when it raises. """
+    metrics = LatencyMetrics()
+    with pytest.raises(ValueError):
+        with metrics.timed("skip"):
+            raise ValueError
+
+    assert metrics.summary()["skip"]["count"] == 1
+
+def test_samples_are_bounded():
+    """ Test that only the most recent samples are kept. """
+    metrics = LatencyMetrics(max_samples=10)
+    for i in range(100):
+        metrics.record("play", i)
+
+    assert metrics.summary()["play"]["count"] == 10
+    assert metrics.summary()["play"]["max_ms"] == 99_000
+
+def test_histogram_keeps_every_sample():
+    """ Test that the histogram counts samples the bounded sample window has dropped. """
+    metrics = LatencyMetrics(max_samples=2)
+    for milliseconds in (0.5, 3, 3, 7000):
+        metrics.record("play", milliseconds / 1000)
+    histogram = metrics.histograms()["play"]
+
+    assert histogram["<=1ms"] == 1
+    assert histogram["<=5ms"] == 2
+    assert histogram[">5000ms"] == 1
+    assert sum(histogram.values()) == 4
+
+def test_disabled_metrics_record_nothing():
+    """ Test that disabled metrics hand out the shared do-nothing block and keep no samples or counts. """
+    metrics = LatencyMetrics(enabled=False)
+    with metrics.timed("play") as timer:
+        pass
+    metrics.count("bytes_read", 100)
+
+    assert metrics.timed("play") is DISABLED_TIMER
+    assert timer is None
+    assert metrics.snapshot() == {"latency": {}, "histograms": {}, "counters": {}}
+
+def test_stall_monitor_records_late_checks():
+    """ Test that a check running long after it was due is recorded as an event loop stall. """
+    loop = HeadlessLoop(virtual=True)
+    now = [0.0]
+    metrics = LatencyMetrics()
+    monitor = StallMonitor(loop, metrics, clock=lambda: now[0])
+    monitor.start()
+
+    # The first check runs on time, the second runs half a second late
+    now[0] = 0.1
+    loop.advance(0.1)
+    now[0] = 0.7
+    loop.advance(0.1)
+    monitor.stop()
+
+    assert metrics.snapshot()["counters"] == {"event_loop_stalls": 1}
+    assert metrics.summary()["event_loop_stall"]["max_ms"] == pytest.approx(500)
+
+def test_profiler_and_export_write_files(tmp_path):
+    """ Test that toggling the profiler twice dumps a profile and stats export as JSON. """
+    profiler = Profiler()
+    assert profiler.toggle(str(tmp_path / "profile.pstats"))
+    sum(range(1000))
+    assert not profiler.toggle(str(tmp_path / "profile.pstats"))
+    assert pstats.Stats(str(tmp_path / "profile.pstats")).total_calls > 0
+
+    metrics = LatencyMetrics()
+    metrics.record("play", 0.01)
+    metrics.count("bytes_read", 42)
+    export_stats(metrics.snapshot(), str(tmp_path / "stats.json"))
+    with open(tmp_path / "stats.json") as stats_file:
+        assert json.load(stats_file)["counters"] == {"bytes_read": 42}
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,47 @@
+""" mp3_frames.py
+
+Design:
+def payload_bounds
+    skip ID3v2 tag at the start of an MP3
+    skip ID3v1, extended ID3v1 and APEv2 tags at its end
+    return where its audio payload starts and ends
+
+An MP3 is a run of audio frames with tags around it: an ID3v2 tag at the
+start, which can hold album art, and ID3v1 and APEv2 tags at the end. The
+duplicate finder compares files by the frames alone and the crossfade starts
+its prefix at the first frame, so both find the frames here. The bounds are
+read from the tag headers and footers, so only a few bytes at each end of the
+file are looked at.
+"""
+
+from struct import unpack_from
+
+ID3V2_HEADER = 10
+ID3V2_FOOTER_FLAG = 0x10
+ID3V1_SIZE = 128
+ID3V1_EXTENDED_SIZE = 227
+APE_FOOTER_SIZE = 32
+APE_HEADER_FLAG = 0x80000000
+
+def payload_bounds(data, size):
+    """ Returns where the audio payload of an MP3 starts and ends, leaving out its ID3 and APE tags. """
+    start = 0
+    end = size
+
+    # An ID3v2 tag starts with "ID3", its size is a 28 bit synchsafe integer that leaves out the header and footer
+    header = data[:ID3V2_HEADER]
+    if len(header) == ID3V2_HEADER and header[:3] == b"ID3" and all(byte < 0x80 for byte in header[6:]):
+        tag_size = header[6] << 21 | header[7] << 14 | header[8] << 7 | header[9]
+        start = min(size, ID3V2_HEADER + tag_size + (ID3V2_HEADER if header[5] & ID3V2_FOOTER_FLAG else 0))
+
+    # An ID3v1 tag is the last 128 bytes, an extended one puts 227 more before it
+    if end - start >= ID3V1_SIZE and data[end - ID3V1_SIZE:end - ID3V1_SIZE + 3] == b"TAG":
+        end -= ID3V1_SIZE
+        if end - start >= ID3V1_EXTENDED_SIZE and data[end - ID3V1_EXTENDED_SIZE:end - ID3V1_EXTENDED_SIZE + 4] == b"TAG+":
+            end -= ID3V1_EXTENDED_SIZE
+
+    # An APEv2 tag ends in a footer giving its size without its header, if it has one
+    if end - start >= APE_FOOTER_SIZE and data[end - APE_FOOTER_SIZE:end - APE_FOOTER_SIZE + 8] == b"APETAGEX":
+        tag_size, _, flags = unpack_from("<III", data, end - APE_FOOTER_SIZE + 12)
+        end = max(start, end - tag_size - (APE_FOOTER_SIZE if flags & APE_HEADER_FLAG else 0))
+    return start, end
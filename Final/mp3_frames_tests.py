@@ -0,0 +1,22 @@
+from struct import pack
+import pytest
+from library_benchmark import SILENT_FRAME, id3_tag
+from mp3_frames import payload_bounds
+
+def ape_tag(text):
+    """ Returns an APEv2 tag with one item and a header. """
+    item = pack("<II", len(text), 0) + b"Title\x00" + text
+    footer = b"APETAGEX" + pack("<IIII", 2000, len(item) + 32, 1, 0x80000000) + bytes(8)
+    return footer + item + footer
+
+def test_tags_are_left_out_of_the_payload():
+    """ Test that ID3v2, ID3v1 and APEv2 tags are not part of the payload, and a file without tags is all payload. """
+    tag = id3_tag("Title", "Artist", "Album")
+    trailer = ape_tag(b"Title") + b"TAG" + bytes(125)
+    data = tag + SILENT_FRAME + trailer
+
+    assert payload_bounds(data, len(data)) == (len(tag), len(tag) + len(SILENT_FRAME))
+    assert payload_bounds(SILENT_FRAME, len(SILENT_FRAME)) == (0, len(SILENT_FRAME))
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -1,521 +1,1035 @@
-""" music_player.py
-Luke Scovel
-12/5/2023
-
-Design:
-Exceptions:
-    class MusicPlayerError:
-        init (Error_type)
-
-    class NoMusicError (MusicPlayerError):
-
-    class NoPlaylistError (MusicPlayerError):
-
-    class PlayMusicError (MusicPlayerError):
-
-    class PlaylistError (MusicPlayerError):
-
-class MusicPlayer:
-    def __init__
-        construct buttons
-        initialize variables
-        initialize pygame mixer
-        load music
-        update time elapsed label
-
-    def construct_buttons
-        construct buttons
-
-    def load_music
-        get music files in folder
-        add music files to listbox
-
-    def load_folders
-        get subdirectories in music folder
-        add subdirectories to listbox
-
-    def open_playlists
-        get playlist files in music folder
-        add playlist files to listbox
-
-    def open_folder
-        get selected folder
-        if folder is selected, open it
-        set folder path
-        raise error if folder does not exist
-        clear listbox
-        load music
-
-    def play_pause_music
-        get selected music
-        if music is selected, play it
-        if music is in playlist, get path from playlist, otherwise get path from folder
-        play music if it is not already playing, otherwise pause it
-
-    def stop_music
-        stop music
-
-    def previous_music
-        if current music is not first music in listbox, play previous music
-
-    def next_music
-        if current music is not last music in listbox, play next music
-
-    def set_volume
-        set volume of music
-    
-    def update_time_elapsed
-        if music is playing, update time elapsed label
-    
-    def add_to_playlist
-        if music is selected, add it to playlist
-        join folder path and selected music to get full path
-
-    def remove_from_playlist
-        if music is selected, remove it from playlist
-        remove music from playlist
-        refresh playlist
-
-    def open_playlist
-        if playlist is selected, load it
-        clear listbox
-        add music files to listbox
-
-    def save_playlist
-        if playlist is selected, save it
-
-    def add_new_playlist
-        create new playlist
-        clear selection and select new playlist
-
-    def remove_playlist
-        if playlist is selected, remove it
-        remove playlist
-
-    def display_metadata
-        load audio file
-        if audio file has metadata, display it
-
-Inheritance Diagram:
-+--------------------------+
-|      MusicPlayerError    |
-+--------------------------+
-| - Malfunction_type       |
-+--------------------------+
-| + __init__(...)          |
-+--------------------------+
-              |-----------------------------|---> +--------------------------+---> +--------------------------+
-+--------------------------+    +--------------------------+    |      PlayMusicError    |      |      PlaylistError      |
-|      NoMusicError        |    |      NoPlaylistError     |    +--------------------------+    +--------------------------+ 
-+--------------------------+    +--------------------------+              
-
-This program is a GUI that allows the user to select music files and play them.
-The user can also create playlists and add music to them.
- """
-
-def install_dependencies():
-    """ Installs the dependencies for the program. """
-    check_call([executable, '-m', 'pip', 'install', 'pygame', 'eyed3'])
-
-from subprocess import check_call
-from sys import executable
-from os import path, listdir, remove
-import tkinter as tk
-
-install_dependencies()
-from pygame import mixer
-import eyed3
-
-class MusicPlayerError(Exception):
-    """ A custom exception for the MusicPlayer class. """
-    def __init__(self, Error_type):
-        self.Malfunction_type = Error_type
-        super().__init__(f"WARNING: {Error_type}")
-
-class NoMusicError(MusicPlayerError):
-    """ A custom exception for the MusicPlayer class. """
-    def __init__(self):
-        super().__init__("No music found.")
-
-class NoPlaylistError(MusicPlayerError):
-    """ A custom exception for the MusicPlayer class. """
-    def __init__(self):
-        super().__init__("No playlist found.")
-
-class PlayMusicError(MusicPlayerError):
-    """ A custom exception for the MusicPlayer class. """
-    def __init__(self):
-        super().__init__("Unable to play music, file may be missing.")
-
-class PlaylistError(MusicPlayerError):
-    """ A custom exception for the MusicPlayer class. """
-    def __init__(self):
-        super().__init__("Unable to load playlist.")
-
-class MusicPlayer:
-    def __init__(self, master):
-        """ Initializes the GUI. """
-        # Construct the buttons
-        self.construct_buttons(master)
-
-        # Initialize the variables
-        self.playlist = []
-        self.playlist_index = 0
-        self.paused = False
-        self.current_music = None
-        self.music_dir = path.join(path.dirname(__file__), "music/")
-
-        # Initialize Pygame mixer
-        mixer.init()
-
-        # Load the music
-        self.load_folders()
-        self.open_playlists()
-
-        # Update the time elapsed label
-        self.update_time_elapsed()
-
-    def construct_buttons(self, master):
-        """ Constructs the buttons for the GUI. """
-        self.master = master
-        self.master.title("Music Player")
-
-        # Music listbox and buttons
-        self.music_listbox = tk.Listbox(self.master, selectmode="single", selectbackground="black", width=50, height=15)
-        self.music_listbox.grid(column=0, row=0, padx=5, pady=5, columnspan=2, sticky="ns")
-
-        self.playlist_listbox = tk.Listbox(self.master, selectmode="single", selectbackground="black", width=50, height=15)
-        self.playlist_listbox.grid(column=3, row=0, padx=5, pady=5, columnspan=2, sticky="ns")
-
-        self.load_music_button = tk.Button(self.master, text="Refresh Music", command=self.load_folders)
-        self.load_music_button.grid(column=0, row=1, sticky=tk.E, pady=5)
-
-        self.open_folder_button = tk.Button(self.master, text="Open Folder", command=self.open_folder)
-        self.open_folder_button.grid(column=1, row=1, sticky=tk.W, pady=5)
-
-        # Music control buttons
-        self.play_button = tk.Button(self.master, text="Play/Pause", command=self.play_pause_music)
-        self.play_button.grid(column=0, row=2, sticky=tk.E, pady=5)
-
-        self.stop_button = tk.Button(self.master, text="Stop", command=self.stop_music)
-        self.stop_button.grid(column=1, row=2, sticky=tk.W, pady=5)
-
-        self.previous_button = tk.Button(self.master, text="Previous", command=self.previous_music)
-        self.previous_button.grid(column=0, row=3, sticky=tk.E, pady=5)
-
-        self.next_button = tk.Button(self.master, text="Next", command=self.next_music)
-        self.next_button.grid(column=1, row=3, sticky=tk.W, pady=5)
-
-        self.volume_scale = tk.Scale(self.master, from_=0, to=100, orient=tk.HORIZONTAL, label="Volume", length=200, command=self.set_volume)
-        self.volume_scale.set(100)
-        self.volume_scale.grid(column=0, row=4, columnspan=2)
-
-        # Metadata and time elapsed labels
-        self.metadata_label = tk.Label(self.master, text="")
-        self.metadata_label.grid(column=0, row=5, columnspan=2, pady=5)
-
-        self.time_elapsed_label = tk.Label(self.master, text="Time Elapsed: ")
-        self.time_elapsed_label.grid(column=0, row=6, columnspan=2, pady=5)
-
-        # Playlist buttons
-        self.refresh_playlist_button = tk.Button(self.master, text="Refresh Playlist", command=self.open_playlists)
-        self.refresh_playlist_button.grid(column=3, row=1, sticky=tk.E, pady=5)
-
-        self.open_playlist_button = tk.Button(self.master, text="Open Playlist", command=self.open_playlist)
-        self.open_playlist_button.grid(column=4, row=1, sticky=tk.W, pady=5)
-
-        self.add_new_playlist_button = tk.Button(self.master, text="Add New Playlist", command=self.add_new_playlist)
-        self.add_new_playlist_button.grid(column=3, row=2, sticky=tk.E, pady=5)
-
-        self.remove_playlist_button = tk.Button(self.master, text="Remove Playlist", command=self.remove_playlist)
-        self.remove_playlist_button.grid(column=4, row=2, sticky=tk.W, pady=5)
-
-        self.add_to_playlist_button = tk.Button(self.master, text="Add to Playlist", command=self.add_to_playlist)
-        self.add_to_playlist_button.grid(column=3, row=3, sticky=tk.E, pady=5)
-
-        self.remove_from_playlist_button = tk.Button(self.master, text="Remove from Playlist", command=self.remove_from_playlist)
-        self.remove_from_playlist_button.grid(column=4, row=3, sticky=tk.W, pady=5)
-
-        self.save_playlist_button = tk.Button(self.master, text="Save Playlist", command=self.save_playlist)
-        self.save_playlist_button.grid(column=3, row=4, columnspan=2, pady=5)
-
-        self.current_playlist_label = tk.Label(self.master, text="Current Playlist: ")
-        self.current_playlist_label.grid(column=3, row=5, columnspan=2, pady=5)
-
-    def load_music(self):
-        """ Loads the music files in the folder into the listbox. """
-        # Clear the listbox
-        self.music_listbox.delete(0, "end")
-
-        # Get the music files in the folder
-        music_files = [f for f in listdir(self.folder_path) if f.endswith(".mp3")]
-
-        if not music_files:
-            raise NoMusicError
-
-        # Add the music files to the listbox
-        for music_file in music_files:
-            self.music_listbox.insert("end", music_file)
-
-        # Select the first item in the listbox
-        self.music_listbox.selection_set(0)
-        
-
-    def load_folders(self):
-        """ Loads the subdirectories in the music folder into the listbox. """
-        # Clear the listbox
-        self.music_listbox.delete(0, "end")
-
-        # Get the subdirectories in the music folder
-        subdirectories = [d for d in listdir(self.music_dir) if path.isdir(path.join(self.music_dir, d))]
-
-        if not subdirectories:
-            raise NoMusicError
-
-        # Add the subdirectories to the listbox
-        for subdirectory in subdirectories:
-            self.music_listbox.insert("end", subdirectory)
-
-        # Select the first item in the listbox
-        self.music_listbox.selection_set(0)
-
-    def open_playlists(self):
-        """ Loads the playlist files in the music folder into the listbox. """
-
-        # Clear the listbox
-        self.playlist_listbox.delete(0, "end")
-
-        # Get the playlist files in the music folder
-        playlist_files = [f for f in listdir(self.music_dir) if f.endswith(".txt")]
-
-        # Add the playlist files to the listbox
-        for playlist_file in playlist_files:
-            self.playlist_listbox.insert("end", playlist_file)
-
-        # Select the first item in the listbox
-        self.playlist_listbox.selection_set(0)
-
-    def open_folder(self):
-        """ Opens the selected folder. """
-        # Get the selected folder
-        selected_index = self.music_listbox.curselection()
-
-        # Turn off playlist mode
-        self.playlist_mode = False
-
-        # If a folder is selected, open it
-        if selected_index:
-            selected_folder = self.music_listbox.get(selected_index)
-            # If the selected folder is not a music file, open it
-            if not selected_folder.endswith(".mp3"):
-                # Set the folder path
-                self.folder_path = path.join(self.music_dir, selected_folder)
-
-                # Raise an error if the folder does not exist
-                if not path.exists(self.folder_path):
-                    raise NoMusicError
-                
-                # Clear the listbox
-                self.music_listbox.delete(0, "end")
-                # Load the music
-                self.load_music()
-
-    def play_pause_music(self):
-        """ Plays or pauses the music. """
-        try:
-            # Get the selected music
-            selected_index = self.music_listbox.curselection()
-
-            # If a music is selected, play it
-            if selected_index:
-                selected_music = self.music_listbox.get(selected_index)
-
-                # If the music is in a playlist, get the path from the playlist, otherwise get the path from the folder
-                if not self.playlist_mode:
-                    music_path = path.join(self.folder_path, selected_music)
-                else:
-                    music_path = self.playlist[selected_index[0]]
-
-                # Play the music if it is not already playing, otherwise pause it
-                if self.current_music != music_path:
-                    mixer.music.load(music_path)
-                    mixer.music.play()
-                    self.current_music = music_path
-                    self.display_metadata(music_path)
-                    self.paused = False
-                elif self.paused:
-                    mixer.music.unpause()
-                    self.paused = False
-                else:
-                    mixer.music.pause()
-                    self.paused = True
-
-            # Update the time elapsed label
-            self.update_time_elapsed()
-        except:
-            raise PlayMusicError
-
-    def stop_music(self):
-        """ Stops the music. """
-        mixer.music.stop()
-        self.paused = False
-
-    def previous_music(self):
-        """ Plays the previous music in the list box. """
-        # If the current music is not the first music in the list box, play the previous music
-        self.music_listbox.selection_set(first=self.music_listbox.curselection()[0]-1)
-        if len(self.music_listbox.curselection()) != 1:
-            self.music_listbox.selection_clear(first=self.music_listbox.curselection()[1])
-        self.play_pause_music()
-
-    def next_music(self):
-        """ Plays the next music in the list box. """
-        # If the current music is not the last music in the list box, play the next music
-        self.music_listbox.selection_set(first=self.music_listbox.curselection()[0]+1)
-        if len(self.music_listbox.curselection()) != 1:
-            self.music_listbox.selection_clear(first=self.music_listbox.curselection()[0])
-        self.play_pause_music()
-
-    def set_volume(self, event):
-        """ Sets the volume of the music. """
-        mixer.music.set_volume(self.volume_scale.get()/100)
-
-    def update_time_elapsed(self):
-        """ Updates the time elapsed label. """
-        # If the music is playing, update the time elapsed label
-        if mixer.music.get_busy():
-            current_time = mixer.music.get_pos() / 1000
-            minutes, seconds = divmod(int(current_time), 60)
-            self.time_elapsed_label.config(text="Time Elapsed: {:02d}:{:02d}".format(minutes, seconds))
-            self.master.after(1000, self.update_time_elapsed)
-
-    def add_to_playlist(self):
-        """ Adds the selected music to the playlist. """
-        # Get the selected music
-        selected_index = self.music_listbox.curselection()
-
-        # If a music is selected, add it to the playlist
-        if selected_index:
-            selected_music = self.music_listbox.get(selected_index)
-            # Join the folder path and the selected music to get the full path
-            music_path = path.join(self.folder_path, selected_music)
-            self.playlist.append(music_path)
-
-    def remove_from_playlist(self):
-        """ Removes the selected music from the playlist. """
-        # Get the selected music
-        selected_index = self.music_listbox.curselection()
-
-        # If a music is selected, remove it from the playlist
-        if selected_index and self.playlist_mode:
-            selected_music = self.music_listbox.get(selected_index)
-            
-            # Remove the music from the playlist
-            for music in self.playlist:
-                if selected_music in path.basename(music):
-                    self.playlist.remove(music)
-                    break
-
-            # Refresh the playlist
-            self.save_playlist()
-            self.music_listbox.delete(selected_index)
-
-    def open_playlist(self):
-        """ Loads the selected playlist. """
-        # Get the selected playlist
-        selected_index = self.playlist_listbox.curselection()
-
-        # Turn on playlist mode
-        self.playlist_mode = True
-
-        # If a playlist is selected, load it
-        if selected_index:
-            self.selected_playlist = self.playlist_listbox.get(selected_index)
-            playlist_path = path.join(self.music_dir, self.selected_playlist)
-            with open(playlist_path, "r") as playlist_file:
-                self.playlist = playlist_file.read().splitlines()
-
-            if not path.exists(playlist_path):
-                raise PlaylistError(f"Playlist file not found: {playlist_path}")
-
-            #Clear the listbox
-            self.music_listbox.delete(0, "end")
-
-            # Add the music files to the listbox
-            for music in self.playlist:
-                self.music_listbox.insert("end", path.basename(music))
-
-            # Select the first item in the listbox
-            self.music_listbox.selection_set(0)
-
-            # Update the current playlist label
-            self.current_playlist_label.config(text=f"Current Playlist: {self.selected_playlist}")
-
-    def save_playlist(self):
-        """ Saves the current playlist. """
-        # Get the selected playlist
-        if self.selected_playlist:
-            playlist_path = path.join(self.music_dir, self.selected_playlist)
-            # Save the playlist
-            with open(playlist_path, "w") as playlist_file:
-                for music in self.playlist:
-                    playlist_file.write(music + "\n")
-
-    def add_new_playlist(self):
-        """ Adds a new playlist. """
-        # Create a new playlist
-        self.playlist_listbox.insert("end", f"Playlist {self.playlist_listbox.size()+1}.txt")
-
-        # Clear the selection and select the new playlist
-        self.playlist_listbox.selection_clear(0, "end")
-        self.playlist_listbox.selection_set("end")
-        self.playlist = []
-
-        playlist_path = path.join(self.music_dir, f"Playlist {self.playlist_listbox.size()}.txt")
-
-        with open(playlist_path, "w") as playlist_file:
-            pass
-
-        self.open_playlist()
-
-    def remove_playlist(self):
-        """ Removes the selected playlist. """
-        try:
-            # Get the selected playlist
-            selected_index = self.playlist_listbox.curselection()
-
-            # If a playlist is selected, remove it
-            if selected_index:
-                selected_playlist = self.playlist_listbox.get(selected_index)
-                playlist_path = path.join(self.music_dir, selected_playlist)
-                # Remove the playlist
-                if path.exists(playlist_path):
-                    self.playlist_listbox.delete(selected_index)
-                    self.selected_playlist = None
-                    self.playlist = []
-                    self.current_playlist_label.config(text="Current Playlist: ")
-
-                    remove(playlist_path)
-        except FileNotFoundError:
-            raise PlaylistError
-
-    def display_metadata(self, file_path):
-        """ Displays the metadata of the selected music. """
-        # Load the audio file
-        audio_file = eyed3.load(file_path)
-
-        # If the audio file has metadata, display it
-        if audio_file.tag:
-            title = audio_file.tag.title
-            artist = audio_file.tag.artist
-            album = audio_file.tag.album
-            duration = audio_file.info.time_secs
-
-            # Display the metadata
-            metadata_text = f"Title: {title}\nArtist: {artist}\nAlbum: {album}\nDuration: {int(duration)} seconds"
-            self.metadata_label.config(text=metadata_text)
-
-if __name__ == "__main__":
-    root = tk.Tk()
-    music_player = MusicPlayer(root)
+""" music_player.py
+Luke Scovel
+12/5/2023
+
+Design:
+Exceptions:
+    class MusicPlayerError:
+        init (Error_type)
+
+    class NoMusicError (MusicPlayerError):
+
+    class NoPlaylistError (MusicPlayerError):
+
+    class PlayMusicError (MusicPlayerError):
+
+    class PlaylistError (MusicPlayerError):
+
+class MusicPlayer:
+    def __init__
+        construct buttons
+        initialize variables
+        start player engine with the pygame audio backend, a thumbnail folder and a waveform folder
+        follow the engine's track, metadata, album art, waveform, search, volume and playlist events
+        load music
+        update time elapsed label
+
+    def construct_buttons
+        construct buttons
+
+    def load_music
+        time it
+        scan music files in folder and the folders under it on the engine
+        show music files as they are found
+
+    def show_music
+        insert music files found in sorted position, relative to the opened folder
+        select the first music file
+
+    def load_folders
+        scan music folder on the engine
+        show folders as their music files are found
+
+    def show_folders
+        insert folders holding the music files found in sorted position, relative to the music folder
+        select the first folder
+
+    def scan_music
+        empty the music listbox
+        scan folder on the engine, showing each batch of music files found
+
+    def finish_scan
+        show how many music files were found and how fast
+        raise error if there are no music files
+
+    def open_playlists
+        get playlist files in music folder from the engine in the background
+        show playlists
+
+    def show_playlists
+        put playlist files in listbox in one step
+
+    def open_folder
+        get selected folder
+        if folder is selected, open it
+        set folder path
+        load music, raise error if folder does not exist
+
+    def show_library_changes
+        if the library watcher lost track of the changes, or a shown folder was removed or renamed, reload the listboxes
+        otherwise insert or remove what was added, removed or renamed
+
+    def update_views
+        if a playlist file changed, update the playlist listbox
+        if a music file changed under the opened folder, update it
+        if a music file was added in a folder not yet listed, list the folder
+
+    def update_listbox
+        insert or remove a name in sorted position, in the listbox or in the listing it hides
+        if the listbox holds the music being played, keep the engine on the same music
+
+    def search_music
+        if query is empty, show the folder or playlist shown before searching
+        otherwise search the engine's index on every keystroke
+        put matching music files in listbox
+
+    def play_pause_music
+        time it
+        get selected music
+        if music is selected, play it
+        if music is a search result or in playlist, it is the path, otherwise get path from folder
+        if music is not already playing, give the listbox to the engine as the music being played and play it
+        otherwise pause or resume it
+        raise error if the music file cannot be played
+
+    def follow_music
+        if listbox still shows the music being played, select the music the engine moved on to
+
+    def stop_music
+        stop music
+
+    def previous_music
+        if music is playing, play previous music in the engine's play order
+        otherwise if selected music is not first music in listbox, select and play previous music
+
+    def next_music
+        if music is playing, play next music in the engine's play order
+        otherwise if selected music is not last music in listbox, select and play next music
+
+    def set_shuffle / set_repeat
+        set play order of the engine
+
+    def set_volume
+        set volume of music and crossfade
+
+    def show_volume
+        move volume slider to the engine's volume, which the remote control may have set
+
+    def set_crossfade
+        set crossfade overlap, zero turns crossfade off
+
+    def analyze_loudness
+        measure loudness of the music files on the engine
+        show how many music files were measured and how fast
+    
+    def schedule_time_elapsed
+        when playback changes, update time elapsed label right away
+
+    def update_time_elapsed
+        show playback clock position and duration
+        move position slider unless the user is dragging it
+        move waveform cursor
+        while music is playing, refresh at 10 Hz if the window is visible, otherwise once a second
+
+    def start_seek / seek_music
+        when the user releases the position slider, seek music to it
+
+    def show_waveform
+        draw a line from the smallest to the largest sample of each bucket
+        add the position cursor
+
+    def clear_waveform
+        remove waveform when playback stops
+
+    def seek_waveform
+        seek music to the clicked fraction of its duration
+    
+    def add_to_playlist
+        if music is selected, add it to playlist
+        join folder path and selected music to get full path
+        append edit to playlist journal
+
+    def remove_from_playlist
+        if music is selected, remove its entry from playlist by entry ID
+        append edit to playlist journal
+
+    def show_playlist_change
+        if the open playlist is shown, remove and insert the entry the engine added, removed or moved
+
+    def show_playlist_page / load_playlist_page
+        if the open playlist is shown, insert the page of entries the engine read
+        when the listbox is scrolled near the end, have the engine read the next page
+
+    def open_playlist
+        time it
+        if playlist is selected, have the engine load it in the background
+        show playlist
+
+    def show_playlist
+        put entry IDs of the first page of playlist in listbox in one step
+        show them by their #EXTINF title and duration, or by their file names
+
+    def save_playlist
+        if playlist is selected, compact its journal into the playlist file
+
+    def add_new_playlist
+        create new playlist
+        clear selection and select new playlist
+        leave the playlist shown
+
+    def remove_playlist
+        if playlist is selected, remove it
+        remove playlist and its journal
+        leave the playlist shown
+
+    def clear_playlist
+        forget the playlist shown, leave playlist mode and empty the listbox of its entry IDs
+
+    def show_metadata
+        time it
+        if audio file has metadata, display it
+
+    def toggle_profiler
+        start profiling on the engine, or stop it and write the profile
+        show which in the status label
+
+    def export_stats
+        write the engine's stats to a file
+        show where in the status label
+
+    def show_album_art
+        show album art thumbnail beside metadata, or no image if there is none
+
+def format_time
+    return seconds as minutes and seconds
+
+Inheritance Diagram:
++--------------------------+
+|      MusicPlayerError    |
++--------------------------+
+| - Malfunction_type       |
++--------------------------+
+| + __init__(...)          |
++--------------------------+
+              |-----------------------------|---> +--------------------------+---> +--------------------------+
++--------------------------+    +--------------------------+    |      PlayMusicError    |      |      PlaylistError      |
+|      NoMusicError        |    |      NoPlaylistError     |    +--------------------------+    +--------------------------+ 
++--------------------------+    +--------------------------+              
+
+This program is a GUI that allows the user to select music files and play them.
+The user can also create playlists and add music to them. The library, queue and
+transport live in the PlayerEngine, the window only shows its state and forwards
+the user's actions to it. Started with --remote, the player can also be
+controlled by other programs on this machine through the RemoteControl, and
+the window follows what they do through the same engine events.
+ """
+
+def check_dependencies():
+    """ Raises an error if the dependencies for the program are not installed. """
+    # find_spec only looks the modules up, importing them is left until they are needed
+    missing = [module for module in ("pygame", "eyed3") if find_spec(module) is None]
+    if missing:
+        raise ImportError(f"Missing dependencies, install them with: pip install {' '.join(missing)}")
+
+from bisect import bisect_left
+from importlib.util import find_spec
+from os import path
+from sys import argv
+import tkinter as tk
+
+check_dependencies()
+
+from album_art import DEFAULT_THUMBNAIL_DIR
+from audio_backend import PygameBackend
+from metrics import DEFAULT_PROFILE_PATH
+from player_engine import PlayerEngine, default_music_dir
+from playlist_formats import is_playlist_file
+from playlist_model import REPEAT_ALL, REPEAT_OFF, REPEAT_ONE, PlaylistModel
+from remote_control import RemoteControl
+from virtual_listbox import VirtualListbox
+from waveform import DEFAULT_WAVEFORM_DIR, WAVEFORM_WIDTH
+
+# How often the time elapsed label is refreshed while music plays, with the window visible or hidden
+TIME_ELAPSED_INTERVAL = 100
+HIDDEN_TIME_ELAPSED_INTERVAL = 1000
+
+# Height of the waveform strip in pixels, it is one pixel wide per bucket
+WAVEFORM_HEIGHT = 48
+
+class MusicPlayerError(Exception):
+    """ A custom exception for the MusicPlayer class. """
+    def __init__(self, Error_type):
+        self.Malfunction_type = Error_type
+        super().__init__(f"WARNING: {Error_type}")
+
+class NoMusicError(MusicPlayerError):
+    """ A custom exception for the MusicPlayer class. """
+    def __init__(self):
+        super().__init__("No music found.")
+
+class NoPlaylistError(MusicPlayerError):
+    """ A custom exception for the MusicPlayer class. """
+    def __init__(self):
+        super().__init__("No playlist found.")
+
+class PlayMusicError(MusicPlayerError):
+    """ A custom exception for the MusicPlayer class. """
+    def __init__(self):
+        super().__init__("Unable to play music, file may be missing.")
+
+class PlaylistError(MusicPlayerError):
+    """ A custom exception for the MusicPlayer class. """
+    def __init__(self):
+        super().__init__("Unable to load playlist.")
+
+class MusicPlayer:
+    def __init__(self, master):
+        """ Initializes the GUI. """
+        # Construct the buttons
+        self.construct_buttons(master)
+
+        # Initialize the variables
+        self.playlist = PlaylistModel()
+        self.playlist_info = {}
+        self.selected_playlist = None
+        self.playlist_index = 0
+        self.playlist_mode = False
+        self.search_mode = False
+        self.browse_view = None
+        self.shown_folder = None
+        self.scan_items = None
+        self.album_art_image = None
+        self.waveform_duration = 0
+        self.music_dir = default_music_dir()
+
+        # Start the player engine, the window only shows its state and forwards the user's actions
+        self.engine = PlayerEngine(self.master, PygameBackend(), self.music_dir, thumbnail_dir=DEFAULT_THUMBNAIL_DIR,
+                                   waveform_dir=DEFAULT_WAVEFORM_DIR)
+        self.tasks = self.engine.tasks
+        self.metrics = self.engine.metrics
+        self.engine.subscribe("track", self.follow_music)
+        self.engine.subscribe("metadata", self.show_metadata)
+        self.engine.subscribe("album_art", self.show_album_art)
+        self.engine.subscribe("waveform", self.show_waveform)
+        self.engine.subscribe("stopped", self.clear_waveform)
+        self.engine.subscribe("finished", self.clear_waveform)
+        self.engine.subscribe("search_ready", self.search_music)
+        self.engine.subscribe("library_changed", self.show_library_changes)
+        self.engine.subscribe("volume", self.show_volume)
+        self.engine.subscribe("playlist_changed", self.show_playlist_change)
+        self.engine.subscribe("playlist_page", self.show_playlist_page)
+
+        # The time elapsed label is refreshed while music plays and whenever playback changes
+        self.time_elapsed_job = None
+        self.seeking = False
+        for event in ("track", "metadata", "paused", "unpaused", "seeked", "stopped", "finished"):
+            self.engine.subscribe(event, self.schedule_time_elapsed)
+
+        # Load the music
+        self.load_folders()
+        self.open_playlists()
+
+        # Update the time elapsed label
+        self.update_time_elapsed()
+
+    @property
+    def current_music(self):
+        """ Returns the path of the playing music. """
+        return self.engine.current_music
+
+    @property
+    def paused(self):
+        """ Returns whether the music is paused. """
+        return self.engine.paused
+
+    @property
+    def queued_index(self):
+        """ Returns the index of the music queued behind the playing one. """
+        return self.engine.queued_index
+
+    def construct_buttons(self, master):
+        """ Constructs the buttons for the GUI. """
+        self.master = master
+        self.master.title("Music Player")
+
+        # Music listbox and buttons, the listboxes only materialize their visible rows
+        self.music_listbox = VirtualListbox(self.master, selectmode="single", selectbackground="black", width=50, height=15)
+        self.music_listbox.grid(column=0, row=0, padx=5, pady=5, columnspan=2, sticky="ns")
+        self.music_listbox.near_end = self.load_playlist_page
+
+        self.playlist_listbox = VirtualListbox(self.master, selectmode="single", selectbackground="black", width=50, height=15)
+        self.playlist_listbox.grid(column=3, row=0, padx=5, pady=5, columnspan=2, sticky="ns")
+
+        self.load_music_button = tk.Button(self.master, text="Refresh Music", command=self.load_folders)
+        self.load_music_button.grid(column=0, row=1, sticky=tk.E, pady=5)
+
+        self.open_folder_button = tk.Button(self.master, text="Open Folder", command=self.open_folder)
+        self.open_folder_button.grid(column=1, row=1, sticky=tk.W, pady=5)
+
+        # Music control buttons
+        self.play_button = tk.Button(self.master, text="Play/Pause", command=self.play_pause_music)
+        self.play_button.grid(column=0, row=2, sticky=tk.E, pady=5)
+
+        self.stop_button = tk.Button(self.master, text="Stop", command=self.stop_music)
+        self.stop_button.grid(column=1, row=2, sticky=tk.W, pady=5)
+
+        self.previous_button = tk.Button(self.master, text="Previous", command=self.previous_music)
+        self.previous_button.grid(column=0, row=3, sticky=tk.E, pady=5)
+
+        self.next_button = tk.Button(self.master, text="Next", command=self.next_music)
+        self.next_button.grid(column=1, row=3, sticky=tk.W, pady=5)
+
+        self.volume_scale = tk.Scale(self.master, from_=0, to=100, orient=tk.HORIZONTAL, label="Volume", length=200, command=self.set_volume)
+        self.volume_scale.set(100)
+        self.volume_scale.grid(column=0, row=4, columnspan=2)
+
+        # Metadata and time elapsed labels
+        self.metadata_label = tk.Label(self.master, text="")
+        self.metadata_label.grid(column=0, row=5, columnspan=2, pady=5)
+
+        self.time_elapsed_label = tk.Label(self.master, text="Time Elapsed: ")
+        self.time_elapsed_label.grid(column=0, row=6, columnspan=2, pady=5)
+
+        # Position slider, dragging it seeks the music
+        self.position_scale = tk.Scale(self.master, from_=0, to=0, orient=tk.HORIZONTAL, label="Position", length=200, showvalue=0, resolution=0.1)
+        self.position_scale.grid(column=0, row=8, columnspan=2)
+        self.position_scale.bind("<ButtonPress-1>", self.start_seek)
+        self.position_scale.bind("<ButtonRelease-1>", self.seek_music)
+
+        # Waveform of the playing music, clicking it seeks the music
+        self.waveform_canvas = tk.Canvas(self.master, width=WAVEFORM_WIDTH, height=WAVEFORM_HEIGHT, background="white", highlightthickness=0)
+        self.waveform_canvas.grid(column=0, row=9, columnspan=2, pady=5)
+        self.waveform_canvas.bind("<Button-1>", self.seek_waveform)
+
+        # Play order of the queue, shuffled or not and repeating all, one or none
+        self.shuffle_enabled = tk.BooleanVar(self.master, False)
+        self.shuffle_button = tk.Checkbutton(self.master, text="Shuffle", variable=self.shuffle_enabled, command=self.set_shuffle)
+        self.shuffle_button.grid(column=3, row=9, sticky=tk.E, pady=5)
+
+        self.repeat_mode = tk.StringVar(self.master, REPEAT_OFF)
+        self.repeat_menu = tk.OptionMenu(self.master, self.repeat_mode, REPEAT_OFF, REPEAT_ALL, REPEAT_ONE, command=self.set_repeat)
+        self.repeat_menu.grid(column=4, row=9, sticky=tk.W, pady=5)
+
+        # Playlist buttons
+        self.refresh_playlist_button = tk.Button(self.master, text="Refresh Playlist", command=self.open_playlists)
+        self.refresh_playlist_button.grid(column=3, row=1, sticky=tk.E, pady=5)
+
+        self.open_playlist_button = tk.Button(self.master, text="Open Playlist", command=self.open_playlist)
+        self.open_playlist_button.grid(column=4, row=1, sticky=tk.W, pady=5)
+
+        self.add_new_playlist_button = tk.Button(self.master, text="Add New Playlist", command=self.add_new_playlist)
+        self.add_new_playlist_button.grid(column=3, row=2, sticky=tk.E, pady=5)
+
+        self.remove_playlist_button = tk.Button(self.master, text="Remove Playlist", command=self.remove_playlist)
+        self.remove_playlist_button.grid(column=4, row=2, sticky=tk.W, pady=5)
+
+        self.add_to_playlist_button = tk.Button(self.master, text="Add to Playlist", command=self.add_to_playlist)
+        self.add_to_playlist_button.grid(column=3, row=3, sticky=tk.E, pady=5)
+
+        self.remove_from_playlist_button = tk.Button(self.master, text="Remove from Playlist", command=self.remove_from_playlist)
+        self.remove_from_playlist_button.grid(column=4, row=3, sticky=tk.W, pady=5)
+
+        self.save_playlist_button = tk.Button(self.master, text="Save Playlist", command=self.save_playlist)
+        self.save_playlist_button.grid(column=3, row=4, columnspan=2, pady=5)
+
+        self.current_playlist_label = tk.Label(self.master, text="Current Playlist: ")
+        self.current_playlist_label.grid(column=3, row=5, columnspan=2, pady=5)
+
+        # Crossfade overlap, zero turns crossfade off
+        self.crossfade_scale = tk.Scale(self.master, from_=0, to=10, orient=tk.HORIZONTAL, label="Crossfade (seconds)", length=200, command=self.set_crossfade)
+        self.crossfade_scale.grid(column=3, row=6, columnspan=2)
+
+        # Search box, the music listbox shows the matches as the user types
+        self.search_text = tk.StringVar(self.master)
+        self.search_text.trace_add("write", self.search_music)
+        self.search_label = tk.Label(self.master, text="Search: ")
+        self.search_label.grid(column=0, row=7, sticky=tk.E, pady=5)
+        self.search_entry = tk.Entry(self.master, textvariable=self.search_text, width=30)
+        self.search_entry.grid(column=1, row=7, sticky=tk.W, pady=5)
+
+        # Progress of the library scan and loudness analysis
+        self.status_label = tk.Label(self.master, text="")
+        self.status_label.grid(column=3, row=7, columnspan=2, pady=5)
+
+        # Measuring loudness lets every music file play at the same loudness
+        self.analyze_loudness_button = tk.Button(self.master, text="Normalize Loudness", command=self.analyze_loudness)
+        self.analyze_loudness_button.grid(column=3, row=8, columnspan=2, pady=5)
+
+        # F11 profiles the player until it is pressed again, F12 writes the stats
+        self.master.bind("<F11>", self.toggle_profiler)
+        self.master.bind("<F12>", self.export_stats)
+
+    def load_music(self):
+        """ Loads the music files in the folder and the folders under it into the listbox. """
+        with self.metrics.timed("load_music"):
+            # Turn off playlist and search mode
+            self.playlist_mode = False
+            self.search_mode = False
+            self.shown_folder = path.normpath(self.folder_path)
+
+            # Find the music files in the background, they are shown as they are found
+            self.scan_music(self.folder_path, self.show_music)
+
+    def show_music(self, music_paths):
+        """ Shows music files found under the opened folder in the listbox. """
+        # Music files in the folders under the opened folder are shown by their path from it
+        for music_path in music_paths:
+            self.update_listbox(self.music_listbox, path.relpath(music_path, self.shown_folder), insert=True,
+                                items=self.scan_items)
+
+        # Select the first item in the listbox
+        if self.music_listbox.items is self.scan_items and not self.music_listbox.curselection():
+            self.music_listbox.selection_set(0)
+
+    def show_music_error(self, error):
+        """ Raises an error if the folder could not be listed. """
+        raise NoMusicError from error
+
+    def load_folders(self):
+        """ Loads the folders holding music under the music folder into the listbox. """
+        self.search_mode = False
+        self.shown_folder = None
+
+        # Find the music files in the background, their folders are shown as they are found
+        self.scan_music(self.music_dir, self.show_folders)
+
+    def show_folders(self, music_paths):
+        """ Shows the folders of music files found under the music folder in the listbox. """
+        # Folders are shown by their path from the music folder, however deeply they are nested
+        music_dir = path.normpath(self.music_dir)
+        for folder_path in {path.dirname(music_path) for music_path in music_paths} - {music_dir}:
+            self.update_listbox(self.music_listbox, path.relpath(folder_path, music_dir), insert=True,
+                                items=self.scan_items)
+
+        # Select the first item in the listbox
+        if self.music_listbox.items is self.scan_items and not self.music_listbox.curselection():
+            self.music_listbox.selection_set(0)
+
+    def scan_music(self, folder_path, show_batch):
+        """ Empties the music listbox and fills it in as the engine finds the music files under a folder. """
+        self.music_listbox.set_items([])
+        self.scan_items = self.music_listbox.items
+        self.status_label.config(text="Scanning...")
+        self.engine.scan_music(folder_path, on_batch=show_batch, on_done=self.finish_scan, on_error=self.show_music_error)
+
+    def finish_scan(self, stats):
+        """ Shows how many music files the scan found and how fast. """
+        self.status_label.config(text=f"{stats.files:,} music files in {stats.seconds:.1f} s ({stats.files_per_second:,.0f} files/s)")
+        if not self.scan_items:
+            raise NoMusicError
+
+    def open_playlists(self):
+        """ Loads the playlist files in the music folder into the listbox. """
+        # Get the playlist files in the music folder in the background
+        self.engine.open_playlists(on_done=self.show_playlists)
+
+    def show_playlists(self, playlist_files):
+        """ Shows the playlist files in the listbox. """
+        # Put the playlist files in the listbox
+        self.playlist_listbox.set_items(playlist_files)
+
+        # Select the first item in the listbox
+        self.playlist_listbox.selection_set(0)
+
+    def open_folder(self):
+        """ Opens the selected folder. """
+        # Get the selected folder
+        selected_index = self.music_listbox.curselection()
+
+        # If a folder is selected, open it
+        if selected_index:
+            selected_folder = self.music_listbox.get(selected_index)
+            # If the selected folder is not a music file, open it
+            if not selected_folder.lower().endswith(".mp3"):
+                # Set the folder path
+                self.folder_path = path.join(self.music_dir, selected_folder)
+
+                # Load the music, an error is raised if the folder does not exist
+                self.load_music()
+
+    def show_library_changes(self, changes):
+        """ Updates the listboxes with the changes the library watcher saw in the music folder. """
+        # If the watcher lost track of the changes, reload the listboxes
+        # The music files in a removed or renamed folder are not reported one by one, so it reloads the music listbox too
+        rescan = any(change.kind == "rescan" for change in changes)
+        shown_root = path.normpath(self.music_dir) if self.shown_folder is None else self.shown_folder
+        moved = any(change.is_dir and change.kind in ("removed", "renamed")
+                    and (change.old_path or change.path).startswith(shown_root + path.sep) for change in changes)
+        if (rescan or moved) and not self.playlist_mode and not self.search_mode:
+            if self.shown_folder is None:
+                self.load_folders()
+            else:
+                self.load_music()
+        if rescan:
+            self.open_playlists()
+            return
+
+        # A rename removes the old name and inserts the new one
+        for change in changes:
+            if change.kind in ("removed", "renamed"):
+                self.update_views(change.old_path or change.path, change.is_dir, insert=False)
+            if change.kind in ("added", "renamed"):
+                self.update_views(change.path, change.is_dir, insert=True)
+
+    def update_views(self, entry_path, is_dir, insert):
+        """ Inserts or removes a music folder, music file or playlist file in the listbox that shows it. """
+        folder_path, name = path.split(entry_path)
+        music_dir = path.normpath(self.music_dir)
+
+        # Playlist files are in the music folder
+        if folder_path == music_dir and is_playlist_file(name) and not is_dir:
+            self.update_listbox(self.playlist_listbox, name, insert, keep_sorted=False)
+        # The music listbox shows either the folders holding music or the music files under one folder
+        elif not self.playlist_mode and self.scan_items is not None and not is_dir and name.lower().endswith(".mp3"):
+            if self.shown_folder is None:
+                # A folder stays listed when a music file is removed from it, other music files may still be there
+                if insert and folder_path != music_dir:
+                    self.update_listbox(self.music_listbox, path.relpath(folder_path, music_dir), insert,
+                                        items=self.scan_items)
+            elif entry_path.startswith(self.shown_folder + path.sep):
+                self.update_listbox(self.music_listbox, path.relpath(entry_path, self.shown_folder), insert,
+                                    items=self.scan_items)
+
+    def update_listbox(self, listbox, name, insert, keep_sorted=True, items=None):
+        """ Inserts or removes one name in a listbox, or in items if the listbox is showing something else, keeping the playing music in place. """
+        items = listbox.items if items is None else items
+        if keep_sorted:
+            position = bisect_left(items, name)
+            present = position < len(items) and items[position] == name
+        else:
+            present = name in items
+            position = items.index(name) if present else len(items)
+        if insert == present:
+            return
+
+        # A listing hidden behind search results is updated in place, it is shown again when the search is cleared
+        if items is not listbox.items:
+            if insert:
+                items.insert(position, name)
+            else:
+                del items[position]
+        elif insert:
+            listbox.insert(position, name)
+        else:
+            listbox.delete(position)
+
+        # The listbox items are the music being played, the engine keeps its indexes on the same music
+        if items is self.engine.play_items:
+            self.engine.queue_changed(position, 1 if insert else -1)
+
+    def search_music(self, *args):
+        """ Shows the music files matching the search box in the listbox. """
+        query = self.search_text.get()
+
+        # If the query is empty, show the folder or playlist shown before searching
+        if not query.strip():
+            if self.search_mode:
+                self.search_mode = False
+                items, display = self.browse_view
+                self.music_listbox.set_items(items, display=display)
+            return
+
+        # Search on every keystroke, nothing is shown until the search index is built
+        results = self.engine.search(query)
+        if results is None:
+            return
+        if not self.search_mode:
+            self.search_mode = True
+            self.browse_view = (self.music_listbox.items, self.music_listbox.display)
+
+        # Put the matching music files in the listbox, only the visible rows are turned into file names
+        self.music_listbox.set_items(results, display=path.basename)
+        if results:
+            self.music_listbox.selection_set(0)
+
+    def play_pause_music(self):
+        """ Plays or pauses the music. """
+        with self.metrics.timed("play_pause"):
+            try:
+                # Get the selected music
+                selected_index = self.music_listbox.curselection()
+
+                # If a music is selected, play it
+                if selected_index:
+                    selected_music = self.music_listbox.get(selected_index)
+
+                    # If the music is a search result or in a playlist, the item is the path, otherwise get the path from the folder
+                    if self.search_mode:
+                        music_path = self.music_listbox.item(selected_index[0])
+                    elif not self.playlist_mode:
+                        music_path = path.join(self.folder_path, selected_music)
+                    else:
+                        music_path = self.playlist.path_of(self.music_listbox.item(selected_index[0]))
+
+                    # A playlist is played from its model, the listbox holds its entry IDs
+                    if self.playlist_mode and not self.search_mode:
+                        queue = self.playlist
+                    else:
+                        queue = self.music_listbox.items
+
+                    # Play the music if it is not already playing, otherwise pause it, the same music file can be in a playlist twice
+                    playing = self.current_music == music_path
+                    if queue is self.playlist:
+                        playing = playing and self.engine.play_items is queue and self.engine.play_index == selected_index[0]
+                    if not playing:
+                        folder = None if self.playlist_mode or self.search_mode else self.folder_path
+                        self.engine.set_queue(queue, folder)
+                        self.engine.play_music(selected_index[0])
+                    elif self.paused:
+                        self.engine.unpause()
+                    else:
+                        self.engine.pause()
+
+            except self.engine.backend.errors as error:
+                raise PlayMusicError from error
+
+    def follow_music(self, index, music_path):
+        """ Selects the music the engine moved on to, if the listbox still shows the music being played. """
+        shows_playlist = self.playlist_mode and not self.search_mode and self.playlist is self.engine.play_items
+        if self.music_listbox.items is self.engine.play_items or shows_playlist:
+            self.music_listbox.selection_set(index)
+            self.music_listbox.see(index)
+
+    def stop_music(self):
+        """ Stops the music. """
+        self.engine.stop_music()
+
+    def previous_music(self):
+        """ Plays the previous music in the list box. """
+        # While music plays, the engine goes back in its play order, which may be shuffled
+        if self.current_music is not None:
+            self.engine.previous_music()
+            return
+
+        selected_index = self.music_listbox.curselection()
+
+        # If the current music is not the first music in the list box, play the previous music
+        if selected_index and selected_index[0] > 0:
+            with self.metrics.timed("skip"):
+                self.music_listbox.selection_set(selected_index[0] - 1)
+                self.music_listbox.see(selected_index[0] - 1)
+                self.play_pause_music()
+
+    def next_music(self):
+        """ Plays the next music in the list box. """
+        # While music plays, the engine moves on in its play order, which may be shuffled
+        if self.current_music is not None:
+            self.engine.next_music()
+            return
+
+        selected_index = self.music_listbox.curselection()
+
+        # If the current music is not the last music in the list box, play the next music
+        if selected_index and selected_index[0] + 1 < self.music_listbox.size():
+            with self.metrics.timed("skip"):
+                self.music_listbox.selection_set(selected_index[0] + 1)
+                self.music_listbox.see(selected_index[0] + 1)
+                self.play_pause_music()
+
+    def set_shuffle(self):
+        """ Turns shuffle on or off, it applies from the next music. """
+        self.engine.set_shuffle(self.shuffle_enabled.get())
+
+    def set_repeat(self, repeat):
+        """ Sets the repeat mode, it applies from the next music. """
+        self.engine.set_repeat(repeat)
+
+    def set_volume(self, event):
+        """ Sets the volume of the music. """
+        # The volume is applied when the mixer is initialized if nothing has played yet
+        self.engine.set_volume(self.volume_scale.get()/100)
+
+    def show_volume(self, volume):
+        """ Moves the volume slider to the volume of the engine. """
+        # Setting the slider calls set_volume again, so it is only moved when the volume changed elsewhere
+        if self.volume_scale.get() != round(volume * 100):
+            self.volume_scale.set(round(volume * 100))
+
+    def analyze_loudness(self):
+        """ Measures the loudness of the music files, they play normalized from the next music that starts. """
+        self.status_label.config(text="Measuring loudness...")
+        self.engine.analyze_loudness(on_done=self.finish_loudness)
+
+    def finish_loudness(self, result):
+        """ Shows how many music files were measured and how fast. """
+        count, seconds, files_per_second = result
+        self.status_label.config(text=f"Measured {count:,} music files in {seconds:.1f} s ({files_per_second:,.1f} files/s)")
+
+    def set_crossfade(self, event):
+        """ Sets the crossfade overlap, it applies from the next music that starts playing. """
+        self.engine.set_crossfade(self.crossfade_scale.get())
+
+    def schedule_time_elapsed(self, *args):
+        """ Updates the time elapsed label right away when playback changes. """
+        if self.time_elapsed_job is not None:
+            self.master.after_cancel(self.time_elapsed_job)
+        self.update_time_elapsed()
+
+    def update_time_elapsed(self):
+        """ Updates the time elapsed label and position slider. """
+        self.time_elapsed_job = None
+        position = self.engine.position()
+        duration = self.engine.current_duration or 0
+        self.time_elapsed_label.config(text=f"Time Elapsed: {format_time(position)} / {format_time(duration)}")
+
+        # The slider is left alone while the user drags it
+        if not self.seeking:
+            self.position_scale.config(to=duration)
+            self.position_scale.set(position)
+
+        # Move the waveform cursor
+        duration = duration or self.waveform_duration
+        x = position / duration * WAVEFORM_WIDTH if duration else 0
+        self.waveform_canvas.coords("cursor", x, 0, x, WAVEFORM_HEIGHT)
+
+        # While the music is playing, refresh smoothly if the window is visible and slowly if it is not
+        if self.engine.clock.running:
+            interval = TIME_ELAPSED_INTERVAL if self.master.winfo_viewable() else HIDDEN_TIME_ELAPSED_INTERVAL
+            self.time_elapsed_job = self.master.after(interval, self.update_time_elapsed)
+
+    def start_seek(self, event):
+        """ Stops the position slider from following the music while the user drags it. """
+        self.seeking = True
+
+    def seek_music(self, event):
+        """ Moves the music to the position the user dragged the slider to. """
+        self.seeking = False
+        self.engine.seek(self.position_scale.get())
+
+    def show_waveform(self, waveform):
+        """ Draws the waveform of the playing music, or clears it if waveform is None. """
+        self.waveform_canvas.delete("all")
+        if waveform is None:
+            self.waveform_duration = 0
+            return
+        self.waveform_duration = waveform.duration
+
+        # Each bucket is a line from its smallest to its largest sample
+        middle = WAVEFORM_HEIGHT / 2
+        scale = middle / 128
+        peaks = waveform.peaks
+        for x in range(len(peaks) // 2):
+            self.waveform_canvas.create_line(x, middle - peaks[2 * x + 1] * scale, x, middle - peaks[2 * x] * scale + 1, fill="gray40")
+        self.waveform_canvas.create_line(0, 0, 0, WAVEFORM_HEIGHT, fill="red", tags="cursor")
+        self.schedule_time_elapsed()
+
+    def clear_waveform(self):
+        """ Clears the waveform when playback stops. """
+        self.show_waveform(None)
+
+    def seek_waveform(self, event):
+        """ Moves the music to the point of the waveform the user clicked. """
+        duration = self.engine.current_duration or self.waveform_duration
+        if duration:
+            self.engine.seek(event.x / WAVEFORM_WIDTH * duration)
+
+    def add_to_playlist(self):
+        """ Adds the selected music to the playlist. """
+        # Get the selected music
+        selected_index = self.music_listbox.curselection()
+
+        # If a music is selected, add it to the playlist
+        if selected_index:
+            selected_music = self.music_listbox.get(selected_index)
+            # A search result is already the full path, otherwise join the folder path and the selected music
+            if self.search_mode:
+                music_path = self.music_listbox.item(selected_index[0])
+            else:
+                music_path = path.join(self.folder_path, selected_music)
+
+            # Adding to an open playlist is saved right away as one journal line
+            if self.engine.playlist_store is not None:
+                self.engine.add_to_playlist(music_path)
+            else:
+                self.playlist.append(music_path)
+
+    def remove_from_playlist(self):
+        """ Removes the selected music from the playlist. """
+        # Get the selected music
+        selected_index = self.music_listbox.curselection()
+
+        # If a music is selected, remove it from the playlist
+        if selected_index and self.playlist_mode and not self.search_mode:
+            # Remove the selected entry by its ID, so the right copy of a music file that is in the playlist twice goes
+            index = self.playlist.index_of(self.music_listbox.item(selected_index[0]))
+            self.engine.remove_from_playlist(index)
+
+    def show_playlist_change(self, old_index, new_index, entry_id):
+        """ Removes and inserts the entry of the open playlist the engine added, removed or moved. """
+        # Only the open playlist is followed, and only while it is shown
+        if not self.playlist_mode or self.engine.playlist_store is None or self.playlist is not self.engine.playlist_store.entries:
+            return
+
+        # While searching, the playlist is hidden in the browse view, which is edited instead
+        if self.search_mode:
+            items = self.browse_view[0]
+            if old_index is not None:
+                del items[old_index]
+            if new_index is not None:
+                items.insert(new_index, entry_id)
+            return
+        if old_index is not None:
+            self.music_listbox.delete(old_index)
+        if new_index is not None:
+            self.music_listbox.insert(new_index, entry_id)
+
+    def show_playlist_page(self, index, entry_ids):
+        """ Inserts a page of entries the engine read into the open playlist. """
+        # Only the open playlist is followed, and only while it is shown
+        if not self.playlist_mode or self.engine.playlist_store is None or self.playlist is not self.engine.playlist_store.entries:
+            return
+
+        # While searching, the playlist is hidden in the browse view, which is extended instead
+        if self.search_mode:
+            self.browse_view[0][index:index] = entry_ids
+            return
+        self.music_listbox.insert(index, *entry_ids)
+
+    def load_playlist_page(self):
+        """ Has the engine read the next page of the open playlist when the listbox nears its end. """
+        if self.playlist_mode and not self.search_mode:
+            self.engine.load_playlist_page()
+
+    def open_playlist(self):
+        """ Loads the selected playlist. """
+        with self.metrics.timed("open_playlist"):
+            # Get the selected playlist
+            selected_index = self.playlist_listbox.curselection()
+
+            # If a playlist is selected, load it
+            if selected_index:
+                self.selected_playlist = self.playlist_listbox.get(selected_index)
+
+                # Opening the playlist stops a scan in progress
+                if self.engine.scanner is not None:
+                    self.status_label.config(text="")
+
+                # Load the playlist and replay its journal in the background
+                self.engine.open_playlist(self.selected_playlist, on_done=self.show_playlist, on_error=self.show_playlist_error)
+
+    def show_playlist(self, playlist_store):
+        """ Shows the music files of the opened playlist in the listbox. """
+        # Turn on playlist mode
+        self.playlist_mode = True
+        self.search_mode = False
+        self.playlist = playlist_store.entries
+        self.playlist_info = playlist_store.info
+
+        # Put the entry IDs read so far in the listbox, only the visible rows are turned into names
+        self.music_listbox.set_items(self.playlist.ids(), display=self.playlist_entry_name)
+
+        # Select the first item in the listbox
+        self.music_listbox.selection_set(0)
+
+        # Update the current playlist label
+        self.current_playlist_label.config(text=f"Current Playlist: {self.selected_playlist}")
+
+    def playlist_entry_name(self, entry_id):
+        """ Returns the #EXTINF title and duration of a playlist entry, or its file name. """
+        music_path = self.playlist.path_of(entry_id)
+        info = self.playlist_info.get(music_path)
+        if info is None or info.title is None:
+            return path.basename(music_path)
+        if info.duration is None:
+            return info.title
+        return f"{info.title} ({format_time(info.duration)})"
+
+    def show_playlist_error(self, error):
+        """ Raises an error if the playlist could not be read. """
+        raise PlaylistError from error
+
+    def save_playlist(self):
+        """ Saves the current playlist. """
+        # Edits are already saved in the journal, saving compacts it into the playlist file
+        self.engine.save_playlist()
+
+    def add_new_playlist(self):
+        """ Adds a new playlist. """
+        # Create a new playlist
+        self.playlist_listbox.insert("end", f"Playlist {self.playlist_listbox.size()+1}.txt")
+
+        # Clear the selection and select the new playlist
+        self.playlist_listbox.selection_clear(0, "end")
+        self.playlist_listbox.selection_set("end")
+        self.clear_playlist()
+
+        # Create the playlist file in the background, then open it
+        self.engine.create_playlist(f"Playlist {self.playlist_listbox.size()}.txt", on_done=lambda _: self.open_playlist())
+
+    def remove_playlist(self):
+        """ Removes the selected playlist. """
+        try:
+            # Get the selected playlist
+            selected_index = self.playlist_listbox.curselection()
+
+            # If a playlist is selected, remove it
+            if selected_index:
+                selected_playlist = self.playlist_listbox.get(selected_index)
+                playlist_path = path.join(self.music_dir, selected_playlist)
+                # Remove the playlist
+                if path.exists(playlist_path):
+                    self.playlist_listbox.delete(selected_index)
+                    self.selected_playlist = None
+                    self.clear_playlist()
+                    self.current_playlist_label.config(text="Current Playlist: ")
+                    self.engine.remove_playlist(selected_playlist)
+        except FileNotFoundError:
+            raise PlaylistError
+
+    def clear_playlist(self):
+        """ Forgets the playlist shown, the entry IDs in the listbox mean nothing without it. """
+        self.playlist = PlaylistModel()
+        self.playlist_info = {}
+        if self.playlist_mode:
+            self.playlist_mode = False
+            # While searching, the playlist is hidden in the browse view, which is emptied instead
+            if self.search_mode:
+                self.browse_view = ([], str)
+            else:
+                self.music_listbox.set_items([])
+
+    def show_metadata(self, metadata):
+        """ Shows the metadata of the playing music. """
+        with self.metrics.timed("show_metadata"):
+            # If the audio file has metadata, display it
+            if metadata:
+                title = metadata["title"]
+                artist = metadata["artist"]
+                album = metadata["album"]
+                duration = metadata["duration"] or 0
+
+                # Display the metadata
+                metadata_text = f"Title: {title}\nArtist: {artist}\nAlbum: {album}\nDuration: {int(duration)} seconds"
+                self.metadata_label.config(text=metadata_text)
+
+    def show_album_art(self, thumbnail):
+        """ Shows the album art of the playing music beside its metadata. """
+        # Keep a reference to the image, Tk stops showing an image once Python drops it
+        self.album_art_image = tk.PhotoImage(data=thumbnail) if thumbnail else None
+        self.metadata_label.config(image=self.album_art_image or "", compound=tk.LEFT)
+
+    def toggle_profiler(self, event=None):
+        """ Starts profiling the player, or stops and writes the profile. """
+        if self.engine.toggle_profiler():
+            self.status_label.config(text="Profiling, press F11 to stop")
+        else:
+            self.status_label.config(text=f"Profile written to {path.basename(DEFAULT_PROFILE_PATH)}")
+
+    def export_stats(self, event=None):
+        """ Writes the latencies, stalls and I/O counts of the player to a file. """
+        stats_path = self.engine.export_stats()
+        self.status_label.config(text=f"Stats written to {path.basename(stats_path)}")
+
+def format_time(seconds):
+    """ Returns seconds as minutes and seconds. """
+    minutes, seconds = divmod(int(seconds), 60)
+    return "{:02d}:{:02d}".format(minutes, seconds)
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    music_player = MusicPlayer(root)
+
+    # Other programs on this machine can control the player when it is started with --remote
+    if "--remote" in argv:
+        remote_control = RemoteControl(music_player.engine).start()
     root.mainloop()
\ No newline at end of file
@@ -1,4 +1,6 @@
 from os import path
+from subprocess import run
+from sys import executable
 import pytest
 from tkinter import Tk
 from music_player import MusicPlayer
@@ -7,6 +9,7 @@ def test_music_player_initialization():
     """ Test the initialization of the MusicPlayer class. """
     root = Tk()
     music_player = MusicPlayer(root)
+    music_player.tasks.wait()
 
     assert music_player.master == root
     assert music_player.playlist == []
@@ -18,8 +21,10 @@ def test_play_music():
     """ Test the play_music method. """
     root = Tk()
     music_player = MusicPlayer(root)
+    music_player.tasks.wait()
     music_player.music_listbox.selection_set(0)
     music_player.open_folder()
+    music_player.tasks.wait()
     music_player.music_listbox.selection_set(0)
     music_player.play_pause_music()
 
@@ -29,8 +34,10 @@ def test_pause_music():
     """ Test the pause_music method. """
     root = Tk()
     music_player = MusicPlayer(root)
+    music_player.tasks.wait()
     music_player.music_listbox.selection_set(0)
     music_player.open_folder()
+    music_player.tasks.wait()
     music_player.music_listbox.selection_set(0)
     music_player.play_pause_music()
     music_player.play_pause_music()
@@ -41,23 +48,28 @@ def test_next_music():
     """ Test the next_music method. """
     root = Tk()
     music_player = MusicPlayer(root)
+    music_player.tasks.wait()
     # Open the first folder
     music_player.music_listbox.selection_set(0)
     music_player.open_folder()
+    music_player.tasks.wait()
     # Select the first song then skip to the next song
     music_player.music_listbox.selection_set(0)
     music_player.next_music()
 
     # The current music should be the second song in the listbox
     assert path.basename(music_player.current_music) == music_player.music_listbox.get(1)
+    assert music_player.metrics.summary()["skip"]["count"] == 1
 
 def test_previous_music():
     """ Test the previous_music method. """
     root = Tk()
     music_player = MusicPlayer(root)
+    music_player.tasks.wait()
     # Open the first folder
     music_player.music_listbox.selection_set(0)
     music_player.open_folder()
+    music_player.tasks.wait()
     # Select the second song then skip to the previous song
     music_player.music_listbox.selection_set(1)
     music_player.previous_music()
@@ -65,18 +77,73 @@ def test_previous_music():
     # The current music should be the first song in the listbox
     assert path.basename(music_player.current_music) == music_player.music_listbox.get(0)
 
+def test_next_music_is_queued():
+    """ Test that the music after the playing one is queued for gapless playback. """
+    root = Tk()
+    music_player = MusicPlayer(root)
+    music_player.tasks.wait()
+    # Open the second folder, it holds more than one song
+    music_player.music_listbox.selection_set(1)
+    music_player.open_folder()
+    music_player.tasks.wait()
+    music_player.music_listbox.selection_set(0)
+    music_player.play_pause_music()
+    music_player.tasks.wait()
+
+    assert music_player.queued_index == 1
+
 def test_play_playlist():
     """ Test the play_playlist method. """
     root = Tk()
     music_player = MusicPlayer(root)
+    music_player.tasks.wait()
     # Open the first playlist
     music_player.playlist_listbox.selection_set(0)
     music_player.open_playlist()
+    music_player.tasks.wait()
     # Play the playlist
     music_player.play_pause_music()
 
     # The current music should be the first song in the listbox
     assert path.basename(music_player.current_music) == music_player.music_listbox.get(0)
 
+def test_search_music():
+    """ Test that typing in the search box shows the matching music and clearing it restores the folders. """
+    root = Tk()
+    music_player = MusicPlayer(root)
+    music_player.tasks.wait()
+    folders = music_player.music_listbox.items
+
+    music_player.search_text.set("night-side")
+    assert music_player.search_mode
+    assert music_player.music_listbox.get(0) == "03 Walk Through The Night-Side.mp3"
+    music_player.play_pause_music()
+    assert music_player.current_music.endswith("03 Walk Through The Night-Side.mp3")
+
+    music_player.search_text.set("")
+    assert not music_player.search_mode
+    assert music_player.music_listbox.items is folders
+    assert music_player.music_listbox.items is music_player.scan_items
+
+def test_clearing_the_playlist_leaves_playlist_mode():
+    """ Test that forgetting the shown playlist leaves playlist mode and empties the listbox of its entry IDs. """
+    root = Tk()
+    music_player = MusicPlayer(root)
+    music_player.tasks.wait()
+    music_player.playlist_mode = True
+    music_player.music_listbox.set_items([1, 2])
+    music_player.clear_playlist()
+
+    assert not music_player.playlist_mode
+    assert music_player.music_listbox.size() == 0
+    assert music_player.playlist.ids() == []
+
+def test_import_is_lazy():
+    """ Test that importing the program leaves eyed3 and pygame until they are needed. """
+    result = run([executable, "-c", "import sys, music_player; print('eyed3' in sys.modules, 'pygame' in sys.modules)"],
+                 cwd=path.dirname(path.abspath(__file__)), capture_output=True, text=True, check=True)
+
+    assert result.stdout.split()[-2:] == ["False", "False"]
+
 if __name__ == "__main__":
     pytest.main(["-v", __file__])
\ No newline at end of file
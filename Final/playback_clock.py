@@ -0,0 +1,97 @@
+""" playback_clock.py
+
+Design:
+class PlaybackClock:
+    def __init__
+        initialize time source and anchor
+
+    def start
+        anchor position at the current time
+
+    def pause / resume
+        freeze position, then anchor it again
+
+    def seek
+        move position, frozen if paused
+
+    def advance
+        start the next music at the time the previous one ran past its end
+
+    def stop
+        forget anchor
+
+    def position
+        return frozen position, or time since anchor
+
+Keeps the position in the playing music without polling the mixer. The clock is
+anchored whenever playback changes: when music starts, is paused, resumed or
+seeked, and when an end of music event says the queued music has started. In
+between, the position is the time since the anchor, so reading it is a single
+clock read and it stays exact across pauses and seeks. mixer.music.get_pos is
+not used, since it counts from the last play call rather than from the start of
+the music and keeps counting across queued music.
+"""
+
+from time import perf_counter
+
+# End of music events are seen within a few polls, a larger overrun means the duration was wrong
+MAX_END_DELAY = 2
+
+class PlaybackClock:
+    """ The position in the playing music, kept from the times playback changed. """
+    def __init__(self, clock=perf_counter):
+        self.clock = clock
+        self.started = None
+        self.paused_position = None
+
+    @property
+    def running(self):
+        """ Returns whether the position is moving. """
+        return self.started is not None and self.paused_position is None
+
+    def start(self, position=0):
+        """ Starts counting from a position in seconds. """
+        self.started = self.clock() - position
+        self.paused_position = None
+
+    def pause(self):
+        """ Freezes the position. """
+        if self.running:
+            self.paused_position = self.clock() - self.started
+
+    def resume(self):
+        """ Starts counting again from the frozen position. """
+        if self.paused_position is not None:
+            self.start(self.paused_position)
+
+    def seek(self, position):
+        """ Moves the position, it stays frozen if the clock is paused. """
+        if self.paused_position is not None:
+            self.paused_position = position
+        else:
+            self.start(position)
+
+    def advance(self, duration):
+        """ Starts the next music at the time the previous one, of duration seconds, ran past its end. """
+        if self.started is None:
+            return
+        if duration:
+            self.started += duration
+            # The end event is seen a little late, a wrong duration must not put the position far off
+            if not 0 <= self.clock() - self.started < MAX_END_DELAY:
+                self.start()
+        else:
+            self.start()
+
+    def stop(self):
+        """ Stops the clock, the position goes back to zero. """
+        self.started = None
+        self.paused_position = None
+
+    def position(self):
+        """ Returns the position in seconds. """
+        if self.paused_position is not None:
+            return self.paused_position
+        if self.started is None:
+            return 0
+        return self.clock() - self.started
@@ -0,0 +1,57 @@
+import pytest
+from playback_clock import PlaybackClock
+
+class Clock:
+    """ Stands in for perf_counter, moving only when told to. """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_position_is_frozen_while_paused():
+    """ Test that the position stops while paused and continues from where it stopped. """
+    clock = Clock()
+    playback_clock = PlaybackClock(clock)
+    playback_clock.start(5)
+    clock.now = 10
+    playback_clock.pause()
+    clock.now = 100
+    assert playback_clock.position() == 15
+    assert not playback_clock.running
+
+    playback_clock.resume()
+    clock.now = 102
+    assert playback_clock.position() == 17
+
+def test_seek_while_paused_and_playing():
+    """ Test that seeking moves the position, leaving a paused clock paused. """
+    clock = Clock()
+    playback_clock = PlaybackClock(clock)
+    playback_clock.start()
+    playback_clock.pause()
+    playback_clock.seek(60)
+    clock.now = 30
+    assert playback_clock.position() == 60
+
+    playback_clock.resume()
+    playback_clock.seek(10)
+    clock.now = 35
+    assert playback_clock.position() == 15
+
+def test_advance_carries_over_the_time_past_the_end():
+    """ Test that the next music starts where the previous one ended, not where its end was seen. """
+    clock = Clock()
+    playback_clock = PlaybackClock(clock)
+    playback_clock.start()
+    clock.now = 180.08
+    playback_clock.advance(180)
+    assert playback_clock.position() == pytest.approx(0.08)
+
+    # A wrong duration starts the next music from where its end was seen
+    clock.now = 500
+    playback_clock.advance(60)
+    assert playback_clock.position() == 0
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
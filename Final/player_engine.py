@@ -0,0 +1,1141 @@
+""" player_engine.py
+
+Design:
+def default_music_dir
+    return music folder next to the program
+
+class PlayerEngine:
+    def __init__
+        initialize playback state
+        open library index
+        start background tasks
+        create audio cache and crossfader of the audio backend
+        build fingerprint index from the library index in the background
+        map the track store saved last time and build the search index from it in the background
+        rebuild the track store from the library index and save it in the background
+        start watching music folder in the background
+        start checking the event loop for stalls
+
+    def subscribe / emit
+        register and call listeners of engine events
+
+    def load_folders / load_music / open_playlists
+        list folders, music files and playlist files in the background
+
+    def scan_music
+        cancel any scan in progress
+        list every music file under a folder on the library scanner in the background
+        hand the music files found to the user interface in batches while the scan goes on
+
+    def dispatch_scan
+        hand the batches found since the last call to the user interface
+        record how long the first results took
+
+    def cancel_scan
+        stop the scan in progress
+
+    def set_saved_tracks / set_track_store
+        keep the track store, build the search index from it unless it is up to date
+
+    def search
+        search index for query
+
+    def set_queue
+        set music being played and the folder its music files are in
+
+    def play_music
+        cancel any crossfade
+        load music from audio cache if it is cached, otherwise from disk
+        if the music was played before, cache it in the background
+        apply the volume slider and the music's loudness gain
+        play music
+        read metadata and album art
+        queue next music
+        watch for end of music
+
+    def music_path_at
+        if music is in a folder, join folder path, otherwise item is the path
+
+    def pause / unpause
+        pause or resume music, crossfade and playback clock
+
+    def seek
+        move music and playback clock to a position
+        if crossfading, cancel it and prepare it again
+
+    def position
+        return playback clock position, within the duration of the music
+
+    def queue_next_music
+        if playback nears the end of a playlist still loading, read its next page
+        take the next music in the play order, straight or shuffled, with repeat
+        if crossfading, decode head of next music in the background
+        otherwise read next music through the audio cache in the background
+        queue it behind the playing music so there is no gap
+
+    def watch_music_end
+        check end of music while music is playing
+        check whether to start a crossfade
+
+    def check_crossfade
+        if playing music is within the overlap of its end, start crossfade
+
+    def finish_crossfade
+        continue next music on the music stream
+
+    def advance_music
+        if crossfading, the crossfade moves on to the next music
+        if queued music has started, it becomes the current music, its loudness gain is applied and the one after it is queued
+        if next music in the play order was not queued in time, play it
+        otherwise playback is finished
+        start playback clock of the next music where the previous one ended
+
+    def stop_music
+        stop music, preload, crossfade and playback clock
+
+    def previous_music / next_music
+        play previous or next music in the play order of the music being played
+
+    def set_shuffle / set_repeat
+        change the play order and queue the next music again
+
+    def set_volume / set_crossfade
+        set volume and crossfade overlap
+        tell listeners the volume changed
+
+    def apply_volume
+        scale the volume slider by the loudness gain of the playing music
+
+    def analyze_loudness
+        measure the loudness of every stale music file on a process pool in the background
+
+    def open_playlist
+        cancel any scan in progress, the playlist replaces its listing
+        wait for the edits of the playlist still being written
+        load first page of playlist, or all of it and replay its journal, in the background
+        remap missing music files
+        keep playlist store
+
+    def load_playlist_page / add_playlist_page / show_playlist_page
+        read next page of the open playlist in the background
+        add it to the playlist, tell listeners
+        keep reading if the play order is shuffled or repeating
+
+    def edit_playlist / next_playlist_edit / finish_playlist / finish_playlist_edit / fail_playlist_edit
+        queue edits of a playlist, write them one at a time in the background
+        read the rest of the playlist first, edits index into the whole playlist
+        change the entries once an edit is on disk, compact when the journal has grown large
+
+    def close_idle_playlist / when_playlist_written
+        close a playlist that is no longer open once its last edit is written
+        run what waited for the edits of a playlist, such as reading it again
+
+    def add_to_playlist / remove_from_playlist / save_playlist / create_playlist / remove_playlist
+        edit playlists through their journal in the background
+        tell listeners which entry of the open playlist was added or removed
+
+    def move_in_playlist
+        move an entry of the open playlist through its journal in the background
+        if the playlist is playing, keep the engine on the same entry by its ID
+        tell listeners where the entry moved
+
+    def read_metadata / show_metadata
+        get metadata from library index in the background
+        add its tags to search index and tell listeners
+
+    def read_album_art / show_album_art
+        get album art thumbnail in the background
+        if the music is still playing, tell listeners
+
+    def read_waveform / show_waveform
+        if the waveform is in memory, tell listeners right away
+        otherwise clear it and get it from disk or decode it in the background
+
+    def start_watching / check_library
+        poll the library watcher in the background
+
+    def apply_library_changes
+        if the watcher lost track, rebuild the indexes
+        forget removed and changed music files in the audio cache
+        add and remove music files in the search index
+        if a folder was added, removed or renamed, rebuild the search index with the track store
+        rescan changed folders in the library index and fingerprint new music files in the background
+        then rebuild the track store
+        tell listeners what changed
+
+    def queue_changed
+        keep the playing and queued indexes on the same music when items are inserted or removed
+        if the playing music was removed, the index is just before the music now in its place
+
+    def stats / export_stats
+        return latencies, histograms, counters, library I/O, cache stats and track store and search index memory, or write them to a file
+
+    def toggle_profiler
+        start cProfile, or stop it and dump its stats to a file
+
+    def set_instrumentation
+        turn latency, counters and stall checks on or off
+
+The library, queue and transport of the music player, with no user interface.
+The engine plays through an audio backend and schedules its polling through a
+master that provides after and after_cancel: the Tk root when there is a
+window, or a HeadlessLoop when running as a daemon, in tests or in benchmarks.
+A user interface drives the engine through its methods and follows it through
+the events it emits: "track" when another music file starts, "metadata" when
+the tags of the playing music file have been read, "album_art" with the
+thumbnail of its album art, "waveform" with its waveform, "paused", "unpaused",
+"seeked" and "stopped" when the transport changes, "volume" when the volume is
+set, "finished" when the last music file ends, "playlist_changed" with the old
+and new index of an entry added to, removed from or moved in the open playlist,
+"playlist_page" with the index and entry IDs of a page of the open playlist read,
+"search_ready" when the search index has been built and "library_changed" with
+the changes the library watcher saw in the music folder, so views can be
+updated with what changed instead of being rebuilt, whichever of the user
+interface, the remote control or the engine itself made the change. The
+position in the playing music is kept by a PlaybackClock anchored at these
+changes, so reading it does not poll the audio backend. The whole library is
+kept in memory as a TrackStore, saved next to the library index and mapped
+back at startup, so searching works before the library has been rescanned. Operations are timed
+into LatencyMetrics, and stats gathers them with the stalls of the event loop,
+the library's I/O counts and the cache stats, for a file or a debug panel.
+
+Running this module plays the music folder without a window:
+    python player_engine.py [music folder] [--null] [--stats] [--remote]
+--stats writes the stats to player_stats.json when playback is finished.
+--remote serves the remote control and keeps running after playback is finished.
+"""
+
+from collections import defaultdict, deque
+from itertools import count
+from os import path, listdir
+from sys import argv
+from time import perf_counter
+
+from album_art import AlbumArt, ThumbnailCache
+from audio_cache import AudioCache
+from background_tasks import BackgroundTasks
+from library_index import DEFAULT_INDEX_PATH, LibraryIndex
+from library_scanner import LibraryScanner
+from library_watcher import create_watcher
+from loudness import LoudnessStore, analyze_library
+from metrics import DEFAULT_PROFILE_PATH, DEFAULT_STATS_PATH, LatencyMetrics, Profiler, StallMonitor, export_stats
+from playback_clock import PlaybackClock
+from playlist_formats import is_playlist_file
+from playlist_model import BEFORE_FIRST, PlayOrder, REPEAT_OFF
+from playlist_resolver import PlaylistResolver
+from playlist_store import APPEND, MOVE, REMOVE, PlaylistStore
+from search_index import SearchIndex
+from track_store import TrackStore
+from waveform import WaveformCache
+
+# How often the end of music is checked while music is playing, the check only reads the state of the
+# audio backend and also starts the crossfade on time
+MUSIC_END_INTERVAL = 100
+
+# How often the music files found by a library scan are handed to the user interface
+SCAN_INTERVAL = 50
+
+# How often the library watcher is polled for changes to the music folder
+WATCH_INTERVAL = 1000
+
+# Playlists are read this many entries at a time, the next page is read when playback is this close to the end of the loaded entries
+PLAYLIST_PAGE = 1000
+PLAYLIST_READ_AHEAD = 100
+
+def default_music_dir():
+    """ Returns the music folder next to the program. """
+    music_dir = path.join(path.dirname(path.abspath(__file__)), "music/")
+    # The folder ships as "Music", which only matches "music" on case insensitive file systems
+    if not path.isdir(music_dir):
+        music_dir = path.join(path.dirname(path.abspath(__file__)), "Music/")
+    return music_dir
+
+class PlayerEngine:
+    """ The library, queue and transport of the music player, independent of any user interface. """
+    def __init__(self, master, backend, music_dir, index_path=DEFAULT_INDEX_PATH, thumbnail_dir=None, waveform_dir=None):
+        self.master = master
+        self.backend = backend
+        self.music_dir = music_dir
+        self.listeners = defaultdict(list)
+
+        # Initialize the playback state
+        self.play_items = []
+        self.play_folder = None
+        self.play_index = None
+        self.queued_index = None
+        self.fade_index = None
+        self.play_order = PlayOrder()
+        self.order_started = False
+        self.clock = PlaybackClock(backend.clock)
+        self.current_music = None
+        self.current_duration = None
+        self.paused = False
+        self.watching_end = False
+        self.volume = 1
+        self.track_gain = 1
+        self.playlist_store = None
+        self.reading_page = False
+        self.playlist_edits = deque()
+        self.playlist_waiters = {}
+        self.metrics = LatencyMetrics()
+
+        # Open the library index, recursive scans list their folders through it
+        self.library = LibraryIndex(music_dir, index_path)
+        self.scanner = None
+        self.scan_requested = None
+
+        # Start the background tasks, disk work runs there instead of on the event loop
+        self.tasks = BackgroundTasks(master)
+
+        # Recently played music files are kept in memory so replaying them does not touch the disk
+        self.audio_cache = AudioCache()
+        self.played = set()
+        self.crossfader = backend.crossfader(master, self.tasks, self.audio_cache)
+
+        # Album art thumbnails are kept in memory, and on disk if a thumbnail folder is given
+        self.album_art = AlbumArt(ThumbnailCache(disk_dir=thumbnail_dir))
+
+        # Waveforms are only computed for a user interface that shows them, it gives the folder they are kept in
+        self.waveforms = WaveformCache(waveform_dir) if waveform_dir is not None else None
+
+        # Build the fingerprint index in the background, playlists from other machines are remapped with it
+        self.resolver = PlaylistResolver(music_dir, index_path, self.library)
+        self.tasks.submit("fingerprints", self.resolver.ensure_built)
+
+        # Read the loudness gains in the background, music plays at its stored loudness once they are read
+        self.loudness = LoudnessStore(index_path)
+        self.tasks.submit("loudness_gains", self.loudness.load)
+
+        # Build the search index in the background, searching is disabled until it is ready
+        self.search_index = None
+        self.search_stale = True
+
+        # The track store saved last time is mapped first, so searching starts before the rescan of the library ends
+        self.track_store = None
+        self.track_store_path = path.splitext(index_path)[0] + ".tracks"
+        self.tasks.submit("saved_tracks", load_track_store, self.track_store_path, on_done=self.set_saved_tracks)
+        self.tasks.submit("track_store", build_track_store, self.library, self.track_store_path,
+                          on_done=self.set_track_store)
+
+        # Watch the music folder, the first watch or snapshot of every folder is taken in the background
+        self.watcher = None
+        self.change_batches = count()
+        self.tasks.submit("watcher", create_watcher, music_dir, on_done=self.start_watching)
+
+        # Check the event loop for stalls on the backend's clock, a virtual clock never stalls
+        self.stall_monitor = StallMonitor(master, self.metrics, clock=backend.clock)
+        self.stall_monitor.start()
+        self.profiler = Profiler()
+
+    def subscribe(self, event, listener):
+        """ Calls a listener whenever the engine emits an event. """
+        self.listeners[event].append(listener)
+
+    def emit(self, event, *args):
+        """ Calls the listeners of an event. """
+        for listener in self.listeners[event]:
+            listener(*args)
+
+    def load_folders(self, on_done, on_error=None):
+        """ Lists the subdirectories of the music folder in the background. """
+        self.cancel_scan()
+        self.tasks.submit("music_list", self.library.folders, on_done=on_done, on_error=on_error)
+
+    def load_music(self, folder_path, on_done, on_error=None):
+        """ Lists the music files of a folder in the background. """
+        self.cancel_scan()
+        self.tasks.submit("music_list", self.library.tracks, folder_path, on_done=on_done, on_error=on_error)
+
+    def scan_music(self, folder_path, on_batch, on_done=None, on_error=None):
+        """ Lists every music file under a folder in the background, handing their paths to on_batch as they are found. """
+        self.cancel_scan()
+        scanner = self.scanner = LibraryScanner(self.library.listing)
+        self.scan_requested = perf_counter()
+
+        def scan_finished(stats):
+            # Hand over the last batches, then report the throughput
+            self.dispatch_scan(scanner, on_batch)
+            if self.scanner is scanner:
+                self.scanner = None
+            self.metrics.record("scan", stats.seconds)
+            self.metrics.count("folders_scanned", stats.folders)
+            self.metrics.count("files_scanned", stats.files)
+            if on_done is not None:
+                on_done(stats)
+
+        # The scan replaces any folder listing in progress, its batches are taken on the event loop
+        self.tasks.submit("music_list", scanner.scan, folder_path, on_done=scan_finished, on_error=on_error)
+        self.master.after(SCAN_INTERVAL, self.dispatch_scan, scanner, on_batch)
+
+    def dispatch_scan(self, scanner, on_batch):
+        """ Hands the music files a scan found since the last call to on_batch, while the scan is current. """
+        if self.scanner is not scanner:
+            return
+        paths = scanner.take_batches()
+        if paths:
+            if self.scan_requested is not None:
+                self.metrics.record("scan_first_results", perf_counter() - self.scan_requested)
+                self.scan_requested = None
+            on_batch(paths)
+        if scanner.finished is None:
+            self.master.after(SCAN_INTERVAL, self.dispatch_scan, scanner, on_batch)
+
+    def cancel_scan(self):
+        """ Stops the scan in progress, the batches it has not handed over are dropped. """
+        if self.scanner is not None:
+            self.scanner.cancel()
+            self.scanner = None
+
+    def open_playlists(self, on_done):
+        """ Lists the playlist files in the music folder in the background. """
+        self.tasks.submit("playlist_list", list_playlists, self.music_dir, on_done=on_done)
+
+    def set_saved_tracks(self, track_store):
+        """ Keeps the track store saved last time and builds the search index from it, unless the rebuilt store came first. """
+        if track_store is not None and self.track_store is None:
+            self.track_store = track_store
+            self.tasks.submit("search_index", build_search_index, track_store, on_done=self.set_search_index)
+
+    def set_track_store(self, track_store):
+        """ Keeps the track store rebuilt from the library index, and builds the search index from it if the index is stale. """
+        self.track_store = track_store
+        if self.search_stale:
+            self.search_stale = False
+            self.tasks.submit("search_index", build_search_index, track_store, on_done=self.set_search_index)
+
+    def refresh_track_store(self, *args):
+        """ Rebuilds the track store from the library index in the background. """
+        self.tasks.submit("track_store", build_track_store, self.library, self.track_store_path,
+                          on_done=self.set_track_store)
+
+    def set_search_index(self, search_index):
+        """ Keeps the search index built in the background. """
+        self.search_index = search_index
+        self.emit("search_ready")
+
+    def search(self, query):
+        """ Returns the paths of the music files matching a query, or None if the index is not built yet. """
+        if self.search_index is None:
+            return None
+        with self.metrics.timed("search"):
+            return self.search_index.search(query)
+
+    def set_queue(self, items, folder=None):
+        """ Sets the music being played, items are file names in a folder or paths if folder is None. """
+        self.play_items = items
+        self.play_folder = folder
+        self.order_started = False
+
+    def play_music(self, index, start=0):
+        """ Plays the music at an index of the music being played, from start seconds. """
+        with self.metrics.timed("play"):
+            self.backend.init()
+            self.crossfader.cancel()
+            music_path = self.music_path_at(index)
+
+            # The first music played from a queue starts its shuffled order
+            if not self.order_started:
+                self.play_order.start(index)
+                self.order_started = True
+
+            # Load the music from memory if it is cached, otherwise stream it from disk. Music played for the first
+            # time is not read a second time to cache it, only music that is replayed or skipped back to is cached
+            music_data = self.audio_cache.get(music_path)
+            self.backend.load(music_path, music_data)
+            if music_data is None and music_path in self.played:
+                self.tasks.submit(("cache", music_path), self.audio_cache.read, music_path)
+            self.played.add(music_path)
+            self.track_gain = self.loudness.gain(music_path)
+            self.apply_volume()
+            self.backend.play(start=start)
+            self.clock.start(start)
+            self.current_duration = None
+            self.play_index = index
+            self.current_music = music_path
+            self.paused = False
+            self.read_metadata(music_path)
+            self.read_album_art(music_path)
+            self.emit("track", index, music_path)
+            self.read_waveform(music_path)
+
+            # Queue the next music so it starts without a gap
+            self.queue_next_music()
+        self.watch_music_end()
+
+    def music_path_at(self, index):
+        """ Returns the path of the music at an index of the music being played. """
+        # If the music is in a playlist, the item is the path, otherwise it is a file in the folder
+        if self.play_folder is None:
+            return self.play_items[index]
+        return path.join(self.play_folder, self.play_items[index])
+
+    def pause(self):
+        """ Pauses the music. """
+        if self.current_music is not None and not self.paused:
+            self.backend.pause()
+            self.crossfader.pause()
+            self.clock.pause()
+            self.paused = True
+            self.emit("paused")
+
+    def unpause(self):
+        """ Resumes the paused music. """
+        if self.paused:
+            self.backend.unpause()
+            self.crossfader.unpause()
+            self.clock.resume()
+            self.paused = False
+            self.emit("unpaused")
+
+    def seek(self, position):
+        """ Moves the playing music to a position in seconds. """
+        if self.current_music is None:
+            return
+        with self.metrics.timed("seek"):
+            position = max(0, min(position, self.current_duration or position))
+            self.backend.seek(position)
+            self.clock.seek(position)
+
+            # A running crossfade no longer matches the music, it starts again near the new end
+            if self.crossfader.fading:
+                self.crossfader.cancel()
+                self.queue_next_music()
+            self.emit("seeked", position)
+
+    def position(self):
+        """ Returns the position in the playing music in seconds. """
+        position = self.clock.position()
+        if self.current_duration:
+            position = min(position, self.current_duration)
+        return position
+
+    def queue_next_music(self):
+        """ Reads the next music in the background and queues it behind the playing music. """
+        self.queued_index = None
+
+        # A playlist still loading reads its next page before playback reaches the end of what is loaded
+        store = self.playlist_store
+        if store is not None and store.loading and self.play_items is store.entries and (
+                self.play_index >= len(store.entries) - PLAYLIST_READ_AHEAD or self.play_order.shuffle
+                or self.play_order.repeat != REPEAT_OFF):
+            self.load_playlist_page()
+        next_index = self.play_order.next(self.play_index, len(self.play_items), ended=True)
+        if next_index is None:
+            self.tasks.cancel("preload")
+            return
+
+        # When crossfading, the next music is decoded for the crossfade instead of queued
+        if self.crossfader.overlap:
+            self.tasks.cancel("preload")
+            self.fade_index = next_index
+            self.crossfader.prepare(self.music_path_at(next_index))
+            return
+
+        next_path = self.music_path_at(next_index)
+
+        def queue_music(music_data):
+            self.backend.queue(next_path, music_data)
+            self.queued_index = next_index
+
+        # The read is replaced if another music starts playing before it finishes
+        self.tasks.submit("preload", self.audio_cache.load, next_path, on_done=queue_music)
+
+    def watch_music_end(self):
+        """ Starts checking for the end of music while music is playing. """
+        if self.watching_end:
+            return
+        self.watching_end = True
+
+        def check_music_end():
+            for _ in range(self.backend.ended()):
+                self.advance_music()
+            self.check_crossfade()
+            if self.current_music is None:
+                self.watching_end = False
+            else:
+                self.master.after(MUSIC_END_INTERVAL, check_music_end)
+
+        self.master.after(MUSIC_END_INTERVAL, check_music_end)
+
+    def check_crossfade(self):
+        """ Starts the crossfade when the playing music is within the overlap of its end. """
+        if self.paused or self.current_music is None:
+            return
+        if self.crossfader.should_start(self.clock.position(), self.current_duration):
+            self.crossfader.start(self.finish_crossfade)
+
+    def finish_crossfade(self, music_path, position):
+        """ Continues the faded in music on the music stream once the crossfade is over, its duration comes with its tags. """
+        with self.metrics.timed("crossfade"):
+            self.play_music(self.fade_index, start=position)
+
+    def advance_music(self):
+        """ Moves on to the next music when the playing music ends. """
+        with self.metrics.timed("advance"):
+            next_index = self.play_order.next(self.play_index, len(self.play_items), ended=True)
+            # If a crossfade is running, it moves on to the next music when it is over
+            if self.crossfader.fading:
+                return
+            # If the queued music has started, it becomes the current music
+            elif self.queued_index is not None:
+                self.clock.advance(self.current_duration)
+                self.current_duration = None
+                self.play_index = self.queued_index
+                self.current_music = self.music_path_at(self.play_index)
+                self.track_gain = self.loudness.gain(self.current_music)
+                self.apply_volume()
+                self.read_metadata(self.current_music)
+                self.read_album_art(self.current_music)
+                self.emit("track", self.play_index, self.current_music)
+                self.read_waveform(self.current_music)
+                self.queue_next_music()
+            # If the next music was not read in time, play it now
+            elif next_index is not None:
+                self.play_music(next_index)
+            # Otherwise playback is finished
+            else:
+                self.current_music = None
+                self.clock.stop()
+                self.emit("finished")
+
+    def stop_music(self):
+        """ Stops the music. """
+        self.backend.stop()
+        self.tasks.cancel("preload")
+        self.crossfader.cancel()
+        self.clock.stop()
+        self.queued_index = None
+        self.current_music = None
+        self.paused = False
+        self.emit("stopped")
+
+    def previous_music(self):
+        """ Plays the music before the playing one in the play order. """
+        if self.play_index is None:
+            return
+        previous_index = self.play_order.previous(self.play_index, len(self.play_items))
+        if previous_index is not None:
+            with self.metrics.timed("skip"):
+                self.play_music(previous_index)
+
+    def next_music(self):
+        """ Plays the music after the playing one in the play order, repeat one does not hold back a skip. """
+        if self.play_index is None:
+            return
+        next_index = self.play_order.next(self.play_index, len(self.play_items))
+        if next_index is not None:
+            with self.metrics.timed("skip"):
+                self.play_music(next_index)
+
+    def set_shuffle(self, shuffle):
+        """ Turns shuffle on or off, turning it on deals a new order. """
+        self.play_order = PlayOrder(shuffle, self.play_order.repeat)
+        if self.play_index is not None:
+            self.play_order.start(self.play_index)
+        if self.current_music is not None:
+            self.queue_next_music()
+
+    def set_repeat(self, repeat):
+        """ Sets the repeat mode to REPEAT_OFF, REPEAT_ALL or REPEAT_ONE. """
+        self.play_order.repeat = repeat
+        if self.current_music is not None:
+            self.queue_next_music()
+
+    def set_volume(self, volume):
+        """ Sets the volume of the music and crossfade, from 0 to 1. """
+        self.volume = volume
+        self.apply_volume()
+        self.emit("volume", volume)
+
+    def apply_volume(self):
+        """ Applies the volume slider, scaled by the loudness gain of the playing music. """
+        self.crossfader.set_volume(self.volume * self.track_gain)
+
+    def analyze_loudness(self, on_done=None):
+        """ Measures the loudness of the music files that were not measured yet in the background, it applies from the next music that starts. """
+        self.tasks.submit("loudness", analyze_library_loudness, self.library, self.loudness, on_done=on_done)
+
+    def set_crossfade(self, seconds):
+        """ Sets the crossfade overlap, it applies from the next music that starts playing. """
+        self.crossfader.overlap = seconds
+
+    def open_playlist(self, playlist_name, on_done, on_error=None):
+        """ Loads the first page of a playlist in the background, the rest is read as it is needed. """
+        playlist_path = path.join(self.music_dir, playlist_name)
+        # The playlist replaces the folder listing, a scan would otherwise keep walking with nobody to hand its results to
+        self.cancel_scan()
+
+        def keep_playlist(playlist_store):
+            # Close the journal of the previous playlist
+            self.close_playlist()
+            self.playlist_store = playlist_store
+            on_done(playlist_store)
+
+        # A playlist reopened while its edits are being written is read once they are on disk
+        self.when_playlist_written(playlist_path, lambda: self.tasks.submit(
+            "music_list", load_playlist, playlist_path, self.resolver, on_done=keep_playlist, on_error=on_error))
+
+    def close_playlist(self):
+        """ Closes the journal of the open playlist, or lets its queued edits close it once they are written. """
+        if self.playlist_store is not None:
+            self.tasks.cancel("playlist_page")
+            self.reading_page = False
+            store, self.playlist_store = self.playlist_store, None
+            self.close_idle_playlist(store)
+
+    def load_playlist_page(self):
+        """ Reads the next page of the open playlist in the background, unless a page is being read or it is all loaded. """
+        store = self.playlist_store
+        if store is None or not store.loading or self.reading_page:
+            return
+        self.reading_page = True
+        self.tasks.submit("playlist_page", store.read_page, PLAYLIST_PAGE, on_done=lambda more: self.add_playlist_page(store))
+
+    def add_playlist_page(self, store):
+        """ Adds the page read to the open playlist and tells the listeners. """
+        self.reading_page = False
+        if store is not self.playlist_store:
+            return
+        self.show_playlist_page(*store.merge_pages())
+
+        # A shuffled or repeating order plays from anywhere in the playlist, so the rest is read straight away
+        if store.loading and self.play_items is store.entries and (
+                self.play_order.shuffle or self.play_order.repeat != REPEAT_OFF):
+            self.load_playlist_page()
+
+    def show_playlist_page(self, index, entry_ids):
+        """ Keeps playback on the same music after entries were added to the open playlist, and tells the listeners. """
+        if not entry_ids:
+            return
+        if self.play_items is self.playlist_store.entries:
+            self.queue_changed(index, len(entry_ids))
+        self.emit("playlist_page", index, entry_ids)
+
+    def edit_playlist(self, store, start, on_done=None, on_error=None):
+        """ Queues an edit of a playlist, edits are written in the background one at a time in the order they were made. """
+        self.playlist_edits.append((store, start, on_done, on_error))
+        if len(self.playlist_edits) == 1:
+            self.next_playlist_edit()
+
+    def next_playlist_edit(self):
+        """ Writes the first queued playlist edit in the background, its entries change once the edit is on disk. """
+        if not self.playlist_edits:
+            return
+        store, start, _, _ = self.playlist_edits[0]
+        key = ("playlist_edit", store.playlist_path)
+
+        # Edits index into the whole playlist, so the rest of it is read first
+        if store.loading:
+            self.tasks.submit(key, store.read_page, on_done=lambda more: self.finish_playlist(store),
+                              on_error=self.fail_playlist_edit)
+            return
+
+        # start gives the function writing the edit and the change to make once it is written, an entry
+        # removed by an earlier edit raises LookupError
+        try:
+            function, arguments, finish = start()
+        except LookupError as error:
+            self.fail_playlist_edit(error)
+            return
+        self.tasks.submit(key, function, *arguments, on_done=lambda result: self.finish_playlist_edit(finish),
+                          on_error=self.fail_playlist_edit)
+
+    def finish_playlist(self, store):
+        """ Adds the rest of a playlist read for an edit, then writes the edit. """
+        pages = store.merge_pages()
+        if store is self.playlist_store:
+            self.show_playlist_page(*pages)
+        self.next_playlist_edit()
+
+    def finish_playlist_edit(self, finish):
+        """ Changes the entries once an edit is on disk, then writes the next edit. """
+        store, _, on_done, _ = self.playlist_edits.popleft()
+        result = finish()
+
+        # Compact once the journal has grown large compared to the playlist, before any other edit is written
+        if store.needs_compaction():
+            self.playlist_edits.appendleft((store, lambda: (store.compact, (), lambda: None), None, None))
+        self.close_idle_playlist(store)
+        self.next_playlist_edit()
+        if on_done is not None:
+            on_done(result)
+
+    def fail_playlist_edit(self, error):
+        """ Drops an edit that could not be written and writes the next one. """
+        store, _, _, on_error = self.playlist_edits.popleft()
+        self.close_idle_playlist(store)
+        self.next_playlist_edit()
+        # An edit of an entry an earlier edit removed is dropped quietly unless someone is waiting for it
+        if on_error is not None:
+            on_error(error)
+        elif not isinstance(error, LookupError):
+            raise error
+
+    def close_idle_playlist(self, store):
+        """ Closes the journal of a playlist that is no longer open once its last edit is written, and runs what waited for its edits. """
+        if store is not self.playlist_store and all(edit[0] is not store for edit in self.playlist_edits):
+            store.close()
+        if all(edit[0].playlist_path != store.playlist_path for edit in self.playlist_edits):
+            for function in self.playlist_waiters.pop(store.playlist_path, ()):
+                function()
+
+    def when_playlist_written(self, playlist_path, function):
+        """ Calls function once the queued edits of a playlist are on disk, or right away if there are none. """
+        if any(edit[0].playlist_path == playlist_path for edit in self.playlist_edits):
+            self.playlist_waiters.setdefault(playlist_path, []).append(function)
+        else:
+            function()
+
+    def add_to_playlist(self, music_path, on_done=None, on_error=None):
+        """ Adds a music file to the open playlist, on_done is called with its entry ID once it is saved as one journal line. """
+        store = self.playlist_store
+        if store is None:
+            return
+
+        def start():
+            def finish():
+                entry_id = store.apply_edit(APPEND, music_path)
+                index = len(store.entries) - 1
+                if store is self.playlist_store:
+                    if self.play_items is store.entries:
+                        self.queue_changed(index, 1)
+                    self.emit("playlist_changed", None, index, entry_id)
+                return entry_id
+            return store.write_edit, (APPEND, music_path), finish
+        self.edit_playlist(store, start, on_done, on_error)
+
+    def remove_from_playlist(self, index, on_done=None, on_error=None):
+        """ Removes the music file at an index of the open playlist once it is saved as one journal line, on_done is called with its entry ID. """
+        store = self.playlist_store
+        if store is None:
+            return
+        # Earlier edits may move the entry before this one is written, so it is followed by its ID
+        entry_id = store.entries.id_at(index)
+
+        def start():
+            index = store.entries.index_of(entry_id)
+
+            def finish():
+                store.apply_edit(REMOVE, index)
+                if store is self.playlist_store:
+                    if self.play_items is store.entries:
+                        self.queue_changed(index, -1)
+                    self.emit("playlist_changed", index, None, entry_id)
+                return entry_id
+            return store.write_edit, (REMOVE, index), finish
+        self.edit_playlist(store, start, on_done, on_error)
+
+    def move_in_playlist(self, entry_id, index, on_done=None, on_error=None):
+        """ Moves an entry of the open playlist to an index once it is saved as one journal line, on_done is called with its old index. """
+        store = self.playlist_store
+        if store is None:
+            return
+
+        def start():
+            entries = store.entries
+            old_index = entries.index_of(entry_id)
+            new_index = max(0, min(index, len(entries) - 1))
+
+            def finish():
+                playing = self.play_items is entries and self.play_index is not None and 0 <= self.play_index < len(entries)
+                playing_id = entries.id_at(self.play_index) if playing else None
+                store.apply_edit(MOVE, old_index, new_index)
+
+                # The playing entry keeps its ID wherever the move left it
+                if playing:
+                    self.play_index = entries.index_of(playing_id)
+                    if self.current_music is not None:
+                        self.queue_next_music()
+                if store is self.playlist_store:
+                    self.emit("playlist_changed", old_index, entries.index_of(entry_id), entry_id)
+                return old_index
+            return store.write_edit, (MOVE, old_index, new_index), finish
+        self.edit_playlist(store, start, on_done, on_error)
+
+    def save_playlist(self, on_done=None):
+        """ Compacts the journal of the open playlist into the playlist file in the background, after the edits before it. """
+        store = self.playlist_store
+        if store is not None:
+            self.edit_playlist(store, lambda: (store.compact, (), lambda: None), on_done)
+
+    def create_playlist(self, playlist_name, on_done=None):
+        """ Creates an empty playlist file in the background. """
+        self.close_playlist()
+        self.tasks.submit("new_playlist", create_playlist, path.join(self.music_dir, playlist_name), on_done=on_done)
+
+    def remove_playlist(self, playlist_name):
+        """ Removes a playlist file and its journal. """
+        playlist_path = path.join(self.music_dir, playlist_name)
+        self.close_playlist()
+        # Edits of the playlist that are still queued are dropped with it, the one being written finishes first
+        for edit in list(self.playlist_edits)[1:]:
+            if edit[0].playlist_path == playlist_path:
+                self.playlist_edits.remove(edit)
+        PlaylistStore(playlist_path).delete()
+
+    def read_metadata(self, file_path):
+        """ Reads the metadata of the playing music. """
+        # Get the metadata from the library index in the background, a newer track replaces an older request
+        self.tasks.submit("metadata", self.library.metadata, file_path,
+                          on_done=lambda metadata: self.show_metadata(metadata, file_path))
+
+    def show_metadata(self, metadata, file_path):
+        """ Keeps the metadata of the playing music and tells the listeners. """
+        if metadata:
+            self.current_duration = metadata["duration"] or 0
+
+            # Tags are read lazily, so the search index learns them as music is played
+            if self.search_index is not None:
+                self.search_index.update(path.normpath(path.abspath(file_path)), metadata)
+        self.emit("metadata", metadata)
+
+    def read_album_art(self, file_path):
+        """ Reads the album art of the playing music. """
+        # Decode the art in the background, a newer track replaces an older request
+        self.tasks.submit("album_art", self.album_art.thumbnail, file_path,
+                          on_done=lambda thumbnail: self.show_album_art(thumbnail, file_path))
+
+    def show_album_art(self, thumbnail, file_path):
+        """ Tells the listeners the album art of the playing music, thumbnail is None if it has none. """
+        if file_path == self.current_music:
+            self.emit("album_art", thumbnail)
+
+    def read_waveform(self, file_path):
+        """ Reads the waveform of the playing music. """
+        if self.waveforms is None:
+            return
+
+        # A waveform in memory is shown right away, otherwise the old one is cleared until it is read
+        waveform = self.waveforms.cached(file_path)
+        self.emit("waveform", waveform)
+        if waveform is None:
+            self.tasks.submit("waveform", self.waveforms.load, file_path,
+                              on_done=lambda waveform: self.show_waveform(waveform, file_path))
+
+    def show_waveform(self, waveform, file_path):
+        """ Tells the listeners the waveform of the playing music, waveform is None if it could not be decoded. """
+        if file_path == self.current_music:
+            self.emit("waveform", waveform)
+
+    def start_watching(self, watcher):
+        """ Starts polling the library watcher. """
+        self.watcher = watcher
+        self.master.after(WATCH_INTERVAL, self.check_library)
+
+    def check_library(self):
+        """ Polls the library watcher in the background, the next poll is scheduled once this one is applied. """
+        if self.watcher is None:
+            return
+
+        def watch_failed(error):
+            self.master.after(WATCH_INTERVAL, self.check_library)
+            raise error
+
+        self.tasks.submit("watch", self.watcher.poll, on_done=self.apply_library_changes, on_error=watch_failed)
+
+    def apply_library_changes(self, changes):
+        """ Updates the indexes and tells the listeners about the changes the library watcher saw. """
+        if self.watcher is not None:
+            self.master.after(WATCH_INTERVAL, self.check_library)
+        if not changes:
+            return
+
+        with self.metrics.timed("library_changes"):
+            # If the watcher lost track of the changes, the indexes are rebuilt
+            if any(change.kind == "rescan" for change in changes):
+                self.tasks.submit("fingerprints", self.resolver.build)
+                self.search_stale = True
+                self.refresh_track_store()
+                self.emit("library_changed", changes)
+                return
+
+            folders = set()
+            for change in changes:
+                removed = change.old_path if change.kind == "renamed" else change.path
+                # Only music files and folders are in the library index, playlist journals are not
+                if not (change.is_dir or is_music_file(change.path) or is_music_file(removed)):
+                    continue
+                folders.add(path.dirname(change.path))
+                if change.kind == "renamed":
+                    folders.add(path.dirname(change.old_path))
+                if change.is_dir and change.kind != "removed":
+                    folders.add(change.path)
+                # The music files in a folder are not reported one by one, so the search index is rebuilt with the track store
+                if change.is_dir:
+                    self.search_stale = True
+
+                # Forget removed and changed music files, and make new ones searchable
+                if is_music_file(removed) and change.kind != "added":
+                    self.audio_cache.invalidate(removed)
+                    self.loudness.forget(removed)
+                    if self.search_index is not None and change.kind != "changed":
+                        self.search_index.remove(removed)
+                if (is_music_file(change.path) and change.kind in ("added", "renamed")
+                        and self.search_index is not None):
+                    self.search_index.add(change.path)
+
+            # Rescan the changed folders and fingerprint the new music files in the background
+            self.tasks.submit(("library_changes", next(self.change_batches)), update_indexes,
+                              self.library, self.resolver, changes, folders, on_done=self.refresh_track_store)
+            self.emit("library_changed", changes)
+
+    def queue_changed(self, position, inserted):
+        """ Keeps the playing and queued indexes on the same music after items were inserted at position, or removed if inserted is negative. """
+        if self.play_index is None:
+            return
+        if inserted < 0 and position <= self.play_index < position - inserted:
+            # The playing music was removed, it plays on and the music after it is the one now at position,
+            # which at the top of the queue is the first one
+            self.play_index = position - 1 if position > 0 else BEFORE_FIRST
+        elif position <= self.play_index:
+            self.play_index += inserted
+
+        # The music queued behind the playing one may have moved, so it is queued again, a shuffled or repeating order may change anywhere
+        changes_order = self.play_order.shuffle or self.play_order.repeat != REPEAT_OFF
+        if self.current_music is not None and (changes_order or position <= self.play_index + 1):
+            self.queue_next_music()
+
+    def stats(self):
+        """ Returns the latencies, histograms and counters, with the library I/O, the cache stats and the memory of the track store and search index. """
+        stats = self.metrics.snapshot()
+        stats["library_io"] = self.library.io_stats()
+        stats["audio_cache"] = self.audio_cache.stats()
+        stats["thumbnails"] = self.album_art.cache.stats()
+        if self.track_store is not None:
+            stats["track_store"] = self.track_store.memory_usage()
+        if self.search_index is not None:
+            stats["search_index"] = self.search_index.memory_usage()
+        return stats
+
+    def export_stats(self, stats_path=DEFAULT_STATS_PATH):
+        """ Writes the stats to a JSON file and returns its path. """
+        export_stats(self.stats(), stats_path)
+        return stats_path
+
+    def toggle_profiler(self, dump_path=DEFAULT_PROFILE_PATH):
+        """ Starts profiling the event loop, or stops and dumps the profile to a file, returns whether it is profiling. """
+        return self.profiler.toggle(dump_path)
+
+    def set_instrumentation(self, enabled):
+        """ Turns latency recording, counters and stall checks on or off. """
+        self.metrics.enabled = enabled
+        if enabled:
+            self.stall_monitor.start()
+        else:
+            self.stall_monitor.stop()
+
+    def close(self):
+        """ Stops the music, the library scan and watcher and the background tasks. """
+        self.stall_monitor.stop()
+        self.stop_music()
+        self.cancel_scan()
+        # Playlist edits the user made are written before the background tasks stop
+        self.tasks.wait_for(lambda: not self.playlist_edits)
+        self.close_playlist()
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        if self.waveforms is not None:
+            self.waveforms.close()
+        self.tasks.shutdown()
+
+def list_playlists(music_dir):
+    """ Returns the playlist files in the music folder. """
+    return [f for f in listdir(music_dir) if is_playlist_file(f)]
+
+def load_playlist(playlist_path, resolver, page_size=PLAYLIST_PAGE):
+    """ Returns the store of a playlist file with its first page read, or all of it with its journal replayed, and missing music files remapped. """
+    return PlaylistStore(playlist_path, resolve=resolver.resolve).load(page_size)
+
+def is_music_file(file_path):
+    """ Returns whether a path is a music file. """
+    return file_path.lower().endswith(".mp3")
+
+def update_indexes(library, resolver, changes, folders):
+    """ Rescans changed folders in the library index and updates the fingerprints of changed music files. """
+    for folder_path in folders:
+        # A sibling such as /music2 only shares a prefix with /music, so the music folder is matched with its separator
+        folder_path = path.normpath(folder_path)
+        if path.isdir(folder_path) and (folder_path + path.sep).startswith(library.music_dir + path.sep):
+            library.scan_folder(folder_path)
+    for change in changes:
+        if change.kind == "renamed" and is_music_file(change.old_path):
+            resolver.remove(change.old_path)
+        if not is_music_file(change.path):
+            continue
+        if change.kind == "removed":
+            resolver.remove(change.path)
+        elif path.exists(change.path):
+            resolver.add(change.path)
+
+def load_track_store(store_path):
+    """ Returns the track store saved last time mapped into memory, or None if there is none that can be read. """
+    try:
+        return TrackStore.load(store_path)
+    except (OSError, ValueError):
+        return None
+
+def build_track_store(library, store_path):
+    """ Returns a track store of every music file in the library index and saves it for the next start. """
+    track_store = library.track_store()
+    try:
+        track_store.save(store_path)
+    except OSError:
+        # A store that cannot be saved still serves this run, the next start rebuilds it
+        pass
+    return track_store
+
+def build_search_index(track_store):
+    """ Returns a search index over every music file in a track store. """
+    search_index = SearchIndex()
+    search_index.add_many((track.path, track.tags()) for track in track_store)
+    return search_index
+
+def analyze_library_loudness(library, loudness):
+    """ Measures the loudness of every music file under the music folder that changed since it was last measured. """
+    return analyze_library(loudness, [music_path for music_path, _ in library.all_tracks()])
+
+def create_playlist(playlist_path):
+    """ Creates an empty playlist file. """
+    with open(playlist_path, "w") as playlist_file:
+        pass
+
+def run_daemon(music_dir, backend, stats_path=None, remote=False):
+    """ Plays every music file in the music folder without a window until playback is finished, then writes the stats if asked. """
+    from headless_loop import HeadlessLoop
+    loop = HeadlessLoop()
+    engine = PlayerEngine(loop, backend, music_dir)
+    engine.subscribe("track", lambda index, music_path: print(f"Playing {music_path}"))
+
+    # With the remote control, clients can still play music after the library was played through
+    remote_control = None
+    if remote:
+        from remote_control import RemoteControl
+        remote_control = RemoteControl(engine).start()
+        print(f"Remote control on http://{remote_control.host}:{remote_control.port}"
+              + (f" with token {remote_control.token}" if remote_control.token else ""))
+    else:
+        engine.subscribe("finished", loop.stop)
+
+    def play_library(tracks):
+        if tracks:
+            engine.set_queue([music_path for music_path, _ in tracks])
+            engine.play_music(0)
+        else:
+            loop.stop()
+
+    engine.tasks.submit("music_list", engine.library.all_tracks, on_done=play_library)
+    try:
+        loop.run()
+    finally:
+        if remote_control is not None:
+            remote_control.close()
+        if stats_path is not None:
+            engine.export_stats(stats_path)
+        engine.close()
+
+if __name__ == "__main__":
+    from audio_backend import NullBackend, PygameBackend
+    arguments = [argument for argument in argv[1:] if not argument.startswith("--")]
+    run_daemon(arguments[0] if arguments else default_music_dir(), NullBackend() if "--null" in argv else PygameBackend(),
+               DEFAULT_STATS_PATH if "--stats" in argv else None, "--remote" in argv)
@@ -0,0 +1,395 @@
+from os import path, mkdir, remove, rename
+from shutil import copyfile
+from subprocess import run
+from sys import executable
+from time import perf_counter
+import pytest
+from audio_backend import NullBackend
+from headless_loop import HeadlessLoop
+from player_engine import PlayerEngine, update_indexes
+from playlist_model import REPEAT_ALL, REPEAT_ONE
+from track_store import TrackStore
+from waveform import WaveformCache
+
+SAMPLE_MUSIC = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+NAMES = ["01 First.mp3", "02 Second.mp3", "03 Third.mp3"]
+
+@pytest.fixture
+def engine(tmp_path):
+    """ Creates an engine on a virtual clock over a music folder with one album of three music files. """
+    album_path = str(tmp_path / "music" / "album")
+    mkdir(str(tmp_path / "music"))
+    mkdir(album_path)
+    for name in NAMES:
+        copyfile(SAMPLE_MUSIC, path.join(album_path, name))
+
+    loop = HeadlessLoop(virtual=True)
+    engine = PlayerEngine(loop, NullBackend(clock=loop.time, default_length=60), str(tmp_path / "music"),
+                          str(tmp_path / "index.db"))
+    engine.loop = loop
+    engine.album_path = album_path
+    engine.tasks.wait()
+    yield engine
+    engine.close()
+
+def play_album(engine):
+    """ Queues the album and plays its first music file. """
+    engine.set_queue(NAMES, engine.album_path)
+    engine.play_music(0)
+    engine.tasks.wait()
+
+def test_plays_through_folder_without_gaps(engine):
+    """ Test that each music file starts when the one before it ends and playback finishes after the last. """
+    tracks = []
+    finished = []
+    engine.subscribe("track", lambda index, music_path: tracks.append(index))
+    engine.subscribe("finished", lambda: finished.append(True))
+    play_album(engine)
+
+    for _ in NAMES:
+        engine.loop.advance(60.1)
+        engine.tasks.wait()
+
+    assert tracks == [0, 1, 2]
+    assert finished == [True]
+    assert engine.current_music is None
+    assert engine.metrics.summary()["advance"]["count"] == 3
+
+def test_pause_stops_the_clock(engine):
+    """ Test that time spent paused does not count towards the end of the music. """
+    play_album(engine)
+    engine.loop.advance(30)
+    engine.pause()
+    engine.loop.advance(1000)
+    engine.unpause()
+    engine.loop.advance(20)
+
+    assert engine.backend.elapsed() == pytest.approx(50)
+    assert engine.position() == pytest.approx(50)
+    assert engine.current_music == path.join(engine.album_path, NAMES[0])
+
+def test_seek_moves_the_end_of_music(engine):
+    """ Test that seeking moves the position and brings the end of the music closer. """
+    tracks = []
+    engine.subscribe("track", lambda index, music_path: tracks.append(index))
+    play_album(engine)
+    engine.seek(50)
+    engine.loop.advance(5)
+    assert engine.position() == pytest.approx(55)
+
+    engine.loop.advance(5.1)
+    engine.tasks.wait()
+    assert tracks == [0, 1]
+    assert engine.position() < 1
+
+def test_previous_and_next_stay_in_queue(engine):
+    """ Test that skipping stops at the first and last music file. """
+    play_album(engine)
+    engine.previous_music()
+    assert engine.play_index == 0
+
+    for _ in NAMES:
+        engine.next_music()
+    assert engine.play_index == 2
+    assert engine.metrics.summary()["skip"]["count"] == 2
+
+def test_shuffle_and_repeat(engine):
+    """ Test that shuffle plays every music file once and repeat one plays the same one again. """
+    tracks = []
+    engine.subscribe("track", lambda index, music_path: tracks.append(index))
+    engine.set_shuffle(True)
+    play_album(engine)
+    for _ in NAMES:
+        engine.loop.advance(60.1)
+        engine.tasks.wait()
+    assert sorted(tracks) == [0, 1, 2]
+    assert engine.current_music is None
+
+    tracks.clear()
+    engine.set_repeat(REPEAT_ONE)
+    play_album(engine)
+    engine.loop.advance(60.1)
+    engine.tasks.wait()
+    assert tracks == [0, 0]
+
+    # A skip moves on even when repeating one, repeat all wraps around to the start of the order
+    engine.set_repeat(REPEAT_ALL)
+    for _ in NAMES:
+        engine.next_music()
+    assert engine.play_index == 0
+
+def test_playlist_move_keeps_the_playing_entry(engine):
+    """ Test that moving entries of a playing playlist with duplicates keeps the engine on the same entry. """
+    opened = []
+    engine.create_playlist("Mix.txt")
+    engine.tasks.wait()
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+    first = path.join(engine.album_path, NAMES[0])
+    entry_ids = []
+    for music_path in (first, first, path.join(engine.album_path, NAMES[1])):
+        engine.add_to_playlist(music_path, on_done=entry_ids.append)
+    engine.tasks.wait()
+    entries = opened[-1].entries
+    engine.set_queue(entries)
+    engine.play_music(1)
+
+    engine.move_in_playlist(entry_ids[2], 0)
+    engine.tasks.wait()
+    assert engine.play_index == entries.index_of(entry_ids[1]) == 2
+    engine.remove_from_playlist(entries.index_of(entry_ids[0]))
+    engine.tasks.wait()
+    assert engine.play_index == 1
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+    assert opened[-1].entries == [path.join(engine.album_path, NAMES[1]), first]
+
+def test_playlist_edits(engine):
+    """ Test that playlists are created, edited and reopened through the engine. """
+    opened = []
+    engine.create_playlist("Mix.txt")
+    engine.tasks.wait()
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+    engine.add_to_playlist(path.join(engine.album_path, NAMES[0]))
+    engine.add_to_playlist(path.join(engine.album_path, NAMES[1]))
+    engine.tasks.wait()
+    engine.remove_from_playlist(0)
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+
+    assert opened[-1].entries == [path.join(engine.album_path, NAMES[1])]
+
+def test_playlist_edits_are_written_off_the_event_loop(engine, monkeypatch):
+    """ Test that an edit is written in the background and changes the entries once it is on disk, in the order made. """
+    opened = []
+    engine.remove_from_playlist(0)
+    engine.create_playlist("Mix.txt")
+    engine.tasks.wait()
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+    store = opened[-1]
+    written = []
+    write_edit = store.write_edit
+    monkeypatch.setattr(store, "write_edit", lambda *edit: written.append(edit) or write_edit(*edit))
+
+    engine.add_to_playlist(path.join(engine.album_path, NAMES[0]))
+    engine.add_to_playlist(path.join(engine.album_path, NAMES[1]))
+    engine.save_playlist()
+    assert len(store.entries) == 0
+
+    engine.tasks.wait()
+    assert [edit[0] for edit in written] == ["A", "A"]
+    assert store.entries == [path.join(engine.album_path, NAMES[0]), path.join(engine.album_path, NAMES[1])]
+    assert not path.exists(store.journal_path)
+
+def test_long_playlist_is_paged_in_as_it_plays(engine):
+    """ Test that a long M3U playlist opens with its first page, reads the next as playback nears its end, and reads the rest before an edit. """
+    with open(path.join(engine.music_dir, "Long.m3u8"), "w", encoding="utf-8") as playlist_file:
+        playlist_file.write("#EXTM3U\n")
+        for i in range(2500):
+            playlist_file.write(f"#EXTINF:60,Track {i}\nalbum/{NAMES[i % 3]}\n")
+    opened = []
+    pages = []
+    engine.subscribe("playlist_page", lambda index, entry_ids: pages.append((index, len(entry_ids))))
+    engine.open_playlist("Long.m3u8", on_done=opened.append)
+    engine.tasks.wait()
+    entries = opened[-1].entries
+    assert len(entries) == 1000 and opened[-1].loading
+    assert opened[-1].info[path.join(engine.album_path, NAMES[0])].duration == 60
+
+    # Playing near the end of the first page reads the second
+    engine.set_queue(entries)
+    engine.play_music(950)
+    engine.tasks.wait()
+    assert pages == [(1000, 1000)] and len(entries) == 2000
+
+    engine.add_to_playlist(path.join(engine.album_path, NAMES[0]))
+    engine.tasks.wait()
+    assert pages == [(1000, 1000), (2000, 500)] and len(entries) == 2501
+    assert not opened[-1].loading and engine.play_index == 950
+
+def test_thousands_of_operations_per_second(engine):
+    """ Test that the engine can be driven at scale without a sound card. """
+    play_album(engine)
+    started = perf_counter()
+    for _ in range(1000):
+        engine.next_music()
+        engine.pause()
+        engine.unpause()
+        engine.previous_music()
+        engine.loop.advance(0.1)
+    elapsed = perf_counter() - started
+
+    assert engine.play_index == 0
+    assert 5000 / elapsed > 1000
+
+def test_album_art_follows_the_playing_music(engine):
+    """ Test that the album art of each music file is handed over once it is read. """
+    art = []
+    engine.subscribe("album_art", art.append)
+    play_album(engine)
+    engine.loop.advance(60.1)
+    engine.tasks.wait()
+
+    assert len(art) == 2
+
+def test_loudness_gain_scales_the_volume(engine):
+    """ Test that the stored loudness of a music file scales the volume slider when it starts. """
+    first, second = (path.join(engine.album_path, name) for name in NAMES[:2])
+    engine.loudness.put(first, -8, 0.5, 0, 0)
+    engine.set_volume(0.5)
+    play_album(engine)
+    assert engine.backend.volume == pytest.approx(0.5 * 10 ** (-10 / 20))
+
+    engine.loop.advance(60.1)
+    assert engine.current_music == second
+    assert engine.backend.volume == pytest.approx(0.5)
+
+def test_waveform_is_shown_right_away_when_replayed(engine, tmp_path):
+    """ Test that the waveform is cleared until it is computed, and handed over at once when the music is played again. """
+    engine.waveforms = WaveformCache(str(tmp_path / "waveforms"))
+    waveforms = []
+    engine.subscribe("waveform", waveforms.append)
+    play_album(engine)
+    assert waveforms[0] is None
+    assert waveforms[1].duration > 0
+
+    engine.next_music()
+    engine.tasks.wait()
+    engine.previous_music()
+    assert waveforms[-1] is waveforms[1]
+
+def test_scan_finds_nested_music_files(engine):
+    """ Test that a scan hands the music files in nested folders over in batches and reports its throughput. """
+    disc_path = path.join(engine.album_path, "Disc 2")
+    mkdir(disc_path)
+    copyfile(SAMPLE_MUSIC, path.join(disc_path, "01 Fourth.mp3"))
+    found = []
+    done = []
+    engine.scan_music(engine.music_dir, on_batch=found.extend, on_done=done.append)
+    engine.tasks.wait()
+
+    assert sorted(found) == sorted([path.join(engine.album_path, name) for name in NAMES]
+                                   + [path.join(disc_path, "01 Fourth.mp3")])
+    assert done[0].files == 4
+    assert engine.scanner is None
+    assert engine.metrics.summary()["scan_first_results"]["count"] == 1
+
+def test_opening_a_playlist_stops_the_scan(engine):
+    """ Test that a playlist opened while a scan is going on cancels the scan instead of leaving it running. """
+    opened = []
+    engine.create_playlist("Mix.txt")
+    engine.tasks.wait()
+    engine.scan_music(engine.music_dir, on_batch=lambda paths: None)
+    scanner = engine.scanner
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+
+    assert scanner.cancelled.is_set()
+    assert engine.scanner is None
+    assert opened[-1].entries == []
+
+def test_stats_count_io_and_export(engine, tmp_path):
+    """ Test that the stats count the folders scanned and bytes read, and are written to a file. """
+    engine.scan_music(engine.music_dir, on_batch=lambda paths: None)
+    engine.tasks.wait()
+    play_album(engine)
+    engine.loop.advance(1)
+    stats = engine.stats()
+
+    assert stats["counters"]["files_scanned"] == 3
+    assert stats["library_io"]["folders_listed"] >= 2
+    assert stats["audio_cache"]["bytes_read"] == path.getsize(SAMPLE_MUSIC)
+    assert "event_loop_stalls" not in stats["counters"]
+    assert stats["histograms"]["play"]
+    assert stats["track_store"]["tracks"] == 3
+    assert stats["search_index"]["tracks"] == 3
+    assert path.exists(engine.export_stats(str(tmp_path / "stats.json")))
+
+def test_music_is_cached_once_it_is_replayed(engine):
+    """ Test that music played for the first time is read from disk once, and is cached when it is replayed. """
+    play_album(engine)
+    # Only the next music is read, to queue it
+    assert (engine.audio_cache.hits, engine.audio_cache.misses) == (0, 2)
+    assert engine.audio_cache.bytes_read == path.getsize(SAMPLE_MUSIC)
+
+    engine.play_music(0)
+    engine.tasks.wait()
+    assert (engine.audio_cache.hits, engine.audio_cache.misses) == (1, 3)
+
+    engine.play_music(0)
+    engine.tasks.wait()
+    assert (engine.audio_cache.hits, engine.audio_cache.misses) == (3, 3)
+
+def test_library_changes_are_applied(engine):
+    """ Test that music files added to and removed from the music folder are searchable without a rebuild. """
+    changes = []
+    engine.subscribe("library_changed", changes.append)
+    engine.tasks.wait()
+    copyfile(SAMPLE_MUSIC, path.join(engine.album_path, "04 Fourth.mp3"))
+    remove(path.join(engine.album_path, NAMES[0]))
+    engine.check_library()
+    engine.tasks.wait()
+
+    kinds = {(change.kind, path.basename(change.path)) for change in changes[0]}
+    assert kinds == {("added", "04 Fourth.mp3"), ("removed", NAMES[0])}
+    assert engine.search("fourth") == [path.join(engine.album_path, "04 Fourth.mp3")]
+    assert engine.search("first") == []
+    assert len(engine.library.all_tracks()) == 3
+    assert engine.track_store.find(path.join(engine.album_path, "04 Fourth.mp3")) is not None
+    assert engine.track_store.find(path.join(engine.album_path, NAMES[0])) is None
+
+def test_folder_next_to_the_music_folder_is_not_scanned(engine, tmp_path):
+    """ Test that a folder whose path only starts with the music folder's path is left out of the library index. """
+    mkdir(str(tmp_path / "music2"))
+    update_indexes(engine.library, engine.resolver, [], [str(tmp_path / "music2")])
+
+    assert engine.library.connection.execute(
+        "SELECT path FROM folders WHERE path = ?", (str(tmp_path / "music2"),)).fetchone() is None
+
+def test_renamed_folder_is_searched_by_its_new_paths(engine):
+    """ Test that the music files of a renamed folder are searched under their new paths only. """
+    engine.tasks.wait()
+    renamed_path = path.join(engine.music_dir, "renamed")
+    rename(engine.album_path, renamed_path)
+    engine.check_library()
+    engine.tasks.wait()
+
+    assert engine.search("second") == [path.join(renamed_path, NAMES[1])]
+
+def test_track_store_is_saved_for_the_next_start(engine):
+    """ Test that the track store is saved next to the library index and maps back with every music file. """
+    saved = TrackStore.load(engine.track_store_path)
+    assert [track.name for track in saved] == NAMES
+    assert saved.find(path.join(engine.album_path, NAMES[1])) == 1
+    saved.close()
+
+def test_queue_follows_removed_items(engine):
+    """ Test that the playing index stays on the playing music when items before it are removed. """
+    play_album(engine)
+    engine.next_music()
+    engine.queue_changed(0, -1)
+    engine.tasks.wait()
+
+    assert engine.play_index == 0
+    assert engine.queued_index == 1
+
+def test_engine_leaves_pygame_until_music_is_played(tmp_path):
+    """ Test that building an engine, with either backend, does not import pygame. """
+    script = ("import sys\n"
+              "from audio_backend import NullBackend, PygameBackend\n"
+              "from headless_loop import HeadlessLoop\n"
+              "from player_engine import PlayerEngine\n"
+              "for name, backend in (('null', NullBackend()), ('pygame', PygameBackend())):\n"
+              "    engine = PlayerEngine(HeadlessLoop(), backend, sys.argv[1], sys.argv[1] + '/' + name + '.db')\n"
+              "    engine.tasks.wait()\n"
+              "    engine.close()\n"
+              "print('pygame' in sys.modules)\n")
+    result = run([executable, "-c", script, str(tmp_path)], cwd=path.dirname(path.abspath(__file__)),
+                 capture_output=True, text=True, check=True)
+
+    assert result.stdout.split()[-1:] == ["False"]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,106 @@
+""" playlist_formats.py
+
+Design:
+class PlaylistItem:
+    music file path, and the duration and title the playlist gives it
+
+def is_playlist_file / is_m3u
+    check the extension of a file name
+
+def parse_extinf
+    split #EXTINF line into duration and title
+
+def read_playlist
+    open playlist file in its encoding
+    yield each entry as its line is read
+    for M3U, skip comments, remember the #EXTINF before an entry, make relative paths absolute
+
+def write_entry
+    write an entry in the format of the playlist file
+
+The playlist files the music player reads. The player's own playlists are plain
+text, one music file path per line. M3U playlists, written by most other
+players, have comment lines starting with "#", and an "#EXTINF:duration,title"
+line before an entry gives its duration in seconds and the title to show, so an
+M3U playlist is shown without reading any tags. Paths in an M3U playlist may be
+relative to the folder the playlist is in. An .m3u8 file is UTF-8; an .m3u file
+has no declared encoding, it is read as UTF-8 and bytes that are not UTF-8 are
+kept as they are, the way the file system gives them. Entries are yielded as
+their lines are read, so a long playlist is never held in memory as lines.
+"""
+
+import ntpath
+from collections import namedtuple
+from os import path
+
+PLAYLIST_EXTENSIONS = (".txt", ".m3u", ".m3u8")
+M3U_EXTENSIONS = (".m3u", ".m3u8")
+M3U_HEADER = "#EXTM3U"
+EXTINF = "#EXTINF:"
+
+PlaylistItem = namedtuple("PlaylistItem", "path duration title")
+
+def is_playlist_file(name):
+    """ Returns whether a file name is a playlist the music player reads. """
+    return name.lower().endswith(PLAYLIST_EXTENSIONS)
+
+def is_m3u(name):
+    """ Returns whether a file name is an M3U playlist. """
+    return name.lower().endswith(M3U_EXTENSIONS)
+
+def playlist_encoding(playlist_path):
+    """ Returns the encoding and error handling a playlist file is read and written with. """
+    if playlist_path.lower().endswith(".m3u8"):
+        return "utf-8", "strict"
+    if is_m3u(playlist_path):
+        return "utf-8", "surrogateescape"
+    # Plain text playlists are read as they always were, in the locale's encoding
+    return None, None
+
+def parse_extinf(line):
+    """ Returns the duration in seconds and the title of an #EXTINF line, either may be None. """
+    duration, _, title = line[len(EXTINF):].partition(",")
+    # Attributes such as tvg-id="..." may follow the duration, and -1 means the duration is unknown
+    try:
+        seconds = float(duration.split()[0])
+    except (ValueError, IndexError):
+        seconds = None
+    if seconds is not None and seconds < 0:
+        seconds = None
+    return seconds, title.strip() or None
+
+def read_playlist(playlist_path):
+    """ Yields the entries of a playlist file as PlaylistItems, reading a line at a time. """
+    encoding, errors = playlist_encoding(playlist_path)
+    m3u = is_m3u(playlist_path)
+    folder = path.dirname(path.abspath(playlist_path))
+    # A byte order mark some editors put at the start of an M3U playlist is skipped
+    with open(playlist_path, "r", encoding="utf-8-sig" if m3u else encoding, errors=errors) as playlist_file:
+        # Every line of a plain text playlist is an entry, as it has always been
+        if not m3u:
+            for line in playlist_file:
+                yield PlaylistItem(line.rstrip("\n"), None, None)
+            return
+
+        extinf = (None, None)
+        for line in playlist_file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("#"):
+                if line.startswith(EXTINF):
+                    extinf = parse_extinf(line)
+                continue
+
+            # A relative path is relative to the playlist's folder, a URL or a Windows path from another machine is kept as it is
+            if "://" not in line and not path.isabs(line) and not ntpath.isabs(line):
+                line = path.normpath(path.join(folder, line))
+            yield PlaylistItem(line, *extinf)
+            extinf = (None, None)
+
+def write_entry(playlist_file, music_path, info=None, m3u=False):
+    """ Writes an entry to a playlist file, with its #EXTINF line if the playlist is M3U and the entry has one. """
+    if m3u and info is not None and (info.duration is not None or info.title is not None):
+        duration = -1 if info.duration is None else round(info.duration)
+        playlist_file.write(f"{EXTINF}{duration},{info.title or ''}\n")
+    playlist_file.write(music_path + "\n")
@@ -0,0 +1,57 @@
+from os import path
+import pytest
+from playlist_formats import PlaylistItem, is_playlist_file, parse_extinf, read_playlist, write_entry
+
+def write_playlist(tmp_path, name, text, encoding="utf-8"):
+    """ Writes a playlist file and returns its path. """
+    playlist_path = str(tmp_path / name)
+    with open(playlist_path, "w", encoding=encoding, newline="") as playlist_file:
+        playlist_file.write(text)
+    return playlist_path
+
+def test_extinf_gives_duration_and_title():
+    """ Test that the duration and title of #EXTINF lines are read, with attributes and unknown durations handled. """
+    assert parse_extinf("#EXTINF:215,Artist - Title, Part 2") == (215.0, "Artist - Title, Part 2")
+    assert parse_extinf('#EXTINF:-1 tvg-id="radio",Radio') == (None, "Radio")
+    assert parse_extinf("#EXTINF:,") == (None, None)
+
+def test_m3u_entries_are_resolved_against_the_playlist_folder(tmp_path):
+    """ Test that comments are skipped, #EXTINF applies to the next entry only, and relative paths are made absolute. """
+    playlist_path = write_playlist(tmp_path, "Mix.m3u8", "\ufeff#EXTM3U\r\n#EXTINF:180,Song\r\nalbum/01.mp3\r\n"
+                                   "# a comment\r\n\r\n/music/02.mp3\r\nhttp://radio.example/stream\r\n")
+
+    assert list(read_playlist(playlist_path)) == [
+        PlaylistItem(path.join(str(tmp_path), "album", "01.mp3"), 180.0, "Song"),
+        PlaylistItem("/music/02.mp3", None, None),
+        PlaylistItem("http://radio.example/stream", None, None),
+    ]
+
+def test_m3u_keeps_bytes_that_are_not_utf8(tmp_path):
+    """ Test that an .m3u file in another encoding still reads, and writes back the same bytes. """
+    playlist_path = str(tmp_path / "Old.m3u")
+    with open(playlist_path, "wb") as playlist_file:
+        playlist_file.write(b"/music/caf\xe9.mp3\n")
+    item, = read_playlist(playlist_path)
+
+    assert item.path.encode("utf-8", "surrogateescape") == b"/music/caf\xe9.mp3"
+
+def test_text_playlist_lines_are_entries(tmp_path):
+    """ Test that every line of a plain text playlist is an entry, as the player has always read them. """
+    playlist_path = write_playlist(tmp_path, "Playlist 1.txt", "/music/a.mp3\n#not a comment.mp3\n")
+
+    assert [item.path for item in read_playlist(playlist_path)] == ["/music/a.mp3", "#not a comment.mp3"]
+    assert is_playlist_file("Mix.M3U8") and not is_playlist_file("song.mp3")
+
+def test_write_entry_adds_extinf_to_m3u_only(tmp_path):
+    """ Test that an entry with a title is written with its #EXTINF line in an M3U playlist, and plain elsewhere. """
+    playlist_path = str(tmp_path / "Mix.m3u")
+    info = PlaylistItem("/music/a.mp3", 99.6, "A")
+    with open(playlist_path, "w") as playlist_file:
+        write_entry(playlist_file, info.path, info, m3u=True)
+        write_entry(playlist_file, info.path, info, m3u=False)
+
+    with open(playlist_path) as playlist_file:
+        assert playlist_file.read() == "#EXTINF:100,A\n/music/a.mp3\n/music/a.mp3\n"
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,409 @@
+""" playlist_model.py
+
+Design:
+class PlaylistModel (Sequence):
+    def __init__
+        give each music file path an entry ID
+        build the tree of entries in one pass
+
+    def __len__ / __getitem__ / __iter__
+        return number of entries, path at a position or slice, paths in order
+
+    def id_at / path_of / index_of
+        return entry ID at a position, path of an entry, position of an entry
+
+    def ids
+        return entry IDs in order
+
+    def insert / append
+        give music file path a new entry ID
+        split tree at position and join the new entry between the halves
+
+    def extend
+        build a tree of music file paths in one pass and join it after the tree
+
+    def pop / remove
+        split the entry out of the tree and forget its ID
+
+    def move
+        split the entry out and join it back in at its new position
+
+class PlayOrder:
+    def __init__
+        remember shuffle, repeat mode, shuffle key and the position the order starts at
+
+    def start
+        make a position the first step of the shuffled order
+
+    def next
+        if repeat one and music ended, play it again
+        otherwise take the position after this one in the play order
+        wrap around if repeat all, else stop at the end
+
+    def previous
+        take the position before this one in the play order
+        wrap around if repeat all, else stop at the start
+
+    def position_at / step_of
+        map a step of the play order to a position and back, the shuffled order turned to start at its first position
+
+    def permute / unpermute
+        map a step of the shuffle permutation to a position and back without building a list
+
+A playlist kept as an implicit treap: a binary tree ordered by position, where
+each node knows the size of its subtree, and random priorities keep the tree
+balanced. Inserting, removing and moving an entry splits the tree at a position
+and joins the pieces back, which is O(log n) however long the playlist is, where
+a Python list moves every entry after the edit. Every entry has an ID that stays
+the same as entries around it come and go, so the same music file can be in a
+playlist twice and each copy is still edited and played by itself. A dictionary
+maps each ID to its node, and the position of an entry is found by walking up
+to the root, adding the sizes of the subtrees to its left.
+
+The play order never copies the playlist either. Shuffle is a keyed Feistel
+permutation of the positions, walked over positions past the end, so the step
+after any position is computed in O(1) from the position itself and every
+entry plays once before any plays twice. Edits to the playlist only change the
+length the permutation is taken over, and the order carries on from the music
+being played. The shuffled order is turned so the music the user picked is
+its first step, and the rest of the playlist follows it.
+"""
+
+from collections.abc import Sequence
+from itertools import count, islice
+from random import getrandbits, random
+
+REPEAT_OFF = "off"
+REPEAT_ALL = "all"
+REPEAT_ONE = "one"
+# The position before the first one, the play order goes on from it with the first step
+BEFORE_FIRST = -1
+
+FEISTEL_ROUNDS = 4
+
+class PlaylistEntry:
+    """ A node of the playlist tree, one entry of the playlist. """
+    __slots__ = ("entry_id", "path", "priority", "size", "left", "right", "parent")
+
+    def __init__(self, entry_id, music_path):
+        self.entry_id = entry_id
+        self.path = music_path
+        self.priority = random()
+        self.size = 1
+        self.left = None
+        self.right = None
+        self.parent = None
+
+def size_of(node):
+    """ Returns the number of entries in a subtree. """
+    return node.size if node is not None else 0
+
+def update(node):
+    """ Recounts the size of a node's subtree after its children changed and points them back at it. """
+    node.size = 1 + size_of(node.left) + size_of(node.right)
+    if node.left is not None:
+        node.left.parent = node
+    if node.right is not None:
+        node.right.parent = node
+
+def merge(left, right):
+    """ Joins two trees, every entry of left comes before every entry of right. """
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        update(left)
+        return left
+    right.left = merge(left, right.left)
+    update(right)
+    return right
+
+def split(node, position):
+    """ Splits a tree into the entries before a position and the entries from it on. """
+    if node is None:
+        return None, None
+    if size_of(node.left) >= position:
+        left, node.left = split(node.left, position)
+        update(node)
+        return left, node
+    node.right, right = split(node.right, position - size_of(node.left) - 1)
+    update(node)
+    return node, right
+
+def count_sizes(root):
+    """ Counts the size of every subtree of a tree that was just built, children before parents. """
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if node.left is not None:
+            stack.append(node.left)
+        if node.right is not None:
+            stack.append(node.right)
+    for node in reversed(order):
+        update(node)
+
+class PlaylistModel(Sequence):
+    """ The music file paths of a playlist, each with a stable entry ID, edited in O(log n). """
+    def __init__(self, music_paths=()):
+        self.next_id = count(1)
+        self.nodes = {}
+        self.root = None
+        self.extend(music_paths)
+
+    def build(self, music_paths):
+        """ Returns a tree of new entries for music file paths, built in one pass, and their entry IDs. """
+        # A new entry takes the entries with lower priority on the right edge as its left subtree
+        right_edge = []
+        entry_ids = []
+        for music_path in music_paths:
+            node = self.new_entry(music_path)
+            entry_ids.append(node.entry_id)
+            last = None
+            while right_edge and right_edge[-1].priority < node.priority:
+                last = right_edge.pop()
+            node.left = last
+            if right_edge:
+                right_edge[-1].right = node
+            right_edge.append(node)
+        if not right_edge:
+            return None, entry_ids
+        count_sizes(right_edge[0])
+        return right_edge[0], entry_ids
+
+    def new_entry(self, music_path):
+        """ Returns a new entry for a music file path with the next entry ID. """
+        node = PlaylistEntry(next(self.next_id), music_path)
+        self.nodes[node.entry_id] = node
+        return node
+
+    def set_root(self, root):
+        """ Makes a tree the whole playlist. """
+        self.root = root
+        if root is not None:
+            root.parent = None
+
+    def __len__(self):
+        return size_of(self.root)
+
+    def __getitem__(self, index):
+        """ Returns the music file path at a position, or the paths in a slice. """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return [node.path for node in islice(self.walk(start), max(0, stop - start))]
+        return self.node_at(index).path
+
+    def __iter__(self):
+        return (node.path for node in self.walk(0))
+
+    def __eq__(self, other):
+        if isinstance(other, PlaylistModel):
+            other = list(other)
+        return isinstance(other, list) and list(self) == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"PlaylistModel({list(self)!r})"
+
+    def node_at(self, index):
+        """ Returns the entry at a position, negative positions count from the end. """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("playlist index out of range")
+        node = self.root
+        while True:
+            left_size = size_of(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def walk(self, start):
+        """ Yields the entries in order from a position on, without recursion. """
+        # Descend to the start, keeping the entries still to come after it on a stack
+        stack = []
+        node = self.root
+        while node is not None:
+            left_size = size_of(node.left)
+            if start < left_size:
+                stack.append(node)
+                node = node.left
+            elif start == left_size:
+                stack.append(node)
+                break
+            else:
+                start -= left_size + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+    def id_at(self, index):
+        """ Returns the entry ID at a position. """
+        return self.node_at(index).entry_id
+
+    def path_of(self, entry_id):
+        """ Returns the music file path of an entry. """
+        return self.nodes[entry_id].path
+
+    def index_of(self, entry_id):
+        """ Returns the position of an entry, by adding up the entries to its left on the way to the root. """
+        node = self.nodes[entry_id]
+        index = size_of(node.left)
+        while node.parent is not None:
+            if node is node.parent.right:
+                index += size_of(node.parent.left) + 1
+            node = node.parent
+        return index
+
+    def ids(self):
+        """ Returns the entry IDs in order. """
+        return [node.entry_id for node in self.walk(0)]
+
+    def insert(self, index, music_path):
+        """ Inserts a music file path before a position and returns its entry ID. """
+        index = max(0, min(index if index >= 0 else index + len(self), len(self)))
+        node = self.new_entry(music_path)
+        left, right = split(self.root, index)
+        self.set_root(merge(merge(left, node), right))
+        return node.entry_id
+
+    def append(self, music_path):
+        """ Adds a music file path to the end and returns its entry ID. """
+        return self.insert(len(self), music_path)
+
+    def extend(self, music_paths):
+        """ Adds music file paths to the end in O(n) for the new entries and returns their entry IDs. """
+        tree, entry_ids = self.build(music_paths)
+        self.set_root(merge(self.root, tree))
+        return entry_ids
+
+    def pop(self, index=-1):
+        """ Removes the entry at a position and returns its music file path. """
+        node = self.node_at(index)
+        self.remove(node.entry_id)
+        return node.path
+
+    def remove(self, entry_id):
+        """ Removes an entry and returns the position it was at. """
+        index = self.index_of(entry_id)
+        self.detach(index)
+        del self.nodes[entry_id]
+        return index
+
+    def detach(self, index):
+        """ Splits the entry at a position out of the tree and returns it. """
+        left, rest = split(self.root, index)
+        node, right = split(rest, 1)
+        self.set_root(merge(left, right))
+        node.parent = None
+        return node
+
+    def move(self, entry_id, index):
+        """ Moves an entry to a position, counted after it was taken out, and returns the position it was at. """
+        old_index = self.index_of(entry_id)
+        node = self.detach(old_index)
+        index = max(0, min(index, len(self)))
+        left, right = split(self.root, index)
+        self.set_root(merge(merge(left, node), right))
+        return old_index
+
+class PlayOrder:
+    """ The order a playlist plays in, straight or shuffled, with repeat, computed per step without copying the playlist. """
+    def __init__(self, shuffle=False, repeat=REPEAT_OFF, key=None):
+        self.shuffle = shuffle
+        self.repeat = repeat
+        self.key = getrandbits(32) if key is None else key
+        self.first = 0
+
+    def start(self, index):
+        """ Makes a position the first step of the shuffled order, the rest of the playlist plays after it. """
+        self.first = max(0, index)
+
+    def next(self, index, length, ended=False):
+        """ Returns the position to play after a position, or None at the end, ended is True when the music finished by itself. """
+        if length == 0:
+            return None
+        if ended and self.repeat == REPEAT_ONE and 0 <= index < length:
+            return index
+        step = self.step_of(index, length) + 1
+        if step >= length:
+            if self.repeat != REPEAT_ALL:
+                return None
+            step = 0
+        return self.position_at(step, length)
+
+    def previous(self, index, length):
+        """ Returns the position to play before a position, or None at the start. """
+        if length == 0:
+            return None
+        step = self.step_of(index, length) - 1
+        if step < 0:
+            if self.repeat != REPEAT_ALL:
+                return None
+            step = length - 1
+        return self.position_at(step, length)
+
+    def step_of(self, index, length):
+        """ Returns the step of a position, a position outside the playlist comes before the first or after the last step. """
+        if index < 0:
+            return BEFORE_FIRST
+        if index >= length:
+            return length
+        step = self.unpermute(index, length)
+        if self.shuffle:
+            step = (step - self.unpermute(min(self.first, length - 1), length)) % length
+        return step
+
+    def position_at(self, step, length):
+        """ Returns the position played at a step, counted from the first position of the order. """
+        if self.shuffle:
+            step = (step + self.unpermute(min(self.first, length - 1), length)) % length
+        return self.permute(step, length)
+
+    def feistel(self, value, bits, rounds):
+        """ Runs a balanced Feistel network over values of 2 * bits bits, which is a permutation of them. """
+        mask = (1 << bits) - 1
+        left, right = value >> bits, value & mask
+        for round_number in rounds:
+            left, right = right, left ^ (hash((self.key, round_number, right)) & mask)
+        return left << bits | right
+
+    def permute(self, step, length):
+        """ Returns the position at a step of the shuffle permutation. """
+        if not self.shuffle or length < 2:
+            return step
+        # Cycle walk: positions past the end are permuted again until one lands inside the playlist
+        bits = ((length - 1).bit_length() + 1) // 2
+        while True:
+            step = self.feistel(step, bits, range(FEISTEL_ROUNDS))
+            if step < length:
+                return step
+
+    def unpermute(self, index, length):
+        """ Returns the step of the shuffle permutation a position is at. """
+        if not self.shuffle or length < 2:
+            return index
+        # The inverse runs the rounds backwards with the halves swapped
+        bits = ((length - 1).bit_length() + 1) // 2
+        mask = (1 << bits) - 1
+        while True:
+            index = (index & mask) << bits | index >> bits
+            index = self.feistel(index, bits, reversed(range(FEISTEL_ROUNDS)))
+            index = (index & mask) << bits | index >> bits
+            if index < length:
+                return index
@@ -0,0 +1,85 @@
+from random import Random
+from time import perf_counter
+import pytest
+from playlist_model import PlaylistModel, PlayOrder, REPEAT_ALL, REPEAT_OFF, REPEAT_ONE
+
+def test_edits_match_a_list_with_duplicates():
+    """ Test that random inserts, removes and moves match a list, with every entry found by its ID. """
+    rng = Random(7)
+    paths = [f"/music/{i % 10}.mp3" for i in range(500)]
+    model = PlaylistModel(paths)
+    entry_ids = model.ids()
+
+    for _ in range(2000):
+        edit = rng.random()
+        if edit < 0.4:
+            index = rng.randint(0, len(paths))
+            music_path = f"/music/{rng.randrange(10)}.mp3"
+            entry_ids.insert(index, model.insert(index, music_path))
+            paths.insert(index, music_path)
+        elif edit < 0.7 and paths:
+            index = rng.randrange(len(paths))
+            assert model.remove(entry_ids.pop(index)) == index
+            paths.pop(index)
+        elif paths:
+            old_index, new_index = rng.randrange(len(paths)), rng.randrange(len(paths))
+            entry_id = entry_ids.pop(old_index)
+            entry_ids.insert(new_index, entry_id)
+            paths.insert(new_index, paths.pop(old_index))
+            assert model.move(entry_id, new_index) == old_index
+
+    assert model == paths
+    assert model.ids() == entry_ids
+    assert [model.index_of(entry_id) for entry_id in entry_ids] == list(range(len(paths)))
+    assert model[10:20] == paths[10:20] and model[-1] == paths[-1]
+
+def test_duplicates_keep_their_own_ids():
+    """ Test that removing one copy of a music file leaves the other copy's entry alone. """
+    model = PlaylistModel(["/music/a.mp3", "/music/b.mp3", "/music/a.mp3"])
+    first, _, last = model.ids()
+    model.remove(last)
+
+    assert model == ["/music/a.mp3", "/music/b.mp3"]
+    assert model.index_of(first) == 0
+    with pytest.raises(KeyError):
+        model.index_of(last)
+
+def test_large_playlist_edits_are_fast():
+    """ Test that a 100k entry playlist builds quickly and each edit stays far below a millisecond. """
+    started = perf_counter()
+    model = PlaylistModel(f"/music/{i}.mp3" for i in range(100_000))
+    assert perf_counter() - started < 5
+
+    rng = Random(3)
+    started = perf_counter()
+    for _ in range(2000):
+        entry_id = model.insert(rng.randint(0, len(model)), "/music/new.mp3")
+        model.move(entry_id, rng.randint(0, len(model) - 1))
+        model.remove(entry_id)
+    assert (perf_counter() - started) / 6000 < 0.001
+    assert len(model) == 100_000
+
+@pytest.mark.parametrize("length", [1, 2, 3, 17, 1000])
+def test_shuffle_plays_every_entry_once(length):
+    """ Test that walking the shuffled order visits every position once and previous walks it back. """
+    order = PlayOrder(shuffle=True, key=11)
+    played = [order.next(-1, length)]
+    while True:
+        index = order.next(played[-1], length)
+        if index is None:
+            break
+        played.append(index)
+
+    assert sorted(played) == list(range(length))
+    assert [order.previous(index, length) for index in played[1:]] == played[:-1]
+
+def test_repeat_modes():
+    """ Test that repeat all wraps around and repeat one only holds back music that ended by itself. """
+    assert PlayOrder(repeat=REPEAT_OFF).next(2, 3) is None
+    assert PlayOrder(repeat=REPEAT_ALL).next(2, 3) == 0
+    assert PlayOrder(repeat=REPEAT_ALL).previous(0, 3) == 2
+    assert PlayOrder(repeat=REPEAT_ONE).next(1, 3, ended=True) == 1
+    assert PlayOrder(repeat=REPEAT_ONE).next(1, 3) == 2
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
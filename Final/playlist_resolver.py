@@ -0,0 +1,281 @@
+""" playlist_resolver.py
+
+Design:
+def fingerprint
+    map music file into memory
+    hash its size, first few KB and last few KB
+
+def split_music_path
+    split Windows or POSIX music file path into folder name and file name
+
+def file_row
+    return path, file name, folder name, mtime and size of a music file
+
+class PlaylistResolver:
+    def __init__
+        open fingerprint index database
+        create table
+        use the library index given, or open one
+
+    def build
+        build once at a time
+
+    def ensure_built
+        build unless built, or wait for the build in progress
+        take path, mtime and size of every music file from the library index
+        store new or changed music files, dropping their old fingerprints
+        mark music files that are gone as missing, keeping their fingerprints
+        load index into memory
+
+    def add
+        store a new or changed music file, dropping its old fingerprint
+        add it to the index
+
+    def remove
+        mark a music file that is gone as missing, keeping its fingerprint
+
+    def resolve
+        ensure index is built
+        under the lock, keep music file paths that are indexed or exist
+        remap missing music file paths
+        return resolved paths
+
+    def find
+        if path was indexed before it went missing, find music file of the same size with the same fingerprint
+        or, if it was never fingerprinted, the one music file with the same size and mtime
+        otherwise find music files with the same file name
+        prefer the one in a folder with the same name
+        if they are all the same music file, take any of them
+
+    def content
+        return fingerprint of a music file, fingerprinting and storing it the first time
+
+Playlists store absolute paths, so a playlist made on another machine or
+before the music folder moved points at files that do not exist. The resolver
+keeps an index of every music file under the music folder by file name, size
+and mtime, taken from the library index so starting up does not walk or stat
+the disk again. Missing playlist entries are remapped in bulk with dictionary
+lookups. A file that was indexed before and then renamed or moved keeps its
+size and mtime, so it is found again by them. Files are only fingerprinted, by
+hashing their first and last few KB through mmap, when a missing entry has to
+be told apart from files of the same size or name, and the fingerprint is kept
+until the file changes. A path never seen before, such as a Windows path from
+another machine, is matched by file name and folder name.
+"""
+
+import sqlite3
+from hashlib import blake2b
+from mmap import mmap, ACCESS_READ
+from os import path, stat
+from threading import Lock
+
+from library_index import DEFAULT_INDEX_PATH, LibraryIndex
+
+FINGERPRINT_BYTES = 4096
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    folder TEXT,
+    mtime REAL,
+    size INTEGER,
+    hash TEXT,
+    present INTEGER
+);
+"""
+
+def fingerprint(file_path, size):
+    """ Returns a hash of the size and the first and last few KB of a file. """
+    digest = blake2b(str(size).encode(), digest_size=16)
+    if size:
+        with open(file_path, "rb") as music_file, mmap(music_file.fileno(), 0, access=ACCESS_READ) as music_map:
+            digest.update(music_map[:FINGERPRINT_BYTES])
+            digest.update(music_map[-FINGERPRINT_BYTES:])
+    return digest.hexdigest()
+
+def split_music_path(music_path):
+    """ Returns the lowercase folder name and file name of a Windows or POSIX path. """
+    parts = music_path.replace("\\", "/").rstrip("/").split("/")
+    folder = parts[-2].lower() if len(parts) > 1 else ""
+    return folder, parts[-1].lower()
+
+class PlaylistResolver:
+    """ Remaps missing playlist entries to music files under the music folder. """
+    def __init__(self, music_dir, index_path=DEFAULT_INDEX_PATH, library=None):
+        self.music_dir = path.normpath(path.abspath(music_dir))
+        self.connection = sqlite3.connect(index_path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.library = library if library is not None else LibraryIndex(music_dir, index_path)
+        # The lock guards the database and the in-memory lookups, the build lock makes a build run once at a time
+        self.lock = Lock()
+        self.build_lock = Lock()
+        self.built = False
+
+    def build(self):
+        """ Stores the new or changed music files from the library index and loads the index into memory. """
+        with self.build_lock:
+            self.build_index()
+
+    def ensure_built(self):
+        """ Builds the index unless it is built, waiting for a build in progress rather than starting another. """
+        if not self.built:
+            with self.build_lock:
+                if not self.built:
+                    self.build_index()
+
+    def build_index(self):
+        """ Builds the index, the build lock is held. """
+        files = self.library.files()
+        with self.lock:
+            known = {file_path: (mtime, size) for file_path, mtime, size in self.connection.execute(
+                "SELECT path, mtime, size FROM fingerprints")}
+
+            # Only new or changed music files are stored, their fingerprints are taken when they are needed
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO fingerprints (path, name, folder, mtime, size, hash, present) "
+                    "VALUES (?, ?, ?, ?, ?, NULL, 1)",
+                    (file_row(file_path, mtime, size) for file_path, mtime, size in files
+                     if known.get(file_path) != (mtime, size)))
+
+                # Music files that are gone keep their fingerprints, so they can be found again if they moved
+                self.connection.execute("UPDATE fingerprints SET present = 0")
+                self.connection.executemany("UPDATE fingerprints SET present = 1 WHERE path = ?",
+                                            ((file_path,) for file_path, _, _ in files))
+
+            # Load the index into memory for bulk lookups
+            self.present = {}
+            self.missing = {}
+            self.hashes = {}
+            self.by_name = {}
+            self.by_size = {}
+            for file_path, name, folder, mtime, size, content_hash, present in self.connection.execute(
+                    "SELECT path, name, folder, mtime, size, hash, present FROM fingerprints"):
+                if content_hash is not None:
+                    self.hashes[file_path] = content_hash
+                if present:
+                    self.index(file_path, name, folder, mtime, size)
+                else:
+                    self.missing[file_path] = (mtime, size)
+            self.built = True
+
+    def index(self, file_path, name, folder, mtime, size):
+        """ Adds a music file that is present to the in-memory lookups. """
+        self.present[file_path] = (mtime, size)
+        self.by_name.setdefault(name, []).append((folder, file_path))
+        self.by_size.setdefault(size, []).append(file_path)
+
+    def add(self, file_path):
+        """ Stores a new or changed music file and adds it to the index, it is fingerprinted when it is needed. """
+        file_stat = stat(file_path)
+        row = file_row(file_path, file_stat.st_mtime, file_stat.st_size)
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO fingerprints (path, name, folder, mtime, size, hash, present) "
+                    "VALUES (?, ?, ?, ?, ?, NULL, 1)", row)
+            if self.built:
+                self.forget(file_path)
+                self.hashes.pop(file_path, None)
+                self.index(*row)
+
+    def remove(self, file_path):
+        """ Marks a music file that is gone as missing, its fingerprint is kept so it can be found if it moved. """
+        with self.lock:
+            with self.connection:
+                self.connection.execute("UPDATE fingerprints SET present = 0 WHERE path = ?", (file_path,))
+            row = self.connection.execute("SELECT mtime, size FROM fingerprints WHERE path = ?", (file_path,)).fetchone()
+            if self.built and row is not None:
+                self.forget(file_path)
+                self.missing[file_path] = row
+
+    def forget(self, file_path):
+        """ Removes a music file from the in-memory lookups. """
+        self.missing.pop(file_path, None)
+        stamp = self.present.pop(file_path, None)
+        name = path.basename(file_path).lower()
+        candidates = [candidate for candidate in self.by_name.get(name, ()) if candidate[1] != file_path]
+        if candidates:
+            self.by_name[name] = candidates
+        else:
+            self.by_name.pop(name, None)
+        if stamp is not None:
+            same_size = [candidate for candidate in self.by_size[stamp[1]] if candidate != file_path]
+            if same_size:
+                self.by_size[stamp[1]] = same_size
+            else:
+                del self.by_size[stamp[1]]
+
+    def resolve(self, entries):
+        """ Returns the playlist entries with the missing music files remapped, unresolved ones are kept. """
+        # A playlist opened while the index is being built waits for that build rather than starting another
+        self.ensure_built()
+
+        # The lookups are read under the lock, since the library watcher's worker adds and removes music files
+        resolved = []
+        with self.lock:
+            for entry in entries:
+                if path.normpath(entry) in self.present or path.exists(entry):
+                    resolved.append(entry)
+                else:
+                    resolved.append(self.find(entry) or entry)
+        return resolved
+
+    def find(self, entry):
+        """ Returns the music file a missing entry most likely refers to, or None, the lock is held. """
+        # A music file indexed before it went missing is looked for among the music files of the same size
+        stamp = self.missing.get(path.normpath(entry))
+        if stamp is not None:
+            mtime, size = stamp
+            content_hash = self.hashes.get(path.normpath(entry))
+            same_size = self.by_size.get(size, ())
+            if content_hash is not None:
+                for candidate in same_size:
+                    if self.content(candidate) == content_hash:
+                        return candidate
+            else:
+                # A moved or renamed music file keeps its mtime
+                moved = [candidate for candidate in same_size if self.present[candidate][0] == mtime]
+                if len(moved) == 1:
+                    return moved[0]
+
+        # Otherwise look for music files with the same file name
+        folder, name = split_music_path(entry)
+        candidates = self.by_name.get(name)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            return candidates[0][1]
+
+        # Prefer the one in a folder with the same name
+        same_folder = [candidate for candidate in candidates if candidate[0] == folder]
+        if len(same_folder) == 1:
+            return same_folder[0][1]
+
+        # If the candidates are all the same music file, any of them will do
+        if len({self.present[file_path][1] for _, file_path in candidates}) == 1 and \
+                len({self.content(file_path) for _, file_path in candidates}) == 1:
+            return candidates[0][1]
+        return None
+
+    def content(self, file_path):
+        """ Returns the fingerprint of a music file that is present, taking and storing it the first time, or None, the lock is held. """
+        content_hash = self.hashes.get(file_path)
+        if content_hash is None:
+            mtime, size = self.present[file_path]
+            try:
+                content_hash = fingerprint(file_path, size)
+            except OSError:
+                return None
+            # The fingerprint is only stored if the music file did not change in the meantime
+            with self.connection:
+                self.connection.execute("UPDATE fingerprints SET hash = ? WHERE path = ? AND mtime = ? AND size = ?",
+                                        (content_hash, file_path, mtime, size))
+            self.hashes[file_path] = content_hash
+        return content_hash
+
+def file_row(file_path, mtime, size):
+    """ Returns the path, lowercase file name, lowercase folder name, mtime and size of a music file. """
+    folder_path, file_name = path.split(file_path)
+    return file_path, file_name.lower(), path.basename(folder_path).lower(), mtime, size
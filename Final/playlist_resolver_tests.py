@@ -0,0 +1,117 @@
+from os import path, makedirs, rename
+from shutil import copyfile
+from threading import Thread
+from time import perf_counter, sleep
+import pytest
+import playlist_resolver
+from playlist_resolver import PlaylistResolver
+
+SAMPLE_MUSIC = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+OTHER_MUSIC = path.join(path.dirname(__file__), "Music", "filk_minus_ten_and_counting", "10 Apollo Lost.mp3")
+
+def make_library(music_dir):
+    """ Creates two albums, each holding a music file called 01 Song.mp3. """
+    for album, sample in (("first_album", SAMPLE_MUSIC), ("second_album", OTHER_MUSIC)):
+        makedirs(path.join(music_dir, album))
+        copyfile(sample, path.join(music_dir, album, "01 Song.mp3"))
+    copyfile(SAMPLE_MUSIC, path.join(music_dir, "first_album", "02 Only.mp3"))
+
+def make_resolver(tmp_path):
+    """ Creates a resolver over a new library. """
+    music_dir = str(tmp_path / "music")
+    make_library(music_dir)
+    return music_dir, PlaylistResolver(music_dir, str(tmp_path / "index.db"))
+
+def test_windows_paths_are_remapped(tmp_path):
+    """ Test that Windows paths from another machine resolve by file and folder name. """
+    music_dir, resolver = make_resolver(tmp_path)
+    resolved = resolver.resolve([
+        "d:\\Homework\\music/first_album\\02 Only.mp3",
+        "d:\\Homework\\music/second_album\\01 Song.mp3",
+        "d:\\Homework\\music/other_album\\99 Missing.mp3",
+    ])
+
+    assert resolved == [
+        path.join(music_dir, "first_album", "02 Only.mp3"),
+        path.join(music_dir, "second_album", "01 Song.mp3"),
+        "d:\\Homework\\music/other_album\\99 Missing.mp3",
+    ]
+
+def test_existing_paths_are_kept(tmp_path):
+    """ Test that entries which exist are not remapped. """
+    music_dir, resolver = make_resolver(tmp_path)
+    entry = path.join(music_dir, "first_album", "01 Song.mp3")
+
+    assert resolver.resolve([entry]) == [entry]
+
+def test_renamed_file_is_found_by_fingerprint(tmp_path):
+    """ Test that a music file renamed after it was indexed is found again. """
+    music_dir, resolver = make_resolver(tmp_path)
+    resolver.build()
+    old_path = path.join(music_dir, "second_album", "01 Song.mp3")
+    new_path = path.join(music_dir, "second_album", "Apollo Lost.mp3")
+    rename(old_path, new_path)
+    resolver.build()
+
+    assert resolver.resolve([old_path]) == [new_path]
+
+def test_only_candidates_of_a_missing_entry_are_fingerprinted(tmp_path, monkeypatch):
+    """ Test that building the index fingerprints nothing, and a missing entry only fingerprints the files it could be. """
+    music_dir, resolver = make_resolver(tmp_path)
+    makedirs(path.join(music_dir, "third_album"))
+    copyfile(SAMPLE_MUSIC, path.join(music_dir, "third_album", "02 Only.mp3"))
+    fingerprinted = []
+    fingerprint = playlist_resolver.fingerprint
+    monkeypatch.setattr(playlist_resolver, "fingerprint",
+                        lambda file_path, size: fingerprinted.append(file_path) or fingerprint(file_path, size))
+    resolver.build()
+    assert resolver.resolve([path.join(music_dir, "first_album", "02 Only.mp3")])
+    assert fingerprinted == []
+
+    # Two music files of a different size are told apart without being fingerprinted
+    assert resolver.resolve(["d:\\music\\other_album\\01 Song.mp3"]) == ["d:\\music\\other_album\\01 Song.mp3"]
+    assert fingerprinted == []
+
+    # Two copies of the same music file are fingerprinted once to tell they are the same
+    copies = [path.join(music_dir, album, "02 Only.mp3") for album in ("first_album", "third_album")]
+    assert resolver.resolve(["d:\\music\\other_album\\02 Only.mp3"])[0] in copies
+    assert resolver.resolve(["d:\\music\\other_album\\02 Only.mp3"])[0] in copies
+    assert sorted(fingerprinted) == copies
+
+def test_index_is_built_once_while_playlists_resolve(tmp_path, monkeypatch):
+    """ Test that playlists resolved while the index is being built wait for that build, and edits to the index can run alongside. """
+    music_dir, resolver = make_resolver(tmp_path)
+    builds = []
+    files = resolver.library.files
+
+    def slow_files():
+        builds.append(1)
+        sleep(0.1)
+        return files()
+    monkeypatch.setattr(resolver.library, "files", slow_files)
+
+    entry = "d:\\music\\first_album\\02 Only.mp3"
+    threads = [Thread(target=resolver.ensure_built)] + [Thread(target=resolver.resolve, args=([entry],)) for _ in range(4)]
+    threads.append(Thread(target=lambda: [resolver.remove(path.join(music_dir, "second_album", "01 Song.mp3"))
+                                          for _ in range(100)]))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert resolver.resolve([entry]) == [path.join(music_dir, "first_album", "02 Only.mp3")]
+
+def test_large_playlist_resolves_quickly(tmp_path):
+    """ Test that resolving a 10k entry playlist takes well under a second once the index is built. """
+    music_dir, resolver = make_resolver(tmp_path)
+    resolver.build()
+    entries = [f"d:\\music\\first_album\\02 Only.mp3" for _ in range(10_000)]
+
+    started = perf_counter()
+    resolved = resolver.resolve(entries)
+    assert perf_counter() - started < 0.5
+    assert set(resolved) == {path.join(music_dir, "first_album", "02 Only.mp3")}
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,276 @@
+""" playlist_store.py
+
+Design:
+class PlaylistStore:
+    def __init__
+        remember playlist and journal paths
+
+    def load
+        start reading playlist file, read its first page or all of it
+        cut a torn last line off the journal
+        if journal belongs to this playlist file, read the rest and replay its edits
+
+    def read_page
+        read the next entries of the playlist file, remapping missing music files
+        keep them for the playlist to take on the event loop
+
+    def merge_pages
+        add the entries read to the end of the playlist
+        keep their #EXTINF duration and title
+
+    def complete
+        read and add the rest of the playlist file
+
+    def append / remove / remove_entry / move
+        add a music file path, remove an entry by index or ID, or move one, as an edit
+
+    def edit
+        read the rest of the playlist file
+        write edit to journal
+        apply it to the entries
+        compact when the journal has grown large
+
+    def write_edit
+        start journal with the playlist file it belongs to
+        append edit and flush it to disk
+
+    def apply_edit
+        add, remove or move an entry as an edit says
+
+    def needs_compaction
+        return whether the journal has grown large compared to the playlist
+
+    def compact
+        read the rest of the playlist file
+        write music file paths to a temporary file, with #EXTINF lines for M3U
+        atomically replace playlist file
+        delete journal
+
+    def delete
+        delete playlist file and journal
+
+A playlist is stored as the plain text file the music player has always used,
+one music file path per line, plus an append-only journal of the edits made
+since the file was last written. Adding or removing a music file appends one
+line to the journal instead of rewriting the whole playlist. When the journal
+grows to half the size of the playlist it is compacted: the playlist is written
+to a temporary file that atomically replaces the old one, and the journal is
+deleted. The journal starts with the size and mtime of the playlist file it
+applies to, so a journal left behind by a crash during compaction is ignored
+rather than replayed twice. A torn last line from a crash mid-write is ignored.
+The music file paths are held in a PlaylistModel, so every edit is O(log n)
+in memory as well as one line on disk, and each entry keeps its ID while the
+playlist is open.
+
+The playlist file, plain text or M3U, is read as a stream. load can read only
+a first page, so a long playlist is playable at once, and read_page reads the
+next pages in the background as the user scrolls or playback gets near the end
+of what is loaded. Pages are read under a lock and kept until merge_pages adds
+them on the event loop, so entries always arrive in order. The journal indexes
+into the whole playlist, so an edit, or a journal to replay, reads the rest of
+the file first. Each edit is two halves, write_edit puts it on disk and
+apply_edit changes the entries, so the player can write an edit in the
+background and change the entries it shows once the edit is saved.
+"""
+
+from itertools import islice
+from os import fsync, path, remove, replace, stat
+from threading import Lock
+
+from playlist_formats import M3U_HEADER, is_m3u, playlist_encoding, read_playlist, write_entry
+from playlist_model import PlaylistModel
+
+JOURNAL_SUFFIX = ".journal"
+APPEND = "A"
+REMOVE = "D"
+MOVE = "M"
+COMPACT_MIN_EDITS = 256
+
+class PlaylistStore:
+    """ A playlist file with an append-only journal of edits, read a page at a time. """
+    def __init__(self, playlist_path, resolve=None):
+        self.playlist_path = playlist_path
+        self.journal_path = playlist_path + JOURNAL_SUFFIX
+        self.resolve = resolve
+        self.entries = PlaylistModel()
+        self.info = {}
+        self.pending = None
+        self.unmerged = []
+        self.lock = Lock()
+        self.journal_file = None
+        self.journal_edits = 0
+
+    @property
+    def loading(self):
+        """ Returns whether some of the playlist file has not been added to the entries yet. """
+        return self.pending is not None or bool(self.unmerged)
+
+    def load(self, page_size=None):
+        """ Reads the playlist, or only its first page_size entries, and replays the edits in its journal. """
+        self.pending = read_playlist(self.playlist_path)
+        self.read_page(page_size)
+        self.merge_pages()
+
+        # Replay the journal if it belongs to this playlist file, its edits index into the whole playlist
+        if path.exists(self.journal_path):
+            with open(self.journal_path, "r") as journal_file:
+                lines = journal_file.read().split("\n")
+            # The last line is empty if the journal ends cleanly, or torn if a write was interrupted
+            if lines.pop():
+                self.truncate_journal()
+            if lines and lines[0] == self.base_marker():
+                self.complete()
+                for line in lines[1:]:
+                    self.apply(line)
+                self.journal_edits = len(lines) - 1
+            else:
+                remove(self.journal_path)
+        return self
+
+    def read_page(self, count=None):
+        """ Reads up to count more entries of the playlist file, or the rest of it, and returns whether there is more to read. """
+        with self.lock:
+            if self.pending is None:
+                return False
+            items = list(islice(self.pending, count))
+            if count is None or len(items) < count:
+                self.pending.close()
+                self.pending = None
+
+            # Missing music files are remapped a page at a time
+            if self.resolve is not None and items:
+                items = [item._replace(path=music_path)
+                         for item, music_path in zip(items, self.resolve([item.path for item in items]))]
+            self.unmerged += items
+            return self.pending is not None
+
+    def merge_pages(self):
+        """ Adds the entries read since the last call to the end of the playlist, returns the index they start at and their entry IDs. """
+        with self.lock:
+            items, self.unmerged = self.unmerged, []
+        for item in items:
+            if item.duration is not None or item.title is not None:
+                self.info[item.path] = item
+        return len(self.entries), self.entries.extend([item.path for item in items])
+
+    def complete(self):
+        """ Reads and adds the rest of the playlist file, returns the index the entries added start at and their entry IDs. """
+        self.read_page()
+        return self.merge_pages()
+
+    def apply(self, line):
+        """ Applies one journal line to the music file paths. """
+        edit, value = line.split("\t", 1)
+        if edit == APPEND:
+            self.apply_edit(APPEND, self.resolve([value])[0] if self.resolve is not None else value)
+        elif edit in (REMOVE, MOVE):
+            self.apply_edit(edit, *map(int, value.split("\t")))
+
+    def append(self, music_path):
+        """ Adds a music file path to the end of the playlist and returns its entry ID. """
+        return self.edit(APPEND, music_path)
+
+    def remove(self, index):
+        """ Removes the music file path at an index. """
+        self.edit(REMOVE, index)
+
+    def remove_entry(self, entry_id):
+        """ Removes an entry by its ID and returns the index it was at. """
+        self.complete()
+        index = self.entries.index_of(entry_id)
+        self.edit(REMOVE, index)
+        return index
+
+    def move(self, entry_id, index):
+        """ Moves an entry to an index and returns the index it was at. """
+        self.complete()
+        old_index = self.entries.index_of(entry_id)
+        self.edit(MOVE, old_index, max(0, min(index, len(self.entries) - 1)))
+        return old_index
+
+    def edit(self, edit, *values):
+        """ Writes an edit to the journal and applies it to the entries, returns what apply_edit returns. """
+        self.complete()
+        self.write_edit(edit, *values)
+        result = self.apply_edit(edit, *values)
+        # Compact once the journal has grown large compared to the playlist, so edits stay O(1) on average
+        if self.needs_compaction():
+            self.compact()
+        return result
+
+    def apply_edit(self, edit, *values):
+        """ Applies an edit to the entries, returns the entry ID added, removed or moved. """
+        if edit == APPEND:
+            return self.entries.append(values[0])
+        entry_id = self.entries.id_at(values[0])
+        if edit == REMOVE:
+            self.entries.remove(entry_id)
+        else:
+            self.entries.move(entry_id, values[1])
+        return entry_id
+
+    def base_marker(self):
+        """ Returns the line identifying the playlist file a journal applies to. """
+        playlist_stat = stat(self.playlist_path)
+        return f"B\t{playlist_stat.st_size}\t{playlist_stat.st_mtime_ns}"
+
+    def truncate_journal(self):
+        """ Cuts a torn last line off the journal, so the next edit starts on a line of its own. """
+        with open(self.journal_path, "r+b") as journal_file:
+            journal = journal_file.read()
+            journal_file.truncate(journal.rfind(b"\n") + 1)
+
+    def write_edit(self, edit, *values):
+        """ Appends an edit to the journal and flushes it to disk, the entries are left as they are. """
+        if self.journal_file is None:
+            is_new = not path.exists(self.journal_path)
+            self.journal_file = open(self.journal_path, "a")
+            if is_new:
+                self.journal_file.write(self.base_marker() + "\n")
+
+        self.journal_file.write("\t".join(map(str, (edit,) + values)) + "\n")
+        self.journal_file.flush()
+        fsync(self.journal_file.fileno())
+        self.journal_edits += 1
+
+    def needs_compaction(self):
+        """ Returns whether the journal has grown large compared to the playlist. """
+        return self.journal_edits >= max(COMPACT_MIN_EDITS, len(self.entries) // 2)
+
+    def compact(self):
+        """ Rewrites the playlist file with the journal applied and deletes the journal. """
+        self.complete()
+        temporary_path = self.playlist_path + ".tmp"
+        encoding, errors = playlist_encoding(self.playlist_path)
+        m3u = is_m3u(self.playlist_path)
+        with open(temporary_path, "w", encoding=encoding, errors=errors) as playlist_file:
+            # An M3U playlist keeps the #EXTINF duration and title of its entries
+            if m3u:
+                playlist_file.write(M3U_HEADER + "\n")
+            for music in self.entries:
+                write_entry(playlist_file, music, self.info.get(music), m3u)
+            playlist_file.flush()
+            fsync(playlist_file.fileno())
+        replace(temporary_path, self.playlist_path)
+
+        self.close()
+        if path.exists(self.journal_path):
+            remove(self.journal_path)
+        self.journal_edits = 0
+
+    def close(self):
+        """ Closes the journal, and the playlist file if it was not read to the end. """
+        with self.lock:
+            if self.pending is not None:
+                self.pending.close()
+                self.pending = None
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
+
+    def delete(self):
+        """ Deletes the playlist file and its journal. """
+        self.close()
+        remove(self.playlist_path)
+        if path.exists(self.journal_path):
+            remove(self.journal_path)
@@ -0,0 +1,130 @@
+from os import path, stat
+import pytest
+import playlist_store
+from playlist_store import PlaylistStore
+
+def make_playlist(tmp_path, count):
+    """ Creates a plain text playlist of count music file paths. """
+    playlist_path = str(tmp_path / "Playlist 1.txt")
+    with open(playlist_path, "w") as playlist_file:
+        for i in range(count):
+            playlist_file.write(f"/music/album/{i:03d}.mp3\n")
+    return playlist_path
+
+def test_plain_text_playlist_is_imported(tmp_path):
+    """ Test that an existing playlist without a journal loads as before. """
+    store = PlaylistStore(make_playlist(tmp_path, 3)).load()
+
+    assert store.entries == ["/music/album/000.mp3", "/music/album/001.mp3", "/music/album/002.mp3"]
+
+def test_edits_are_journaled_not_rewritten(tmp_path):
+    """ Test that single edits append to the journal and survive a reload. """
+    playlist_path = make_playlist(tmp_path, 3)
+    before = stat(playlist_path)
+    store = PlaylistStore(playlist_path).load()
+    store.remove(1)
+    store.append("/music/album/new.mp3")
+
+    assert stat(playlist_path).st_mtime_ns == before.st_mtime_ns
+    assert PlaylistStore(playlist_path).load().entries == [
+        "/music/album/000.mp3", "/music/album/002.mp3", "/music/album/new.mp3"]
+
+def test_moves_and_removes_by_entry_are_replayed(tmp_path):
+    """ Test that moving and removing entries by ID survive a reload, with duplicates telling their entries apart. """
+    playlist_path = make_playlist(tmp_path, 3)
+    store = PlaylistStore(playlist_path).load()
+    duplicate = store.append("/music/album/000.mp3")
+    store.move(duplicate, 1)
+    assert store.remove_entry(store.entries.id_at(0)) == 0
+
+    assert PlaylistStore(playlist_path).load().entries == [
+        "/music/album/000.mp3", "/music/album/001.mp3", "/music/album/002.mp3"]
+    assert store.entries.index_of(duplicate) == 0
+
+def test_compaction_replaces_playlist_and_deletes_journal(tmp_path, monkeypatch):
+    """ Test that a long journal is compacted into the playlist file. """
+    monkeypatch.setattr(playlist_store, "COMPACT_MIN_EDITS", 4)
+    playlist_path = make_playlist(tmp_path, 3)
+    store = PlaylistStore(playlist_path).load()
+    for i in range(4):
+        store.append(f"/music/album/new{i}.mp3")
+
+    assert not path.exists(store.journal_path)
+    with open(playlist_path) as playlist_file:
+        assert playlist_file.read().splitlines() == store.entries
+
+def test_stale_journal_is_not_replayed(tmp_path):
+    """ Test that a journal left behind by a crash after compaction is ignored. """
+    playlist_path = make_playlist(tmp_path, 3)
+    store = PlaylistStore(playlist_path).load()
+    store.append("/music/album/new.mp3")
+    with open(store.journal_path) as journal_file:
+        journal = journal_file.read()
+    store.compact()
+
+    # Put the journal back as if the crash happened before it was deleted
+    with open(store.journal_path, "w") as journal_file:
+        journal_file.write(journal)
+
+    assert PlaylistStore(playlist_path).load().entries.count("/music/album/new.mp3") == 1
+
+def test_torn_journal_line_is_ignored(tmp_path):
+    """ Test that a partly written last journal line is dropped. """
+    playlist_path = make_playlist(tmp_path, 3)
+    store = PlaylistStore(playlist_path).load()
+    store.append("/music/album/new.mp3")
+    store.close()
+    with open(store.journal_path, "a") as journal_file:
+        journal_file.write("A\t/music/al")
+
+    assert PlaylistStore(playlist_path).load().entries[-1] == "/music/album/new.mp3"
+
+def test_edit_after_torn_journal_line_is_kept(tmp_path):
+    """ Test that an edit made after a torn journal line is read back, not glued onto the torn line. """
+    playlist_path = make_playlist(tmp_path, 3)
+    store = PlaylistStore(playlist_path).load()
+    store.append("/music/album/new.mp3")
+    store.close()
+    with open(store.journal_path, "a") as journal_file:
+        journal_file.write("A\t/music/al")
+
+    store = PlaylistStore(playlist_path).load()
+    store.remove(0)
+    store.close()
+
+    assert PlaylistStore(playlist_path).load().entries == [
+        "/music/album/001.mp3", "/music/album/002.mp3", "/music/album/new.mp3"]
+
+def test_long_playlist_is_read_a_page_at_a_time(tmp_path):
+    """ Test that only the first page is read on load, later pages are added on demand, and an edit reads the rest first. """
+    playlist_path = make_playlist(tmp_path, 250)
+    store = PlaylistStore(playlist_path).load(page_size=100)
+    assert len(store.entries) == 100 and store.loading
+
+    assert store.read_page(100)
+    start, entry_ids = store.merge_pages()
+    assert (start, len(entry_ids), len(store.entries)) == (100, 100, 200)
+
+    # Appending indexes into the whole playlist, so the last page is read before it
+    store.append("/music/album/new.mp3")
+    assert not store.loading
+    assert store.entries[249] == "/music/album/249.mp3" and store.entries[250] == "/music/album/new.mp3"
+    assert PlaylistStore(playlist_path).load(page_size=10).entries[-1] == "/music/album/new.mp3"
+
+def test_m3u_compaction_keeps_extinf(tmp_path):
+    """ Test that an M3U playlist is rewritten as M3U, keeping the duration and title of its entries. """
+    playlist_path = str(tmp_path / "Mix.m3u8")
+    with open(playlist_path, "w", encoding="utf-8") as playlist_file:
+        playlist_file.write("#EXTM3U\n#EXTINF:215,Künstler - Nacht\nalbum/01.mp3\nalbum/02.mp3\n")
+    store = PlaylistStore(playlist_path).load()
+    store.append("/music/album/new.mp3")
+    store.compact()
+
+    with open(playlist_path, encoding="utf-8") as playlist_file:
+        assert playlist_file.read().splitlines() == [
+            "#EXTM3U", "#EXTINF:215,Künstler - Nacht", str(tmp_path / "album" / "01.mp3"),
+            str(tmp_path / "album" / "02.mp3"), "/music/album/new.mp3"]
+    assert PlaylistStore(playlist_path).load().info[str(tmp_path / "album" / "01.mp3")].title == "Künstler - Nacht"
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,616 @@
+""" remote_control.py
+
+Design:
+def websocket_accept
+    return the accept key of a WebSocket handshake
+
+def encode_frame
+    return a WebSocket frame, masked if it is sent by a client
+
+def read_frame
+    read a WebSocket frame, raise FrameTooLarge if it is larger than allowed
+    unmask it if it is masked
+    return opcode and payload
+
+class Subscriber:
+    def __init__
+        initialize pending events and wake up flag
+
+    def offer
+        keep only the newest event of each kind
+        wake up the sender
+
+    def take
+        wait until there are events, return and forget them
+
+class RemoteControl:
+    def __init__
+        remember engine, host, port and token
+        initialize command queue and subscribers
+        follow the engine's events
+
+    def start
+        run the server on an asyncio loop in a thread, wait until it listens
+        poll commands on the engine's event loop
+
+    def close
+        stop polling, stop the server and its thread
+
+    def serve
+        listen for clients until stopped
+
+    def handle_client
+        read HTTP request
+        refuse it if it comes from a web page or lacks the token
+        if it asks for a WebSocket, accept it, send events and read commands until it closes
+        otherwise run the command and reply with JSON
+
+    def check_access
+        refuse requests with the Origin of a web page, since a page can send them without a preflight
+        refuse POST bodies that are not JSON
+        if a token is required, refuse requests without it
+
+    def run_command
+        queue the command for the engine's event loop
+        wait for its result
+
+    def dispatch_commands
+        poll again
+        run queued commands on the engine and hand results back to the asyncio loop
+        answer a command that fails unexpectedly with an error
+        publish the position while music plays
+
+    def answer
+        hand a command's status and result back to the asyncio loop
+
+    def execute
+        run a command on the engine, raise CommandError if it is not valid
+
+    def edit_playlist
+        start a playlist edit on the engine
+        answer the client once the edit is written
+
+    def status
+        return the playing music, position, duration and volume
+
+    def playlist
+        return a page of the open playlist's entries
+        if the page reaches the entries not read yet, have the engine read the next page
+
+    def publish
+        hand an engine event to the asyncio loop
+
+    def broadcast
+        offer an event to every subscriber
+
+    def send_events
+        send the pending events of a subscriber
+        disconnect it if it does not read them in time
+
+    def read_commands
+        run commands sent over a WebSocket and reply to them
+        close the WebSocket if a message is too large
+
+Lets other programs control the player over HTTP and follow it over
+WebSockets, with only the standard library. The server runs on an asyncio loop
+in its own thread, so hundreds of idle connections cost no threads and the Tk
+event loop never waits on a client. The engine is only used from its own event
+loop: commands are put on a queue that the engine's event loop drains every
+20 ms, like the results of the background tasks, and the results are handed
+back to the waiting client with call_soon_threadsafe. A playlist edit is
+written in the background, so its client is answered once it is written.
+
+Events are broadcast to every subscribed WebSocket. A client that reads slower
+than events arrive does not slow the others or grow without bound: each
+subscriber keeps only the newest event of each kind, so a burst of position
+updates is coalesced into the latest one, and its sender waits for the socket
+to drain before taking more. A client whose socket does not drain within a few
+seconds is disconnected. A client that sees "playlist_changed" fetches the
+playlist again rather than replaying each edit, since edits can be coalesced.
+A long playlist is read a page at a time, "loading" tells whether more is to
+come and "playlist_page" is sent as pages are added.
+
+    POST /play {"index": 3}, /pause, /unpause, /toggle, /next, /previous, /stop
+    POST /seek {"position": 30}, /volume {"volume": 0.5}
+    POST /playlist_add {"path": ...}, /playlist_remove {"index": 2}, /playlist_move {"entry_id": 7, "index": 0}
+    GET /status, /playlist?start=0&count=100
+    GET /events upgrades to a WebSocket that receives events and accepts {"command": ..., ...} messages
+
+By default the server only listens on this machine. A web page open in a
+browser could still reach it, so requests carrying the Origin of a page are
+refused and POST bodies must be sent as application/json, which a page cannot
+do without the browser asking first. Listening on another host requires a
+token, given as "Authorization: Bearer <token>" or "?token=<token>", and one
+is made up if none is given. Music files added to a playlist must be in the
+music folder.
+"""
+
+import asyncio
+import json
+from base64 import b64encode
+from functools import partial
+from hashlib import sha1
+from hmac import compare_digest
+from os import path, urandom
+from secrets import token_urlsafe
+from queue import Queue, Empty
+from threading import Event, Thread
+from time import perf_counter
+from urllib.parse import parse_qsl, urlsplit
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+COMMAND_INTERVAL = 20
+POSITION_INTERVAL = 1
+COMMAND_TIMEOUT = 5
+REQUEST_TIMEOUT = 10
+SEND_TIMEOUT = 5
+MAX_BODY = 64 * 1024
+MAX_SUBSCRIBERS = 1000
+PLAYLIST_PAGE = 100
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+TEXT, CLOSE, PING, PONG = 0x1, 0x8, 0x9, 0xA
+MESSAGE_TOO_BIG = 1009
+
+# The engine events clients are told about, with the names of their arguments
+ENGINE_EVENTS = {
+    "track": ("index", "path"),
+    "metadata": ("metadata",),
+    "paused": (),
+    "unpaused": (),
+    "seeked": ("position",),
+    "stopped": (),
+    "finished": (),
+    "volume": ("volume",),
+    "playlist_changed": ("old_index", "new_index", "entry_id"),
+    "playlist_page": ("index", "entry_ids"),
+}
+
+# Returned by a command that answers its client later
+PENDING = object()
+
+class CommandError(ValueError):
+    """ A command that does not exist or has invalid arguments. """
+
+class FrameTooLarge(ValueError):
+    """ A WebSocket frame larger than the server accepts. """
+
+def websocket_accept(key):
+    """ Returns the Sec-WebSocket-Accept value for a Sec-WebSocket-Key. """
+    return b64encode(sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+def encode_frame(payload, opcode=TEXT, mask=False):
+    """ Returns a WebSocket frame, clients mask their frames and servers do not. """
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, (0x80 if mask else 0) | length))
+    elif length < 1 << 16:
+        header = bytes((0x80 | opcode, (0x80 if mask else 0) | 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, (0x80 if mask else 0) | 127)) + length.to_bytes(8, "big")
+    if not mask:
+        return header + payload
+    key = urandom(4)
+    return header + key + apply_mask(payload, key)
+
+def apply_mask(payload, key):
+    """ Masks or unmasks a payload, XOR with the repeated key as one big integer instead of byte by byte. """
+    length = len(payload)
+    repeated = (key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(length, "big")
+
+async def read_frame(reader, max_length=MAX_BODY):
+    """ Reads a WebSocket frame and returns its opcode and payload. """
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+    if length > max_length:
+        raise FrameTooLarge("WebSocket frame too large")
+    key = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    return first & 0x0F, apply_mask(payload, key) if key else payload
+
+class Subscriber:
+    """ A WebSocket client's pending events, only the newest event of each kind is kept. """
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, event, message):
+        """ Queues an event, replacing an unsent event of the same kind. """
+        self.pending.pop(event, None)
+        self.pending[event] = message
+        self.ready.set()
+
+    async def take(self):
+        """ Waits for events and returns them in the order they were last offered. """
+        await self.ready.wait()
+        self.ready.clear()
+        messages = list(self.pending.values())
+        self.pending.clear()
+        return messages
+
+class RemoteControl:
+    """ An HTTP and WebSocket server that controls a PlayerEngine and broadcasts its events. """
+    def __init__(self, engine, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None):
+        self.engine = engine
+        self.master = engine.master
+        self.host = host
+        self.port = port
+        # Other machines need the token, it is made up if the server listens beyond this one without one
+        self.token = token if token is not None or host in LOOPBACK_HOSTS else token_urlsafe(16)
+        self.commands = Queue()
+        self.subscribers = set()
+        self.loop = None
+        self.thread = None
+        self.stopped = None
+        self.listening = Event()
+        self.startup_error = None
+        self.poll_job = None
+        self.last_position = 0
+
+        # Follow the engine's events, they are raised on its event loop
+        for event, names in ENGINE_EVENTS.items():
+            engine.subscribe(event, lambda *args, event=event, names=names: self.publish(event, dict(zip(names, args))))
+
+    def start(self):
+        """ Starts the server in a thread and returns once it is listening. """
+        self.thread = Thread(target=asyncio.run, args=(self.serve(),), name="remote-control", daemon=True)
+        self.thread.start()
+        self.listening.wait()
+        if self.startup_error is not None:
+            raise self.startup_error
+        self.poll_job = self.master.after(COMMAND_INTERVAL, self.dispatch_commands)
+        return self
+
+    def close(self):
+        """ Stops the server and its thread. """
+        if self.poll_job is not None:
+            self.master.after_cancel(self.poll_job)
+            self.poll_job = None
+        if self.loop is not None and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join()
+
+    async def serve(self):
+        """ Listens for clients until the server is closed. """
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        try:
+            server = await asyncio.start_server(self.handle_client, self.host, self.port, backlog=1024)
+        except OSError as error:
+            self.startup_error = error
+            self.listening.set()
+            return
+
+        # Port 0 picks a free port, the one picked is kept
+        self.port = server.sockets[0].getsockname()[1]
+        self.listening.set()
+        async with server:
+            await self.stopped.wait()
+            for subscriber in list(self.subscribers):
+                subscriber.writer.close()
+
+    async def handle_client(self, reader, writer):
+        """ Answers one HTTP request, or streams events over a WebSocket. """
+        try:
+            method, target, headers, body = await asyncio.wait_for(self.read_request(reader), REQUEST_TIMEOUT)
+            url = urlsplit(target)
+            query = dict(parse_qsl(url.query))
+            refusal = self.check_access(method, headers, query.pop("token", None))
+            if refusal is not None:
+                await self.reply(writer, *refusal)
+                return
+            if url.path == "/events" and headers.get("upgrade", "").lower() == "websocket":
+                await self.stream_events(reader, writer, headers)
+                return
+
+            # Every other request runs one command, named by its path
+            name = url.path.strip("/")
+            if method == "GET" and name in ("status", "playlist"):
+                arguments = query
+            elif method == "POST":
+                arguments = json.loads(body) if body.strip() else {}
+                if not isinstance(arguments, dict):
+                    raise CommandError("The body must be a JSON object")
+            else:
+                await self.reply(writer, 405, {"error": f"{method} {url.path} is not supported"})
+                return
+            await self.reply(writer, *await self.run_command(name, arguments))
+        except (CommandError, json.JSONDecodeError, UnicodeDecodeError) as error:
+            await self.reply(writer, 400, {"error": str(error)})
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def check_access(self, method, headers, query_token):
+        """ Returns the HTTP status and error refusing a request, or None if it may run. """
+        # A web page's request carries its Origin, only pages served by this server itself would be allowed
+        origin = headers.get("origin")
+        if origin is not None and origin not in {f"http://{host}:{self.port}" for host in (self.host, *LOOPBACK_HOSTS[:2], "[::1]")}:
+            return 403, {"error": "Requests from web pages are not accepted"}
+
+        # A page can POST text/plain without a preflight, but not application/json
+        if method == "POST" and headers.get("content-type", "").split(";")[0].strip().lower() != "application/json":
+            return 415, {"error": "The body must be sent as application/json"}
+
+        if self.token is not None:
+            scheme, _, token = headers.get("authorization", "").partition(" ")
+            given = token if scheme.lower() == "bearer" else query_token
+            if not given or not compare_digest(given.encode(), self.token.encode()):
+                return 401, {"error": "A valid token is required"}
+        return None
+
+    async def read_request(self, reader):
+        """ Reads the request line, headers and body of an HTTP request. """
+        request_line = (await reader.readline()).decode("latin-1")
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise CommandError("Malformed request line") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise CommandError("Request body too large")
+        body = (await reader.readexactly(length)).decode()
+        return method, target, headers, body
+
+    async def reply(self, writer, status, result):
+        """ Sends a JSON response and waits until it is written. """
+        reasons = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+                   405: "Method Not Allowed", 415: "Unsupported Media Type", 500: "Internal Server Error",
+                   503: "Service Unavailable"}
+        body = json.dumps(result).encode()
+        writer.write(f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def run_command(self, name, arguments):
+        """ Runs a command on the engine's event loop and returns the HTTP status and result. """
+        future = self.loop.create_future()
+        self.commands.put((name, arguments, future))
+        try:
+            return await asyncio.wait_for(future, COMMAND_TIMEOUT)
+        except asyncio.TimeoutError:
+            return 503, {"error": "The player did not answer in time"}
+
+    def dispatch_commands(self):
+        """ Runs the queued commands on the engine's event loop, then publishes the position while music plays. """
+        # Poll again first, so a command that fails unexpectedly does not stop the polling
+        self.poll_job = self.master.after(COMMAND_INTERVAL, self.dispatch_commands)
+        try:
+            while True:
+                name, arguments, future = self.commands.get_nowait()
+                reply = partial(self.answer, future)
+                try:
+                    result = self.execute(name, arguments, reply)
+                except KeyError:
+                    reply(404, {"error": f"Unknown command {name}"})
+                except (CommandError, ValueError, TypeError, IndexError) as error:
+                    reply(400, {"error": str(error)})
+                except self.engine.backend.errors as error:
+                    reply(400, {"error": f"Unable to play music: {error}"})
+                except Exception as error:
+                    # The client is answered right away rather than waiting for its timeout
+                    reply(500, {"error": f"The command failed: {error}"})
+                else:
+                    # A playlist edit answers once it is written
+                    if result is not PENDING:
+                        reply(200, result)
+        except Empty:
+            pass
+
+        # The position moves on its own, so it is published once a second rather than as an event
+        now = perf_counter()
+        if self.engine.current_music is not None and not self.engine.paused and now - self.last_position >= POSITION_INTERVAL:
+            self.last_position = now
+            self.publish("position", {"position": self.engine.position(), "duration": self.engine.current_duration})
+
+    def answer(self, future, status, result):
+        """ Hands a command's HTTP status and result back to the asyncio loop. """
+        self.loop.call_soon_threadsafe(finish, future, (status, result))
+
+    def execute(self, name, arguments, reply):
+        """ Runs a command on the engine and returns its result, or PENDING if reply is called with it later. """
+        engine = self.engine
+        commands = {
+            "status": self.status,
+            "play": lambda: self.play(arguments.get("index")),
+            "pause": engine.pause,
+            "unpause": engine.unpause,
+            "toggle": lambda: engine.unpause() if engine.paused else engine.pause(),
+            "next": engine.next_music,
+            "previous": engine.previous_music,
+            "stop": engine.stop_music,
+            "seek": lambda: engine.seek(float(arguments["position"])),
+            "volume": lambda: engine.set_volume(min(1.0, max(0.0, float(arguments["volume"])))),
+            "playlist": lambda: self.playlist(int(arguments.get("start", 0)), int(arguments.get("count", PLAYLIST_PAGE))),
+            "playlist_add": lambda: self.edit_playlist(reply, engine.add_to_playlist, self.playlist_path(arguments["path"]),
+                                                       result=lambda entry_id: {"entry_id": entry_id}),
+            "playlist_remove": lambda: self.edit_playlist(reply, engine.remove_from_playlist,
+                                                          self.playlist_index(arguments["index"])),
+            "playlist_move": lambda: self.edit_playlist(reply, engine.move_in_playlist,
+                                                        self.playlist_entry(arguments["entry_id"]), int(arguments["index"])),
+        }
+        command = commands[name]
+        try:
+            result = command()
+        except KeyError as error:
+            raise CommandError(f"Missing argument {error}") from None
+        return self.status() if result is None else result
+
+    def edit_playlist(self, reply, edit, *arguments, result=None):
+        """ Starts a playlist edit on the engine, the client is answered once it is written. """
+        def done(value):
+            reply(200, self.status() if result is None else result(value))
+
+        def failed(error):
+            if isinstance(error, LookupError):
+                reply(400, {"error": "The entry is no longer in the playlist"})
+            else:
+                reply(500, {"error": f"Unable to save the playlist: {error}"})
+        edit(*arguments, on_done=done, on_error=failed)
+        return PENDING
+
+    def status(self):
+        """ Returns the playing music, its position and duration, and the volume. """
+        engine = self.engine
+        return {
+            "path": engine.current_music,
+            # The playing music has no index once it was removed from the top of the queue
+            "index": engine.play_index if engine.current_music is not None and engine.play_index >= 0 else None,
+            "paused": engine.paused,
+            "position": engine.position() if engine.current_music is not None else 0,
+            "duration": engine.current_duration,
+            "volume": engine.volume,
+            "queue_length": len(engine.play_items),
+        }
+
+    def play(self, index):
+        """ Plays the music at an index of the queue, or resumes the paused music. """
+        engine = self.engine
+        if index is None:
+            if engine.paused:
+                engine.unpause()
+                return None
+            index = max(engine.play_index or 0, 0)
+        index = int(index)
+        if not 0 <= index < len(engine.play_items):
+            raise CommandError(f"No music at index {index} of the queue")
+        engine.play_music(index)
+        return None
+
+    def open_playlist(self):
+        """ Returns the entries of the open playlist, raises CommandError if no playlist is open. """
+        if self.engine.playlist_store is None:
+            raise CommandError("No playlist is open")
+        return self.engine.playlist_store.entries
+
+    def playlist_path(self, music_path):
+        """ Returns a music file path to add to the open playlist, it must be a file in the music folder. """
+        self.open_playlist()
+        if not isinstance(music_path, str) or not music_path:
+            raise CommandError("The path must be a music file path")
+
+        # Links are followed, so a path cannot leave the music folder through one
+        music_dir = path.realpath(self.engine.music_dir)
+        real_path = path.realpath(music_path)
+        if not real_path.startswith(music_dir + path.sep) or not path.isfile(real_path):
+            raise CommandError("The path must be a music file in the music folder")
+        return path.normpath(path.abspath(music_path))
+
+    def playlist_entry(self, entry_id):
+        """ Returns a valid entry ID of the open playlist. """
+        entry_id = int(entry_id)
+        if entry_id not in self.open_playlist().nodes:
+            raise CommandError(f"No entry {entry_id} in the playlist")
+        return entry_id
+
+    def playlist_index(self, index):
+        """ Returns a valid index of the open playlist. """
+        index = int(index)
+        if not 0 <= index < len(self.open_playlist()):
+            raise CommandError(f"No entry at index {index} of the playlist")
+        return index
+
+    def playlist(self, start, count):
+        """ Returns a page of the open playlist's entries with their IDs. """
+        entries = self.open_playlist()
+        start = max(0, start)
+        count = max(0, min(count, PLAYLIST_PAGE * 10))
+        page = [{"entry_id": node.entry_id, "path": node.path} for node, _ in zip(entries.walk(start), range(count))]
+
+        # A client paging through a playlist that is still loading reads the next page of the file
+        loading = self.engine.playlist_store.loading
+        if loading and start + count >= len(entries):
+            self.engine.load_playlist_page()
+        return {"start": start, "total": len(entries), "loading": loading, "entries": page}
+
+    def publish(self, event, data):
+        """ Hands an engine event to the asyncio loop, which broadcasts it. """
+        if self.loop is not None and not self.loop.is_closed():
+            message = json.dumps({"event": event, **data}).encode()
+            self.loop.call_soon_threadsafe(self.broadcast, event, message)
+
+    def broadcast(self, event, message):
+        """ Offers an event to every subscriber, each sends it when it is ready. """
+        for subscriber in self.subscribers:
+            subscriber.offer(event, message)
+
+    async def stream_events(self, reader, writer, headers):
+        """ Accepts a WebSocket, sends it events and runs the commands it sends until it closes. """
+        if len(self.subscribers) >= MAX_SUBSCRIBERS or "sec-websocket-key" not in headers:
+            await self.reply(writer, 503 if "sec-websocket-key" in headers else 400, {"error": "WebSocket not accepted"})
+            return
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {websocket_accept(headers['sec-websocket-key'])}\r\n\r\n").encode())
+        await writer.drain()
+
+        # Send the current status first, then the events as they happen
+        subscriber = Subscriber(writer)
+        self.subscribers.add(subscriber)
+        _, status = await self.run_command("status", {})
+        subscriber.offer("status", json.dumps({"event": "status", **status}).encode())
+        sender = asyncio.create_task(self.send_events(subscriber))
+        try:
+            await self.read_commands(reader, writer)
+        finally:
+            self.subscribers.discard(subscriber)
+            sender.cancel()
+
+    async def send_events(self, subscriber):
+        """ Sends the pending events of a subscriber, disconnecting it if its socket does not drain in time. """
+        writer = subscriber.writer
+        try:
+            while True:
+                for message in await subscriber.take():
+                    writer.write(encode_frame(message))
+                await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            self.subscribers.discard(subscriber)
+            writer.close()
+
+    async def read_commands(self, reader, writer):
+        """ Runs the commands a WebSocket client sends and replies to each, until it closes. """
+        while True:
+            try:
+                opcode, payload = await read_frame(reader)
+            except FrameTooLarge:
+                # The rest of the frame is not read, so the WebSocket cannot go on and is closed with a reason
+                writer.write(encode_frame(MESSAGE_TOO_BIG.to_bytes(2, "big"), CLOSE))
+                await writer.drain()
+                return
+            if opcode == CLOSE:
+                writer.write(encode_frame(b"", CLOSE))
+                return
+            if opcode == PING:
+                writer.write(encode_frame(payload, PONG))
+                continue
+            if opcode != TEXT:
+                continue
+            try:
+                request = json.loads(payload)
+                name = request.pop("command")
+            except (ValueError, KeyError, AttributeError, TypeError):
+                name, status, result = None, 400, {"error": "Send a JSON object with a command"}
+            else:
+                status, result = await self.run_command(name, request)
+            writer.write(encode_frame(json.dumps({"reply": name, "status": status, "result": result}).encode()))
+
+def finish(future, answer):
+    """ Hands a command's answer to its waiting client, unless the client gave up. """
+    if not future.done():
+        future.set_result(answer)
@@ -0,0 +1,253 @@
+import asyncio
+import json
+from base64 import b64encode
+from os import path, mkdir, urandom
+from shutil import copyfile
+from threading import Thread
+import pytest
+from audio_backend import NullBackend
+from headless_loop import HeadlessLoop
+from player_engine import PlayerEngine
+from remote_control import CLOSE, MAX_BODY, MESSAGE_TOO_BIG, RemoteControl, Subscriber, encode_frame, read_frame, websocket_accept
+
+SAMPLE_MUSIC = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+NAMES = ["01 First.mp3", "02 Second.mp3", "03 Third.mp3"]
+
+@pytest.fixture
+def engine(tmp_path):
+    """ Creates an engine on a real-time loop with a remote control on a free port, over one album of three music files. """
+    album_path = str(tmp_path / "music" / "album")
+    mkdir(str(tmp_path / "music"))
+    mkdir(album_path)
+    for name in NAMES:
+        copyfile(SAMPLE_MUSIC, path.join(album_path, name))
+
+    loop = HeadlessLoop()
+    engine = PlayerEngine(loop, NullBackend(clock=loop.time, default_length=60), str(tmp_path / "music"),
+                          str(tmp_path / "index.db"))
+    engine.loop = loop
+    engine.album_path = album_path
+    engine.tasks.wait()
+    engine.set_queue(NAMES, album_path)
+    engine.remote = RemoteControl(engine, port=0).start()
+    yield engine
+    engine.remote.close()
+    engine.close()
+
+def run_clients(engine, client):
+    """ Runs an asyncio client in a thread while the engine's loop runs, and returns what the client returned. """
+    result = {}
+
+    def run():
+        try:
+            result["value"] = asyncio.run(client(engine.remote.port))
+        except BaseException as error:
+            result["error"] = error
+
+    thread = Thread(target=run)
+    thread.start()
+    while thread.is_alive():
+        engine.loop.run(duration=0.05)
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+async def request(port, method, target, body=None, headers="Content-Type: application/json\r\n"):
+    """ Sends an HTTP request and returns the status code and JSON body of the response. """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = b"" if body is None else json.dumps(body).encode()
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n{headers}Content-Length: {len(data)}\r\n\r\n".encode() + data)
+    response = await reader.read()
+    writer.close()
+    head, _, content = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(content)
+
+async def connect(port):
+    """ Opens a WebSocket to the event stream and returns its reader and writer. """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    key = b64encode(urandom(16)).decode()
+    writer.write((f"GET /events HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 101")
+    assert websocket_accept(key).encode() in head
+    return reader, writer
+
+async def receive(reader, event, skipped=None):
+    """ Reads messages until one is the event, or a reply, and returns it, keeping the messages before it in skipped. """
+    while True:
+        _, payload = await read_frame(reader)
+        message = json.loads(payload)
+        if message.get("event") == event or (event == "reply" and "reply" in message):
+            return message
+        if skipped is not None:
+            skipped.append(message)
+
+def test_http_commands_control_the_engine(engine):
+    """ Test that HTTP commands play, pause, skip and set the volume, and that bad requests are refused. """
+    async def client(port):
+        return [
+            await request(port, "POST", "/play", {"index": 1}),
+            await request(port, "POST", "/pause"),
+            await request(port, "POST", "/volume", {"volume": 0.25}),
+            await request(port, "POST", "/next"),
+            await request(port, "GET", "/status"),
+            await request(port, "POST", "/play", {"index": 7}),
+            await request(port, "POST", "/rewind"),
+            await request(port, "GET", "/pause"),
+        ]
+
+    played, paused, volume, skipped, status, out_of_range, unknown, wrong_method = run_clients(engine, client)
+
+    assert played[0] == 200 and played[1]["index"] == 1
+    assert paused[1]["paused"] is True
+    assert volume[1]["volume"] == 0.25 and engine.volume == 0.25
+    assert skipped[1]["index"] == 2
+    assert status[1]["path"] == path.join(engine.album_path, NAMES[2])
+    assert out_of_range[0] == 400
+    assert unknown[0] == 404
+    assert wrong_method[0] == 405
+
+def test_playing_music_removed_from_the_top_of_the_queue(engine):
+    """ Test that once the playing music is removed from the top of the queue it has no index, and play starts the new first. """
+    engine.play_music(0)
+    engine.tasks.wait()
+    engine.play_items = NAMES[1:]
+    engine.queue_changed(0, -1)
+
+    async def client(port):
+        return await request(port, "GET", "/status"), await request(port, "POST", "/play")
+
+    (_, status), (played, result) = run_clients(engine, client)
+
+    assert status["index"] is None and status["path"] == path.join(engine.album_path, NAMES[0])
+    assert played == 200 and result["index"] == 0 and result["path"] == path.join(engine.album_path, NAMES[1])
+
+def test_broadcasts_to_hundreds_of_clients(engine):
+    """ Test that every one of hundreds of subscribers gets the status when it connects and the track that starts after. """
+    clients = 300
+
+    async def client(port):
+        connections = await asyncio.gather(*(connect(port) for _ in range(clients)))
+        statuses = await asyncio.gather(*(receive(reader, "status") for reader, _ in connections))
+        await request(port, "POST", "/play", {"index": 2})
+        tracks = await asyncio.wait_for(asyncio.gather(*(receive(reader, "track") for reader, _ in connections)), 20)
+        for _, writer in connections:
+            writer.close()
+        return statuses, tracks
+
+    statuses, tracks = run_clients(engine, client)
+
+    assert len(statuses) == clients and all(status["path"] is None for status in statuses)
+    assert all(track["index"] == 2 and track["path"].endswith(NAMES[2]) for track in tracks)
+
+def test_playlist_edits_over_websocket(engine):
+    """ Test that playlist commands sent over a WebSocket edit the open playlist and are broadcast. """
+    opened = []
+    engine.create_playlist("Mix.txt")
+    engine.tasks.wait()
+    engine.open_playlist("Mix.txt", on_done=opened.append)
+    engine.tasks.wait()
+    first, second = (path.join(engine.album_path, name) for name in NAMES[:2])
+
+    async def client(port):
+        reader, writer = await connect(port)
+        replies = []
+        events = []
+        for command in ({"command": "playlist_add", "path": first}, {"command": "playlist_add", "path": second},
+                        {"command": "playlist_move", "entry_id": 2, "index": 0},
+                        {"command": "playlist_remove", "index": 5}, {"command": "playlist"}, "not json"):
+            writer.write(encode_frame(json.dumps(command).encode() if isinstance(command, dict) else b"{", mask=True))
+            replies.append(await receive(reader, "reply", events))
+        writer.write(encode_frame(b"", CLOSE, mask=True))
+        writer.close()
+        return replies, [event for event in events if event["event"] == "playlist_changed"]
+
+    replies, changes = run_clients(engine, client)
+
+    assert [reply["status"] for reply in replies] == [200, 200, 200, 400, 200, 400]
+    assert replies[4]["result"]["entries"] == [{"entry_id": 2, "path": second}, {"entry_id": 1, "path": first}]
+    assert opened[-1].entries == [second, first]
+    # Each edit is broadcast unless a newer one replaced it before it was sent, the last one always arrives
+    assert changes and changes[-1] == {"event": "playlist_changed", "old_index": 1, "new_index": 0, "entry_id": 2}
+
+def test_command_that_fails_is_answered_at_once(engine):
+    """ Test that a command raising an unexpected error is answered with a 500 rather than timing out. """
+    def pause():
+        raise RuntimeError("mixer gone")
+    engine.pause = pause
+
+    status, result = run_clients(engine, lambda port: request(port, "POST", "/pause"))
+
+    assert status == 500
+    assert "mixer gone" in result["error"]
+
+def test_too_large_websocket_message_closes_the_connection(engine):
+    """ Test that a message larger than allowed closes the WebSocket with status 1009. """
+    async def client(port):
+        reader, writer = await connect(port)
+        await receive(reader, "status")
+        writer.write(encode_frame(bytes(MAX_BODY + 1), mask=True))
+        while True:
+            opcode, payload = await read_frame(reader)
+            if opcode == CLOSE:
+                writer.close()
+                return payload
+
+    assert run_clients(engine, client) == MESSAGE_TOO_BIG.to_bytes(2, "big")
+
+def test_requests_from_web_pages_are_refused(engine):
+    """ Test that a web page's request, a body that is not JSON and a path outside the music folder are refused. """
+    engine.create_playlist("Mix.txt")
+    engine.tasks.wait()
+    engine.open_playlist("Mix.txt", on_done=lambda store: None)
+    engine.tasks.wait()
+
+    async def client(port):
+        return [
+            await request(port, "POST", "/stop", headers="Origin: http://example.com\r\nContent-Type: application/json\r\n"),
+            await request(port, "POST", "/volume", {"volume": 0}, headers="Content-Type: text/plain\r\n"),
+            await request(port, "GET", "/status", headers="Origin: http://example.com\r\n"),
+            await request(port, "POST", "/playlist_add", {"path": SAMPLE_MUSIC}),
+            await request(port, "POST", "/playlist_add", {"path": path.join(engine.album_path, "..", "..", "index.db")}),
+            await request(port, "POST", "/playlist_add", {"path": path.join(engine.album_path, NAMES[0])}),
+        ]
+
+    statuses = [status for status, _ in run_clients(engine, client)]
+
+    assert statuses == [403, 415, 403, 400, 400, 200]
+    assert engine.volume != 0
+    assert engine.playlist_store.entries == [path.join(engine.album_path, NAMES[0])]
+
+def test_token_is_required_when_set(engine):
+    """ Test that a server with a token refuses requests without it, and one listening beyond this machine makes one up. """
+    engine.remote.close()
+    engine.remote = RemoteControl(engine, port=0, token="secret").start()
+
+    async def client(port):
+        return [
+            await request(port, "GET", "/status"),
+            await request(port, "GET", "/status?token=wrong"),
+            await request(port, "GET", "/status?token=secret"),
+            await request(port, "POST", "/pause", headers="Content-Type: application/json\r\nAuthorization: Bearer secret\r\n"),
+        ]
+
+    assert [status for status, _ in run_clients(engine, client)] == [401, 401, 200, 200]
+    assert RemoteControl(engine, host="0.0.0.0").token
+    assert RemoteControl(engine).token is None
+
+def test_slow_subscriber_keeps_only_the_newest_event_of_each_kind():
+    """ Test that events a subscriber has not sent yet are coalesced, so a slow client holds one event per kind. """
+    async def coalesce():
+        subscriber = Subscriber(writer=None)
+        for second in range(1000):
+            subscriber.offer("position", f"position {second}".encode())
+        subscriber.offer("track", b"track")
+        subscriber.offer("position", b"position last")
+        assert len(subscriber.pending) == 2
+        return await subscriber.take()
+
+    assert asyncio.run(coalesce()) == [b"track", b"position last"]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,239 @@
+""" search_index.py
+
+Design:
+def search_key
+    cut file name, title, artist and album each to the indexed length, at a word
+    join them in lowercase
+
+def trigrams
+    return every three letter piece of a text
+
+class SearchIndex:
+    def __init__
+        initialize tracks, sorted words and trigram postings
+
+    def add
+        give track an id
+        add its words and trigrams to the index
+        forget the previous results, they cannot hold the new track
+
+    def add_many
+        add tracks
+        sort words once at the end
+
+    def update
+        add the words and trigrams of newly read tags to a track
+
+    def remove
+        forget track, its postings stay but its key no longer matches
+        forget the previous results
+
+    def search
+        if each word of the previous query is matched within a word of this one, narrow the previous results
+        otherwise find candidates for each word
+        keep candidates whose key holds every word, short words must start a word
+        stop at the result limit
+
+    def candidates
+        for a word of three or more letters, use the trigram with the fewest tracks
+        for a shorter word, chain the tracks of every word starting with it
+        return number of candidates and candidates
+
+    def memory_usage
+        return bytes used by paths, keys, words and postings
+
+An in-memory index over the file name, title, artist and album of every track
+for as-you-type search. Each query word is looked up either through trigram
+postings, taking the rarest trigram of the word as candidates, or through a
+sorted word list searched with bisect for prefixes of one or two letters. The
+candidates are then checked against the track's key, so the results are exact.
+Typing another letter narrows the previous results instead of searching again,
+as long as each previous word is still matched within one of the new words: a
+word that grows to three letters moves from prefix to substring matching and
+can match tracks the prefix did not, so that search starts over.
+Postings are kept in arrays of 4 byte ids and each field of a key is cut to a
+fixed length at a word, so every field stays searchable however long the file
+name is. On a 200k track library the index takes about 670 bytes per track,
+about 105 MB in all, two thirds of it postings, and a keystroke takes from
+under a millisecond for a long word to about 10 ms for several one letter
+words, whose prefixes cover most of the library.
+"""
+
+from array import array
+from bisect import bisect_left
+from itertools import chain, islice
+from os import path
+from sys import getsizeof
+
+MAX_FIELD_LENGTH = 64
+DEFAULT_LIMIT = 1000
+COUNT_SAMPLE_WORDS = 64
+CHUNK_SIZE = 2048
+
+def search_key(music_path, tags=None):
+    """ Returns the lowercase text a track is searched by. """
+    fields = [path.splitext(path.basename(music_path))[0]]
+    if tags:
+        fields += [tags.get("title") or "", tags.get("artist") or "", tags.get("album") or ""]
+    # Each field is cut on its own, so a long file name never hides the artist and album
+    fields = [cut_field(field) for field in fields]
+    # The leading space lets a short word be matched against the start of a word with " " + word
+    return " " + " ".join(field for field in fields if field).lower()
+
+def cut_field(field):
+    """ Returns a field cut to the indexed length, at the end of a word so no made up word is indexed. """
+    if len(field) <= MAX_FIELD_LENGTH:
+        return field
+    cut = field[:MAX_FIELD_LENGTH]
+    # The word cut in the middle is dropped, unless it is the only word
+    if not field[MAX_FIELD_LENGTH].isspace() and len(cut.split()) > 1:
+        cut = cut.rsplit(None, 1)[0]
+    return cut
+
+def trigrams(text):
+    """ Returns the set of three letter pieces of a text. """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class SearchIndex:
+    """ An as-you-type search index over the tracks in the library. """
+    def __init__(self):
+        self.paths = []
+        self.keys = []
+        self.ids = {}
+        self.words = []
+        self.words_sorted = True
+        self.word_postings = {}
+        self.trigram_postings = {}
+        self.previous_patterns = None
+        self.previous_results = None
+
+    def add(self, music_path, tags=None):
+        """ Adds a track to the index. """
+        if music_path in self.ids:
+            self.update(music_path, tags)
+            return
+        track_id = len(self.paths)
+        key = search_key(music_path, tags)
+        self.ids[music_path] = track_id
+        self.paths.append(music_path)
+        self.keys.append(key)
+        self.index_text(track_id, set(key.split()), trigrams(key))
+        # The previous results cannot hold the new track, so the next search starts over
+        self.previous_patterns = None
+
+    def add_many(self, tracks):
+        """ Adds (path, tags) pairs to the index. """
+        for music_path, tags in tracks:
+            self.add(music_path, tags)
+        self.sort_words()
+
+    def sort_words(self):
+        """ Sorts the word list for prefix lookups if words were added. """
+        if not self.words_sorted:
+            self.words.sort()
+            self.words_sorted = True
+
+    def update(self, music_path, tags):
+        """ Adds the words of newly read tags to a track that is already indexed. """
+        track_id = self.ids.get(music_path)
+        if track_id is None:
+            self.add(music_path, tags)
+            return
+        key = search_key(music_path, tags)
+        old_key = self.keys[track_id]
+        if key != old_key:
+            # Only the words and trigrams the track did not have yet are added
+            self.keys[track_id] = key
+            self.index_text(track_id, set(key.split()) - set(old_key.split()), trigrams(key) - trigrams(old_key))
+            self.previous_patterns = None
+
+    def remove(self, music_path):
+        """ Removes a track from the search results. """
+        track_id = self.ids.pop(music_path, None)
+        if track_id is not None:
+            # The postings keep the id, an empty key never matches so it is dropped when candidates are checked
+            self.keys[track_id] = ""
+            self.previous_patterns = None
+
+    def index_text(self, track_id, words, text_trigrams):
+        """ Adds words and trigrams to the postings of a track. """
+        for word in words:
+            postings = self.word_postings.get(word)
+            if postings is None:
+                postings = self.word_postings[word] = array("I")
+                self.words.append(word)
+                self.words_sorted = False
+            postings.append(track_id)
+        for trigram in text_trigrams:
+            postings = self.trigram_postings.get(trigram)
+            if postings is None:
+                postings = self.trigram_postings[trigram] = array("I")
+            postings.append(track_id)
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """ Returns the paths of up to limit tracks whose key contains every word of the query. """
+        words = query.lower().split()
+        if not words:
+            return []
+
+        # Short words must start a word of the key, longer ones can be anywhere in it
+        patterns = [word if len(word) >= 3 else " " + word for word in words]
+
+        # Typing another letter narrows the previous results, as long as every track that matches now matched
+        # before and the previous results were not cut at the limit
+        if (self.previous_patterns is not None and len(self.previous_results) < limit
+                and all(any(old in pattern for pattern in patterns) for old in self.previous_patterns)):
+            candidates = self.previous_results
+        else:
+            candidates = min((self.candidates(word) for word in words), key=lambda candidate: candidate[0])[1]
+
+        # Keep the candidates whose key holds every word, a chunk at a time so the search stops near the limit
+        keys = self.keys
+        results = {}
+        candidates = iter(candidates)
+        while len(results) < limit:
+            chunk = list(islice(candidates, CHUNK_SIZE))
+            if not chunk:
+                break
+            for pattern in patterns:
+                chunk = [track_id for track_id in chunk if pattern in keys[track_id]]
+            # A track can be a candidate through more than one word, dict.fromkeys drops repeats in order
+            results.update(dict.fromkeys(chunk))
+        results = list(results)[:limit]
+
+        self.previous_patterns = patterns
+        self.previous_results = results
+        return [self.paths[track_id] for track_id in results]
+
+    def candidates(self, word):
+        """ Returns the number of tracks that may contain a word and their ids. """
+        if len(word) >= 3:
+            # Every trigram of the word must be in the key, the rarest gives the fewest candidates
+            postings = min((self.trigram_postings.get(trigram, ()) for trigram in trigrams(word)), key=len)
+            return len(postings), postings
+
+        # A short word is matched against the start of the words in the keys, the
+        # postings are chained rather than copied since the search stops at its limit
+        self.sort_words()
+        start = bisect_left(self.words, word)
+        end = bisect_left(self.words, word + "\uffff")
+        words = self.words
+        postings = (self.word_postings[words[i]] for i in range(start, end))
+
+        # Count the candidates of the first words only and extrapolate, a one letter prefix can cover most words
+        sample = [len(self.word_postings[words[i]]) for i in range(start, min(end, start + COUNT_SAMPLE_WORDS))]
+        count = sum(sample) * (end - start) // len(sample) if sample else 0
+        return count, chain.from_iterable(postings)
+
+    def memory_usage(self):
+        """ Returns an estimate of the bytes used by the index. """
+        postings = list(self.word_postings.values()) + list(self.trigram_postings.values())
+        return {
+            "tracks": len(self.paths),
+            "paths_bytes": sum(getsizeof(music_path) for music_path in self.paths) + getsizeof(self.paths)
+                           + getsizeof(self.ids),
+            "keys_bytes": sum(getsizeof(key) for key in self.keys) + getsizeof(self.keys),
+            "words_bytes": sum(getsizeof(word) for word in self.words) + getsizeof(self.words),
+            "postings_bytes": sum(getsizeof(ids) for ids in postings)
+                              + getsizeof(self.word_postings) + getsizeof(self.trigram_postings),
+        }
@@ -0,0 +1,92 @@
+from random import Random
+from time import perf_counter
+import pytest
+from search_index import SearchIndex
+
+def make_index():
+    """ Creates an index of a few tracks, some with tags. """
+    index = SearchIndex()
+    index.add("/music/filk_firestorm/03 Walk Through The Night-Side.mp3",
+              {"title": "Walk Through the Night-Side", "artist": "Leslie Fish", "album": "Firestorm"})
+    index.add("/music/filk_minus_ten_and_counting/10 Apollo Lost.mp3")
+    index.add("/music/filk_minus_ten_and_counting/18 Voyager.mp3")
+    return index
+
+def test_search_by_file_name_and_tags():
+    """ Test that tracks are found by file name, artist and album. """
+    index = make_index()
+
+    assert index.search("voyager") == ["/music/filk_minus_ten_and_counting/18 Voyager.mp3"]
+    assert index.search("fish fire") == ["/music/filk_firestorm/03 Walk Through The Night-Side.mp3"]
+    assert index.search("zzz") == []
+
+def test_short_words_match_word_starts():
+    """ Test that one and two letter words match the start of a word. """
+    index = make_index()
+
+    assert index.search("ap") == ["/music/filk_minus_ten_and_counting/10 Apollo Lost.mp3"]
+    assert index.search("o") == []
+
+def test_typing_narrows_results():
+    """ Test that each keystroke narrows the previous results. """
+    index = make_index()
+
+    assert len(index.search("lo")) == 1
+    assert index.search("los") == ["/music/filk_minus_ten_and_counting/10 Apollo Lost.mp3"]
+    assert index.search("lost x") == []
+
+def test_prefix_growing_into_substring_searches_again():
+    """ Test that a word growing from a prefix to three letters also finds tracks where it is inside a word. """
+    index = make_index()
+    index.add("/music/album/Closer.mp3")
+
+    assert index.search("lo") == ["/music/filk_minus_ten_and_counting/10 Apollo Lost.mp3"]
+    assert index.search("los") == ["/music/filk_minus_ten_and_counting/10 Apollo Lost.mp3", "/music/album/Closer.mp3"]
+
+def test_tags_read_later_are_searchable():
+    """ Test that tags added after a track was indexed can be searched. """
+    index = make_index()
+    index.search("ches")
+    index.update("/music/filk_minus_ten_and_counting/18 Voyager.mp3", {"artist": "Julia Ecklar", "album": "Minus Ten"})
+
+    assert index.search("ecklar") == ["/music/filk_minus_ten_and_counting/18 Voyager.mp3"]
+
+def test_long_file_name_keeps_artist_and_album_searchable():
+    """ Test that a long file name does not cut off the artist and album, and no cut word is indexed. """
+    index = SearchIndex()
+    music_path = "/music/01 - Some Artist Name - A Fairly Long Song Title (Remastered 2011).mp3"
+    index.add(music_path, {"title": "A Fairly Long Song Title (Remastered 2011) [Deluxe Edition Bonus Track Version]",
+                           "artist": "Some Artist Name", "album": "Greatest Hits Collection"})
+
+    assert index.search("greatest hits") == [music_path]
+    assert index.search("bonus") == [music_path]
+    assert "(rem" not in index.words
+
+def test_added_track_shows_up_while_typing():
+    """ Test that a track added between keystrokes is found by the next, narrower one. """
+    index = make_index()
+    assert index.search("voy") == ["/music/filk_minus_ten_and_counting/18 Voyager.mp3"]
+    index.add("/music/album/Voyage Home.mp3")
+
+    assert index.search("voya") == ["/music/filk_minus_ten_and_counting/18 Voyager.mp3", "/music/album/Voyage Home.mp3"]
+
+def test_large_library_search_is_fast():
+    """ Test that keystrokes on a 200k track library take under 10 ms. """
+    random = Random(1)
+    words = ["love", "night", "song", "blue", "river", "fire", "star", "heart", "road", "rain"]
+    tracks = []
+    for i in range(200_000):
+        title = " ".join(random.choice(words) for _ in range(3))
+        tracks.append((f"/music/artist{i % 5000}/album{i % 20000}/{i:06d} {title}.mp3",
+                       {"title": title, "artist": f"Artist {i % 5000}", "album": f"Album {i % 20000}"}))
+    index = SearchIndex()
+    index.add_many(tracks)
+
+    for query in ("r", "ri", "riv", "rive", "river", "river st", "river sta"):
+        started = perf_counter()
+        index.search(query)
+        assert perf_counter() - started < 0.01, query
+    assert index.memory_usage()["tracks"] == 200_000
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,75 @@
+""" startup_benchmark.py
+
+Design:
+def measure_startup
+    import music player
+    construct window and draw it
+    open first folder and play first music file
+    print the time of each step since the interpreter was launched
+
+def run_benchmark
+    start a fresh interpreter for each run so every start is cold
+    collect the times of each run
+    print the median time to first window and to first sound
+
+Measures how long the music player takes to show its first window and to play
+its first sound. Each run starts a new interpreter, so the times include the
+interpreter start up, imports and mixer start up that a user waits for when
+launching the program. perf_counter is a system wide monotonic clock, so the
+child process measures its steps from the moment the parent launched it.
+A display and a sound device are needed.
+"""
+
+from json import dumps, loads
+from statistics import median
+from subprocess import run
+from sys import argv, executable
+from time import perf_counter
+
+RUNS = 5
+
+def measure_startup(started):
+    """ Prints the time of each start up step in seconds since the interpreter was launched. """
+    import tkinter as tk
+    import music_player
+    imported = perf_counter()
+
+    # Construct the window and draw it
+    root = tk.Tk()
+    player = music_player.MusicPlayer(root)
+    root.update()
+    first_window = perf_counter()
+
+    # Open the first folder and play the first music file
+    player.tasks.wait()
+    player.music_listbox.selection_set(0)
+    player.open_folder()
+    player.tasks.wait()
+    player.music_listbox.selection_set(0)
+    player.play_pause_music()
+    while not player.engine.backend.busy():
+        root.update()
+    first_sound = perf_counter()
+
+    print(dumps({
+        "import": imported - started,
+        "first_window": first_window - started,
+        "first_sound": first_sound - started,
+    }))
+    root.destroy()
+
+def run_benchmark(runs=RUNS):
+    """ Runs the start up measurement in fresh interpreters and prints the median times. """
+    results = []
+    for _ in range(runs):
+        child = run([executable, __file__, "--child", str(perf_counter())], capture_output=True, text=True, check=True)
+        results.append(loads(child.stdout.splitlines()[-1]))
+
+    for step in ("import", "first_window", "first_sound"):
+        print(f"{step:>12}: {median(result[step] for result in results) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    if "--child" in argv:
+        measure_startup(float(argv[-1]))
+    else:
+        run_benchmark()
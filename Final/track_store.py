@@ -0,0 +1,391 @@
+""" track_store.py
+
+Design:
+class StringColumn:
+    def __init__
+        initialize one byte array holding every string and the offset each starts at
+
+    def append
+        add UTF-8 bytes of string to the byte array and its end to the offsets
+
+    def __getitem__
+        decode the bytes between two offsets
+
+class StringPool (StringColumn):
+    def intern
+        return the ID of a string, adding it the first time it is seen
+
+    def find
+        return the ID of a string, or None if it was never added
+
+class Track:
+    a row of the track store, reading each field from its column when asked
+
+class TrackStore:
+    def __init__
+        initialize numeric columns as arrays, folder, artist and album pools and name and title columns
+
+    def from_rows
+        append rows of folder, name, title, artist, album, duration, size and mtime ordered by folder and name
+
+    def append
+        intern folder, artist and album
+        add each field to its column
+
+    def find
+        find the rows of the folder by bisecting the folder column
+        bisect the names of those rows
+
+    def memory_usage
+        return bytes used by the columns
+
+    def save
+        write a header describing the columns, then each column aligned to 8 bytes
+        through a temporary file
+
+    def load
+        map the file into memory
+        view each column where it lies in the file without copying it
+
+    def thaw
+        copy mapped columns into arrays so rows can be appended
+
+    def close
+        release the mapped file
+
+The whole library in memory, column by column. A dict or object per track costs
+hundreds of bytes before any of its strings; here each field of every track is
+one slot of an array, so a track costs about 44 bytes plus the UTF-8 bytes of
+its file name and title. Folders, artists and albums repeat across tracks, so
+each is kept once in a pool and tracks hold its 4 byte ID. Strings are packed
+into one byte array with an array of offsets, not kept as Python strings, and
+are only decoded when a row is read. A Track is a view of one row with
+__slots__, made when it is asked for and holding no copies, so a million
+tracks fit in tens of megabytes.
+
+Rows are kept ordered by folder and name, as the library index returns them.
+Folder IDs are given out in order of first appearance, so the folder column is
+sorted too, and a path is found by bisecting it and then the names of its
+folder, without a dictionary of paths.
+
+The store is saved as a header followed by the raw bytes of each column. Loading
+maps the file and casts a memoryview over each column where it lies, so nothing
+is parsed or copied and a million tracks load in milliseconds, with the pages
+read from disk as rows are used.
+"""
+
+import json
+from array import array
+from bisect import bisect_left, bisect_right
+from math import isnan
+from mmap import ACCESS_READ, mmap
+from os import path, replace
+from struct import calcsize, pack, unpack_from
+from sys import byteorder
+from threading import get_ident
+
+# A saved store starts with a magic number, a version and the length of the JSON header describing its columns
+MAGIC = b"TRKSTORE"
+VERSION = 1
+HEADER = "<8sII"
+ALIGNMENT = 8
+
+# Numeric columns and their array typecodes, pool IDs and sizes are unsigned and mtimes keep full precision
+NUMERIC_COLUMNS = {"folder": "I", "artist": "I", "album": "I", "duration": "f", "size": "Q", "mtime": "d"}
+STRING_COLUMNS = ("folders", "artists", "albums", "names", "titles")
+
+class StringColumn:
+    """ Strings packed as UTF-8 into one byte array, with the offset each string starts at. """
+    def __init__(self, blob=None, offsets=None):
+        self.blob = array("B") if blob is None else blob
+        self.offsets = array("I", [0]) if offsets is None else offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """ Returns the string at an index. """
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes().decode()
+
+    def append(self, text):
+        """ Adds a string and returns its index. """
+        self.blob.frombytes(text.encode())
+        self.offsets.append(len(self.blob))
+        return len(self.offsets) - 2
+
+    def thaw(self):
+        """ Copies mapped bytes into arrays so strings can be added. """
+        if not isinstance(self.blob, array):
+            self.blob = copy_array("B", self.blob)
+            self.offsets = copy_array("I", self.offsets)
+
+    def memory_usage(self):
+        """ Returns the bytes used by the strings and offsets. """
+        return self.blob.itemsize * len(self.blob) + self.offsets.itemsize * len(self.offsets)
+
+class StringPool(StringColumn):
+    """ Strings that repeat across tracks, each kept once and referred to by its ID. """
+    def __init__(self, blob=None, offsets=None):
+        super().__init__(blob, offsets)
+        self.ids = None
+
+        # ID 0 is no string, for tracks without an artist or album
+        if blob is None:
+            self.append("")
+
+    def lookup(self):
+        """ Returns the dictionary from string to ID, built the first time it is needed. """
+        if self.ids is None:
+            self.ids = {self[index]: index for index in range(len(self))}
+        return self.ids
+
+    def intern(self, text):
+        """ Returns the ID of a string, adding it if it is new. """
+        ids = self.lookup()
+        string_id = ids.get(text or "")
+        if string_id is None:
+            self.thaw()
+            string_id = ids[text] = self.append(text)
+        return string_id
+
+    def find(self, text):
+        """ Returns the ID of a string, or None if it is not in the pool. """
+        return self.lookup().get(text)
+
+    def memory_usage(self):
+        """ Returns the bytes used by the strings and offsets, and an estimate for the lookup dictionary. """
+        return super().memory_usage() + (0 if self.ids is None else 100 * len(self.ids))
+
+class Track:
+    """ A view of one row of a TrackStore, each field is read from its column when asked for. """
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __repr__(self):
+        return f"Track({self.path!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Track) and self.store is other.store and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.store), self.row))
+
+    @property
+    def folder(self):
+        return self.store.folders[self.store.columns["folder"][self.row]]
+
+    @property
+    def name(self):
+        return self.store.names[self.row]
+
+    @property
+    def path(self):
+        return path.join(self.folder, self.name)
+
+    @property
+    def title(self):
+        return self.store.titles[self.row] or None
+
+    @property
+    def artist(self):
+        return self.store.artists[self.store.columns["artist"][self.row]] or None
+
+    @property
+    def album(self):
+        return self.store.albums[self.store.columns["album"][self.row]] or None
+
+    @property
+    def duration(self):
+        duration = self.store.columns["duration"][self.row]
+        return None if isnan(duration) else duration
+
+    @property
+    def size(self):
+        return self.store.columns["size"][self.row]
+
+    @property
+    def mtime(self):
+        return self.store.columns["mtime"][self.row]
+
+    def tags(self):
+        """ Returns the title, artist, album and duration as the library index returns them. """
+        return {"title": self.title, "artist": self.artist, "album": self.album, "duration": self.duration}
+
+class TrackStore:
+    """ The tracks of the library in arrays, one per field, with repeated strings interned. """
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in NUMERIC_COLUMNS.items()}
+        self.folders = StringPool()
+        self.artists = StringPool()
+        self.albums = StringPool()
+        self.names = StringColumn()
+        self.titles = StringColumn()
+        self.mapped = None
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Returns a store of (folder, name, title, artist, album, duration, size, mtime) rows ordered by folder and name. """
+        store = cls()
+        for row in rows:
+            store.append(*row)
+        return store
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, row):
+        """ Returns a view of the track at a row. """
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("track store index out of range")
+        return Track(self, row)
+
+    def __iter__(self):
+        return (Track(self, row) for row in range(len(self)))
+
+    def append(self, folder, name, title=None, artist=None, album=None, duration=None, size=0, mtime=0.0):
+        """ Adds a track after the others and returns its row, tracks must be added ordered by folder and name. """
+        self.thaw()
+        folder_id = self.folders.intern(folder)
+        columns = self.columns
+        rows = len(self)
+        if rows and (folder_id, name) < (columns["folder"][-1], self.names[rows - 1]):
+            raise ValueError(f"Tracks must be added in order of folder and name, {name!r} in {folder!r} is out of order")
+
+        columns["folder"].append(folder_id)
+        columns["artist"].append(self.artists.intern(artist))
+        columns["album"].append(self.albums.intern(album))
+        columns["duration"].append(float("nan") if duration is None else duration)
+        columns["size"].append(size or 0)
+        columns["mtime"].append(mtime or 0.0)
+        self.names.append(name)
+        self.titles.append(title or "")
+        return rows
+
+    def find(self, music_path):
+        """ Returns the row of a music file path, or None if it is not in the store. """
+        folder_id = self.folders.find(path.dirname(music_path))
+        if folder_id is None:
+            return None
+
+        # The folder column is sorted, and so are the names within a folder
+        folder_column = self.columns["folder"]
+        low = bisect_left(folder_column, folder_id)
+        high = bisect_right(folder_column, folder_id, low)
+        name = path.basename(music_path)
+        row = bisect_left(self.names, name, low, high)
+        return row if row < high and self.names[row] == name else None
+
+    def memory_usage(self):
+        """ Returns the bytes used by the columns and pools, in total and per track. """
+        numeric = sum(column.itemsize * len(column) for column in self.columns.values())
+        strings = sum(getattr(self, name).memory_usage() for name in STRING_COLUMNS)
+        total = numeric + strings
+        return {
+            "tracks": len(self),
+            "numeric_bytes": numeric,
+            "string_bytes": strings,
+            "bytes_per_track": total / len(self) if len(self) else 0,
+            "mapped": self.mapped is not None,
+        }
+
+    def buffers(self):
+        """ Returns the name, typecode and contents of every column in the order they are saved. """
+        buffers = [(name, typecode, self.columns[name]) for name, typecode in NUMERIC_COLUMNS.items()]
+        for name in STRING_COLUMNS:
+            strings = getattr(self, name)
+            buffers += [(name + ".blob", "B", strings.blob), (name + ".offsets", "I", strings.offsets)]
+        return buffers
+
+    def save(self, store_path):
+        """ Writes the columns to a file, through a temporary file so a reader never sees half of it. """
+        # The header records where each column starts, every column starts on an 8 byte boundary
+        layout = {}
+        offset = 0
+        for name, typecode, column in self.buffers():
+            length = len(column) * column.itemsize
+            layout[name] = (typecode, offset, len(column))
+            offset += -(-length // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({"byteorder": byteorder, "rows": len(self), "columns": layout}).encode()
+        start = -(-(calcsize(HEADER) + len(header)) // ALIGNMENT) * ALIGNMENT
+
+        # Two rebuilds can save at once, each writes its own temporary file
+        temporary_path = f"{store_path}.{get_ident()}.tmp"
+        with open(temporary_path, "wb") as store_file:
+            store_file.write(pack(HEADER, MAGIC, VERSION, len(header)) + header)
+            for name, _, column in self.buffers():
+                store_file.seek(start + layout[name][1])
+                store_file.write(column)
+            # Pad the file to the end of the last column, an empty last column would otherwise be cut off
+            store_file.truncate(start + offset)
+        replace(temporary_path, store_path)
+
+    @classmethod
+    def load(cls, store_path):
+        """ Maps a saved store into memory, its columns are views of the file rather than copies. """
+        with open(store_path, "rb") as store_file:
+            mapped = mmap(store_file.fileno(), 0, access=ACCESS_READ)
+        try:
+            magic, version, header_length = unpack_from(HEADER, mapped)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{store_path} is not a track store of version {VERSION}")
+            header = json.loads(mapped[calcsize(HEADER):calcsize(HEADER) + header_length])
+            if header["byteorder"] != byteorder:
+                raise ValueError(f"{store_path} was saved on a machine of another byte order")
+        except (ValueError, KeyError, TypeError):
+            mapped.close()
+            raise
+        start = -(-(calcsize(HEADER) + header_length) // ALIGNMENT) * ALIGNMENT
+
+        # Each column is a memoryview cast to its type over the bytes where it lies
+        view = memoryview(mapped)
+        columns = {}
+        for name, (typecode, offset, length) in header["columns"].items():
+            itemsize = array(typecode).itemsize
+            columns[name] = view[start + offset:start + offset + length * itemsize].cast(typecode)
+
+        store = cls.__new__(cls)
+        store.columns = {name: columns[name] for name in NUMERIC_COLUMNS}
+        for name in STRING_COLUMNS:
+            column_type = StringColumn if name in ("names", "titles") else StringPool
+            setattr(store, name, column_type(columns[name + ".blob"], columns[name + ".offsets"]))
+        store.mapped = (mapped, view)
+        return store
+
+    def thaw(self):
+        """ Copies the columns of a mapped store into arrays so tracks can be added, and releases the file. """
+        if self.mapped is None:
+            return
+        self.columns = {name: copy_array(NUMERIC_COLUMNS[name], column) for name, column in self.columns.items()}
+        for name in STRING_COLUMNS:
+            getattr(self, name).thaw()
+        self.close()
+
+    def close(self):
+        """ Releases the mapped file, a mapped store cannot be read after it is closed. """
+        if self.mapped is None:
+            return
+        mapped, view = self.mapped
+        self.mapped = None
+
+        # The views over the file must be released before the file can be unmapped
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        for name in STRING_COLUMNS:
+            strings = getattr(self, name)
+            for column in (strings.blob, strings.offsets):
+                if isinstance(column, memoryview):
+                    column.release()
+        view.release()
+        mapped.close()
+
+def copy_array(typecode, column):
+    """ Returns an array holding a copy of a column. """
+    copied = array(typecode)
+    copied.frombytes(column.cast("B") if isinstance(column, memoryview) else column)
+    return copied
@@ -0,0 +1,84 @@
+from os import path
+from time import perf_counter
+import pytest
+from track_store import Track, TrackStore
+
+def make_rows(tracks, tracks_per_folder=100):
+    """ Returns rows of a synthetic library ordered by folder and name, with albums of one artist per folder. """
+    for track in range(tracks):
+        folder, number = divmod(track, tracks_per_folder)
+        yield (f"/music/Artist {folder:05d} - Album", f"{number:03d} Track {track}.mp3", f"Track {track}",
+               f"Artist {folder % 500}", f"Album {folder}", 180.5, 4_000_000 + track, 1_700_000_000.25 + track)
+
+def test_rows_read_back_with_interned_strings():
+    """ Test that every field of a row reads back, and that repeated artists and albums are kept once. """
+    store = TrackStore.from_rows(make_rows(1000))
+    store.append("/music/Unknown", "song.mp3")
+
+    track = store[5]
+    assert isinstance(track, Track)
+    assert track.path == path.join("/music/Artist 00000 - Album", "005 Track 5.mp3")
+    assert track.tags() == {"title": "Track 5", "artist": "Artist 0", "album": "Album 0", "duration": 180.5}
+    assert (track.size, track.mtime) == (4_000_005, 1_700_000_005.25)
+    assert store[-1].tags() == {"title": None, "artist": None, "album": None, "duration": None}
+
+    # Ten folders of one artist and album each, plus the empty string every pool starts with
+    assert len(store) == 1001
+    assert len(store.artists) == len(store.albums) == 11
+    assert not hasattr(track, "__dict__")
+
+def test_find_bisects_folder_and_name():
+    """ Test that a path is found by its folder and name, and a missing one is not. """
+    store = TrackStore.from_rows(make_rows(1000))
+
+    assert store.find(path.join("/music/Artist 00003 - Album", "042 Track 342.mp3")) == 342
+    assert store.find(path.join("/music/Artist 00003 - Album", "042 Track 343.mp3")) is None
+    assert store.find(path.join("/music/Nowhere", "042 Track 342.mp3")) is None
+    with pytest.raises(ValueError):
+        store.append("/music/Artist 00000 - Album", "000 Track 0.mp3")
+
+def test_save_and_map(tmp_path):
+    """ Test that a saved store maps back with the same rows, its columns viewing the file until it is thawed. """
+    store_path = str(tmp_path / "library.tracks")
+    store = TrackStore.from_rows(make_rows(1000))
+    store.save(store_path)
+
+    mapped = TrackStore.load(store_path)
+    assert mapped.memory_usage()["mapped"]
+    assert isinstance(mapped.columns["size"], memoryview)
+    assert [track.path for track in mapped] == [track.path for track in store]
+    assert mapped[999].tags() == store[999].tags()
+    assert mapped.find(store[500].path) == 500
+
+    # Adding a track copies the columns out of the file and releases it
+    mapped.append("/music/Zebra", "song.mp3", artist="Artist 3")
+    assert not mapped.memory_usage()["mapped"]
+    assert mapped[-1].artist == "Artist 3" and mapped[999].path == store[999].path
+    assert len(mapped.artists) == len(store.artists)
+
+def test_load_rejects_other_files(tmp_path):
+    """ Test that a file that is not a saved store is refused. """
+    store_path = str(tmp_path / "library.tracks")
+    with open(store_path, "wb") as store_file:
+        store_file.write(b"not a track store at all")
+
+    with pytest.raises(ValueError):
+        TrackStore.load(store_path)
+
+def test_hundred_thousand_tracks_are_compact_and_map_fast(tmp_path):
+    """ Test that a track costs well under a hundred bytes, and that mapping a saved store takes milliseconds. """
+    store_path = str(tmp_path / "library.tracks")
+    store = TrackStore.from_rows(make_rows(100_000))
+    usage = store.memory_usage()
+    assert usage["tracks"] == 100_000
+    assert usage["bytes_per_track"] < 100
+
+    store.save(store_path)
+    started = perf_counter()
+    mapped = TrackStore.load(store_path)
+    assert perf_counter() - started < 0.1
+    assert mapped[99_999].path == store[99_999].path
+    mapped.close()
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,222 @@
+""" virtual_listbox.py
+
+Design:
+class VirtualListbox (tk.Frame):
+    def __init__
+        construct listbox and scrollbar
+        initialize item model and selection
+
+    def set_items
+        replace the item model in one step, keeping a list as it is so its owner can follow it
+        refresh visible rows
+
+    def insert
+        add items to the item model
+        refresh visible rows when idle
+
+    def delete
+        remove items from the item model
+        refresh visible rows when idle
+
+    def get
+        return display text of an item
+
+    def size
+        return number of items
+
+    def curselection
+        return selected index
+
+    def selection_set
+        select an index
+
+    def selection_clear
+        clear the selection
+
+    def see
+        scroll so an index is visible
+
+    def yview
+        scroll the window of visible rows
+
+    def refresh
+        fill the listbox with the visible rows only
+        highlight the selected row if it is visible
+        update the scrollbar
+        if the visible rows are near the end of the items, tell near_end
+
+A tk.Listbox holds a Tcl string for every row it contains, so filling it with
+tens of thousands of items is slow and keeps every string in Tk. The
+VirtualListbox keeps the items in a Python list and only puts the rows that fit
+in the window into its listbox. It answers the subset of the tk.Listbox methods
+the music player uses, with the selection kept as an index into the item list.
+When the rows shown come within a page of the end, near_end is called so the
+owner can add the items it has not loaded yet.
+"""
+
+import tkinter as tk
+
+class VirtualListbox(tk.Frame):
+    """ A listbox that only materializes the rows that are visible. """
+    def __init__(self, master, height=15, **listbox_options):
+        super().__init__(master)
+        self.rows = height
+        self.items = []
+        self.display = str
+        self.top = 0
+        self.selected = None
+        self.refresh_pending = False
+        self.near_end = None
+
+        # Construct the listbox and scrollbar
+        self.listbox = tk.Listbox(self, height=height, exportselection=False, **listbox_options)
+        self.listbox.grid(column=0, row=0, sticky="ns")
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.grid(column=1, row=0, sticky="ns")
+        self.rowconfigure(0, weight=1)
+
+        # Map clicks, keys and the mouse wheel onto the item model
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.listbox.bind("<Up>", lambda event: self.move_selection(-1))
+        self.listbox.bind("<Down>", lambda event: self.move_selection(1))
+        self.listbox.bind("<MouseWheel>", lambda event: self.yview("scroll", -1 if event.delta > 0 else 1, "units"))
+        self.listbox.bind("<Button-4>", lambda event: self.yview("scroll", -1, "units"))
+        self.listbox.bind("<Button-5>", lambda event: self.yview("scroll", 1, "units"))
+
+    def set_items(self, items, display=str):
+        """ Replaces all the items at once, display turns an item into its row text. """
+        # A list is shown as it is, not copied, so the player can tell which of its lists is shown by identity
+        self.items = items if isinstance(items, list) else list(items)
+        self.display = display
+        self.top = 0
+        self.selected = None
+        self.refresh()
+
+    def insert(self, index, *items):
+        """ Inserts items before an index, "end" appends them. """
+        position = len(self.items) if index == "end" else self.index(index)
+        self.items[position:position] = items
+        if self.selected is not None and self.selected >= position:
+            self.selected += len(items)
+        self.schedule_refresh()
+
+    def delete(self, first, last=None):
+        """ Deletes the items from first to last inclusive. """
+        first = self.index(first)
+        last = first if last is None else self.index(last)
+        del self.items[first:last + 1]
+
+        # Keep the selection on the same item, or clear it if the item was deleted
+        if self.selected is not None:
+            if first <= self.selected <= last:
+                self.selected = None
+            elif self.selected > last:
+                self.selected -= last - first + 1
+        self.top = max(0, min(self.top, len(self.items) - self.rows))
+        self.schedule_refresh()
+
+    def get(self, index):
+        """ Returns the row text of an item. """
+        return self.display(self.items[self.index(index)])
+
+    def item(self, index):
+        """ Returns an item itself rather than its row text. """
+        return self.items[self.index(index)]
+
+    def size(self):
+        """ Returns the number of items. """
+        return len(self.items)
+
+    def index(self, index):
+        """ Converts a Listbox style index into a position in the item list. """
+        # curselection returns a tuple, like tk.Listbox the first index is used
+        if isinstance(index, tuple):
+            index = index[0]
+        if index == "end":
+            return len(self.items) - 1
+        return int(index)
+
+    def curselection(self):
+        """ Returns the selected index as a tuple, like tk.Listbox. """
+        return () if self.selected is None else (self.selected,)
+
+    def selection_set(self, first, last=None):
+        """ Selects an index, only one item can be selected. """
+        if self.items:
+            self.selected = max(0, min(self.index(first), len(self.items) - 1))
+            self.schedule_refresh()
+
+    def selection_clear(self, first=0, last=None):
+        """ Clears the selection if it lies between first and last. """
+        if self.selected is None:
+            return
+        first = self.index(first)
+        last = first if last is None else self.index(last)
+        if first <= self.selected <= last:
+            self.selected = None
+            self.schedule_refresh()
+
+    def see(self, index):
+        """ Scrolls so that an index is visible. """
+        index = self.index(index)
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.rows:
+            self.top = index - self.rows + 1
+        self.schedule_refresh()
+
+    def yview(self, *args):
+        """ Scrolls the visible rows, called by the scrollbar and the mouse wheel. """
+        last_top = max(0, len(self.items) - self.rows)
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.items))
+        elif args[0] == "scroll":
+            step = self.rows if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.top = max(0, min(self.top, last_top))
+        self.refresh()
+        return "break"
+
+    def on_select(self, event):
+        """ Selects the item under a clicked row. """
+        visible_selection = self.listbox.curselection()
+        if visible_selection:
+            self.selected = self.top + visible_selection[0]
+            self.event_generate("<<ListboxSelect>>")
+
+    def move_selection(self, step):
+        """ Moves the selection with the arrow keys. """
+        if self.items:
+            selected = 0 if self.selected is None else self.selected + step
+            self.selection_set(selected)
+            self.see(self.selected)
+        return "break"
+
+    def schedule_refresh(self):
+        """ Refreshes the visible rows once the current batch of changes is done. """
+        if not self.refresh_pending:
+            self.refresh_pending = True
+            self.after_idle(self.refresh)
+
+    def refresh(self):
+        """ Fills the listbox with the visible rows only. """
+        self.refresh_pending = False
+        visible = self.items[self.top:self.top + self.rows]
+
+        self.listbox.delete(0, "end")
+        if visible:
+            self.listbox.insert(0, *(self.display(item) for item in visible))
+
+        # Highlight the selected row if it is visible
+        if self.selected is not None and self.top <= self.selected < self.top + len(visible):
+            self.listbox.selection_set(self.selected - self.top)
+
+        # Update the scrollbar
+        if self.items:
+            self.scrollbar.set(self.top / len(self.items), (self.top + len(visible)) / len(self.items))
+        else:
+            self.scrollbar.set(0, 1)
+
+        # Ask for more items when the visible rows are within a page of the end
+        if self.near_end is not None and self.top + 2 * self.rows >= len(self.items):
+            self.near_end()
@@ -0,0 +1,72 @@
+from os import path
+import pytest
+from tkinter import Tk
+from virtual_listbox import VirtualListbox
+
+def make_listbox(count):
+    """ Creates a listbox holding count music file paths. """
+    root = Tk()
+    listbox = VirtualListbox(root, height=15)
+    listbox.set_items([f"/music/album/{i:06d}.mp3" for i in range(count)], display=path.basename)
+    return listbox
+
+def test_only_visible_rows_are_materialized():
+    """ Test that a large list only puts the visible rows into Tk. """
+    listbox = make_listbox(100_000)
+
+    assert listbox.size() == 100_000
+    assert listbox.listbox.size() == 15
+    assert listbox.get(99_999) == "099999.mp3"
+
+def test_scrolling_moves_the_window():
+    """ Test that scrolling changes which rows are materialized. """
+    listbox = make_listbox(100_000)
+    listbox.yview("moveto", 0.5)
+
+    assert listbox.listbox.get(0) == "050000.mp3"
+
+def test_selection_is_an_index_into_the_items():
+    """ Test that the selection survives scrolling and follows deletes. """
+    listbox = make_listbox(1000)
+    listbox.selection_set(500)
+    listbox.see(500)
+    listbox.yview("moveto", 0)
+    listbox.delete(0)
+
+    assert listbox.curselection() == (499,)
+    assert listbox.get(listbox.curselection()) == "000500.mp3"
+
+def test_set_items_shows_the_list_given():
+    """ Test that a list is shown without a copy, so edits through the listbox reach its owner. """
+    items = [f"/music/album/{i:03d}.mp3" for i in range(10)]
+    listbox = make_listbox(3)
+    listbox.set_items(items, display=path.basename)
+    listbox.insert("end", "/music/album/new.mp3")
+
+    assert listbox.items is items
+    assert items[-1] == "/music/album/new.mp3"
+
+def test_listbox_style_indices():
+    """ Test the "end" index used by the music player. """
+    listbox = make_listbox(3)
+    listbox.insert("end", "/music/album/new.mp3")
+    listbox.selection_set("end")
+
+    assert listbox.curselection() == (3,)
+    listbox.delete(0, "end")
+    assert listbox.size() == 0
+    assert listbox.curselection() == ()
+
+def test_near_end_asks_for_more_items():
+    """ Test that scrolling close to the end of the items calls near_end, and scrolling at the top does not. """
+    listbox = make_listbox(1000)
+    calls = []
+    listbox.near_end = lambda: calls.append(listbox.top)
+    listbox.yview("moveto", 0)
+    assert calls == []
+
+    listbox.yview("moveto", 0.98)
+    assert calls == [980]
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])
@@ -0,0 +1,165 @@
+""" waveform.py
+
+Design:
+class Waveform:
+    duration of the music and the smallest and largest sample of each bucket
+
+def envelope
+    mix channels down to mono
+    split samples into equal buckets
+    return the smallest and largest sample of each bucket as signed bytes
+
+def compute_waveform
+    decode music file
+    return its duration and envelope
+
+class WaveformCache:
+    def __init__
+        initialize disk folder, recent waveforms and analysis process
+
+    def cached
+        return the waveform of a music file if it is in memory
+
+    def load
+        return waveform from memory or disk if the music file is unchanged
+        otherwise compute it in the analysis process and write it to disk
+
+    def close
+        stop analysis process
+
+An overview of the playing music, drawn as a strip the user can click to seek.
+The waveform is the min/max envelope of the samples in a fixed number of
+buckets, one per pixel of the strip, computed with NumPy from the decoded
+music. Decoding takes a moment, so waveforms are computed lazily when music
+starts, in a spawned process that leaves the player's mixer and event loop
+alone. Each waveform is written to a small file named by the music file's path
+and mtime, so a music file that was played before shows its waveform straight
+from disk without decoding, and an edited file gets a new waveform.
+"""
+
+from array import array
+from collections import OrderedDict, namedtuple
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from hashlib import sha1
+from multiprocessing import get_context
+from os import path, makedirs, replace, stat
+from struct import calcsize, pack, unpack_from
+from threading import Lock
+
+from loudness import ANALYSIS_RATE, decode_file, init_worker
+
+WAVEFORM_WIDTH = 300
+MEMORY_ENTRIES = 64
+DEFAULT_WAVEFORM_DIR = path.join(path.dirname(path.abspath(__file__)), "waveforms")
+
+# A waveform file starts with the duration of the music, then the envelope as signed bytes
+HEADER = "<d"
+
+Waveform = namedtuple("Waveform", "duration peaks")
+
+def envelope(samples, width=WAVEFORM_WIDTH):
+    """ Returns the smallest and largest sample of each of width buckets, interleaved as signed bytes. """
+    import numpy as np
+    if not len(samples):
+        return array("b")
+
+    # Mix down to mono and pad with the last sample so the buckets are equal
+    mono = samples.mean(axis=1)
+    bucket = -(-len(mono) // width)
+    buckets = np.pad(mono, (0, bucket * width - len(mono)), mode="edge").reshape(width, bucket)
+
+    peaks = np.empty(2 * width, np.int8)
+    peaks[0::2] = np.round(np.clip(buckets.min(axis=1), -1, 1) * 127)
+    peaks[1::2] = np.round(np.clip(buckets.max(axis=1), -1, 1) * 127)
+    return array("b", peaks.tobytes())
+
+def compute_waveform(music_path, width=WAVEFORM_WIDTH):
+    """ Decodes a music file and returns its waveform, or None if it cannot be decoded. """
+    samples = decode_file(music_path)
+    if samples is None:
+        return None
+    return Waveform(len(samples) / ANALYSIS_RATE, envelope(samples, width))
+
+class WaveformCache:
+    """ Computes waveforms in a separate process and keeps them on disk by path and mtime. """
+    def __init__(self, disk_dir, width=WAVEFORM_WIDTH):
+        self.disk_dir = disk_dir
+        self.width = width
+        self.entries = OrderedDict()
+        self.executor = None
+        self.computing = None
+        self.lock = Lock()
+
+    def disk_path(self, music_path, mtime):
+        """ Returns the file the waveform of a version of a music file is kept in. """
+        return path.join(self.disk_dir, sha1(f"{music_path}\0{mtime}\0{self.width}".encode()).hexdigest() + ".wave")
+
+    def cached(self, music_path):
+        """ Returns the waveform of a music file if it is in memory and the file is unchanged, otherwise None. """
+        try:
+            mtime = stat(music_path).st_mtime
+        except OSError:
+            return None
+        with self.lock:
+            waveform = self.entries.get((music_path, mtime))
+            if waveform is not None:
+                self.entries.move_to_end((music_path, mtime))
+            return waveform
+
+    def remember(self, key, waveform):
+        """ Keeps a waveform in memory, forgetting the least recently used ones. """
+        with self.lock:
+            self.entries[key] = waveform
+            while len(self.entries) > MEMORY_ENTRIES:
+                self.entries.popitem(last=False)
+
+    def load(self, music_path):
+        """ Returns the waveform of a music file, computing it if it was never computed for this version of the file. """
+        mtime = stat(music_path).st_mtime
+        waveform = self.cached(music_path)
+        if waveform is not None:
+            return waveform
+
+        # A music file played before is read from disk without decoding
+        disk_path = self.disk_path(music_path, mtime)
+        try:
+            with open(disk_path, "rb") as waveform_file:
+                data = waveform_file.read()
+        except OSError:
+            pass
+        else:
+            waveform = Waveform(unpack_from(HEADER, data)[0], array("b", data[calcsize(HEADER):]))
+            self.remember((music_path, mtime), waveform)
+            return waveform
+
+        # Otherwise decode it in the analysis process, a newer request replaces one that has not started
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(1, mp_context=get_context("spawn"), initializer=init_worker)
+            if self.computing is not None:
+                self.computing.cancel()
+            future = self.computing = self.executor.submit(compute_waveform, music_path, self.width)
+        try:
+            waveform = future.result()
+        except CancelledError:
+            return None
+        if waveform is None:
+            return None
+
+        # Write the waveform to a temporary file first, so a reader never sees half of it
+        try:
+            makedirs(self.disk_dir, exist_ok=True)
+            with open(disk_path + ".tmp", "wb") as waveform_file:
+                waveform_file.write(pack(HEADER, waveform.duration) + waveform.peaks.tobytes())
+            replace(disk_path + ".tmp", disk_path)
+        except OSError:
+            pass
+        self.remember((music_path, mtime), waveform)
+        return waveform
+
+    def close(self):
+        """ Stops the analysis process. """
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
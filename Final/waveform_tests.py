@@ -0,0 +1,46 @@
+from os import path, listdir, utime
+from shutil import copyfile
+import pytest
+from waveform import WaveformCache, envelope
+
+np = pytest.importorskip("numpy")
+
+SAMPLE_MUSIC = path.join(path.dirname(__file__), "Music", "filk_firestorm", "03 Walk Through The Night-Side.mp3")
+
+def test_envelope_keeps_the_extremes_of_each_bucket():
+    """ Test that each bucket holds the smallest and largest sample of its part of the music. """
+    samples = np.zeros((1000, 2), np.float32)
+    samples[100] = 1
+    samples[950] = -0.5
+    peaks = envelope(samples, width=10)
+
+    assert len(peaks) == 20
+    assert (peaks[2], peaks[3]) == (0, 127)
+    assert (peaks[18], peaks[19]) == (-64, 0)
+    assert list(peaks[4:18]) == [0] * 14
+
+def test_waveform_is_read_from_disk_after_it_is_computed(tmp_path):
+    """ Test that a waveform is computed once, read back from disk by another cache, and computed again if the file changes. """
+    music_path = str(tmp_path / "01.mp3")
+    copyfile(SAMPLE_MUSIC, music_path)
+    cache = WaveformCache(str(tmp_path / "waveforms"), width=100)
+    waveform = cache.load(music_path)
+    cache.close()
+
+    assert waveform.duration == pytest.approx(113.2, abs=1)
+    assert len(waveform.peaks) == 200
+    assert cache.cached(music_path) == waveform
+
+    restarted = WaveformCache(str(tmp_path / "waveforms"), width=100)
+    assert restarted.cached(music_path) is None
+    assert restarted.load(music_path) == waveform
+    assert restarted.executor is None
+
+    utime(music_path, (1_000_000_000, 1_000_000_000))
+    assert restarted.cached(music_path) is None
+    restarted.load(music_path)
+    restarted.close()
+    assert len(listdir(str(tmp_path / "waveforms"))) == 2
+
+if __name__ == "__main__":
+    pytest.main(["-v", __file__])